@@ -0,0 +1,200 @@
+"""
+Benchmark and performance-regression check on the office-like instances.
+
+    # measure a stratified sample and store it as the baseline
+    python benchmark.py run --output baseline.csv
+    # measure again (e.g., before a release) and compare with the baseline
+    python benchmark.py run --output current.csv
+    python benchmark.py compare baseline.csv current.csv --tolerance 0.2
+
+The sample takes the same number of instances from every size class, with and
+without holes, so that small and large instances are equally represented. Every
+row contains the total runtime and all phase timings exposed by the `get_stats()`
+methods, in the format of `runtime_distribution.csv` (plus further phases).
+`compare` sums every metric per backend over the instances contained in both
+files and fails if any of them got slower than the tolerance allows.
+"""
+
+import argparse
+import csv
+import logging
+import random
+import sys
+import typing
+from collections import defaultdict
+from pathlib import Path
+
+from dispersive_agp_solver._utils import Timer
+from dispersive_agp_solver.backends import create_optimizer
+from dispersive_agp_solver.batch import find_instances, instance_name
+from dispersive_agp_solver.instance import get_instance_from_graphml_xz
+
+INSTANCE_COLLECTION = (
+    Path(__file__).parent.parent / "office_like_instances" / "instance_collection"
+)
+KEY_FIELDS = ("instance", "size", "backend")
+_logger = logging.getLogger("benchmark")
+
+
+def stratified_sample(
+    root: Path, per_stratum: int, seed: int = 0
+) -> typing.List[Path]:
+    """
+    `per_stratum` instances of every directory (e.g., with_holes/size_120).
+    """
+    strata = defaultdict(list)
+    for path in find_instances(root):
+        strata[path.parent].append(path)
+    rng = random.Random(seed)
+    sample = []
+    for directory in sorted(strata):
+        paths = strata[directory]
+        sample += sorted(rng.sample(paths, min(per_stratum, len(paths))))
+    return sample
+
+
+def _sat_probe_metrics(stats: dict) -> typing.Dict[str, float]:
+    """
+    The probe statistics of the SAT backend, summed over all witness sets.
+    """
+    metrics = defaultdict(float)
+    for iteration in stats.get("iteration_statistics", []):
+        metrics["total_model_build_time"] += iteration["solver"]["total_build_time"]
+        for probe in iteration["solver"]["solver"]["solve_statistics"]:
+            metrics["number_sat_probes"] += 1
+            if probe["status"]:
+                metrics["number_sat_solves"] += 1
+                metrics["time_sat_solves"] += probe["time"]
+            elif probe["status"] is not None:
+                metrics["number_unsat_solves"] += 1
+                metrics["time_unsat_solves"] += probe["time"]
+    return dict(metrics)
+
+
+def measure(
+    path: Path, backend: str, time_limit: float, **params
+) -> typing.Dict[str, typing.Any]:
+    stop_watch = Timer()
+    instance = get_instance_from_graphml_xz(path)
+    optimizer = create_optimizer(instance, backend=backend, **params)
+    optimizer.solve(time_limit)
+    row = {
+        "instance": instance_name(path),
+        "size": instance.num_positions(),
+        "backend": backend,
+        "runtime": stop_watch.time(),
+    }
+    stats = optimizer.get_stats()
+    row.update(
+        {
+            key: value
+            for key, value in stats.items()
+            if key.startswith("time_") and isinstance(value, (int, float))
+        }
+    )
+    row.update(_sat_probe_metrics(stats))
+    if "time_compute_vispolys" in row and "time_compute_shadow_witnesses" in row:
+        row["time_compute_witnesses"] = (
+            row["time_compute_vispolys"] + row["time_compute_shadow_witnesses"]
+        )
+    return row
+
+
+def run(args: argparse.Namespace) -> int:
+    sample = stratified_sample(Path(args.instances), args.per_stratum, args.seed)
+    _logger.info("Benchmarking %d instances.", len(sample))
+    rows = []
+    for path in sample:
+        for backend in args.backends or ["SAT[Glucose4]"]:
+            # keep the fastest repetition to reduce noise
+            measurements = [
+                measure(path, backend, args.time_limit)
+                for _ in range(args.repetitions)
+            ]
+            rows.append(min(measurements, key=lambda row: row["runtime"]))
+            _logger.info(
+                "%s (%s): %.3fs", rows[-1]["instance"], backend, rows[-1]["runtime"]
+            )
+    fields = list(KEY_FIELDS) + ["runtime"]
+    fields += sorted({key for row in rows for key in row} - set(fields))
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return 0
+
+
+def _read(path: str) -> typing.Dict[typing.Tuple[str, ...], typing.Dict[str, float]]:
+    with open(path, newline="") as f:
+        return {
+            tuple(row[key] for key in KEY_FIELDS): {
+                key: float(value)
+                for key, value in row.items()
+                if key not in KEY_FIELDS and value not in ("", None)
+            }
+            for row in csv.DictReader(f)
+        }
+
+
+def compare(args: argparse.Namespace) -> int:
+    baseline, current = _read(args.baseline), _read(args.current)
+    common = sorted(baseline.keys() & current.keys())
+    if not common:
+        _logger.error("The files have no instances in common.")
+        return 2
+    totals = defaultdict(lambda: [0.0, 0.0])  # (backend, metric) -> [old, new]
+    for key in common:
+        for metric, value in baseline[key].items():
+            if metric.startswith("number_") or metric not in current[key]:
+                continue  # counts are no timings
+            totals[(key[2], metric)][0] += value
+            totals[(key[2], metric)][1] += current[key][metric]
+    regressions = 0
+    for (backend, metric), (old, new) in sorted(totals.items()):
+        slower = new > old * (1 + args.tolerance) and new - old > args.min_difference
+        regressions += slower
+        print(  # noqa: T201
+            f"{'SLOWER' if slower else 'ok':7} {backend:20} {metric:40} "
+            f"{old:10.3f}s -> {new:10.3f}s"
+        )
+    print(  # noqa: T201
+        f"{regressions} regressions on {len(common)} instances "
+        f"(tolerance {args.tolerance:.0%})."
+    )
+    return 1 if regressions else 0
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="measure a stratified sample")
+    run_parser.add_argument("--output", required=True)
+    run_parser.add_argument("--instances", default=str(INSTANCE_COLLECTION))
+    run_parser.add_argument("--backend", action="append", dest="backends")
+    run_parser.add_argument("--per-stratum", type=int, default=2)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repetitions", type=int, default=1)
+    run_parser.add_argument("--time-limit", type=float, default=900.0)
+    run_parser.set_defaults(func=run)
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed relative slowdown"
+    )
+    compare_parser.add_argument(
+        "--min-difference",
+        type=float,
+        default=0.05,
+        help="slowdowns below this many seconds are ignored as noise",
+    )
+    compare_parser.set_defaults(func=compare)
+    args = parser.parse_args(argv)
+    # the solvers themselves log too much for a benchmark
+    logging.basicConfig(level=logging.WARNING)
+    _logger.setLevel(logging.INFO)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,9 +11,22 @@ Note that the restriction to vertex guards makes this problem much
 more tractable than general point guards.
 """
 
-from .backends import OptimizerParams, SearchStrategy, solve
+from ._utils.tracing import Tracer
+from .backends import (
+    OptimizerParams,
+    PreparedInstance,
+    PreprocessingCache,
+    Progress,
+    SearchStrategy,
+    solve,
+    solve_async,
+    solve_iter,
+)
+from .batch import solve_batch
 from .instance import Instance, get_instance_from_graphml_xz, get_instance
 from .plotting import plot_solution, plot_polygon
+from .service import SolverService
+from .verification import VerificationResult, verify
 
 __all__ = [
     "Instance",
@@ -22,6 +35,16 @@ __all__ = [
     "plot_solution",
     "plot_polygon",
     "solve",
+    "solve_iter",
+    "solve_async",
+    "solve_batch",
+    "SolverService",
+    "PreparedInstance",
+    "Progress",
     "OptimizerParams",
+    "PreprocessingCache",
     "SearchStrategy",
+    "Tracer",
+    "verify",
+    "VerificationResult",
 ]
@@ -1,3 +1,5 @@
+from .parallel import effective_n_jobs, split_range
 from .timer import Timer
+from .tracing import Tracer, span
 
-__all__ = ["Timer"]
+__all__ = ["Timer", "Tracer", "effective_n_jobs", "span", "split_range"]
@@ -0,0 +1,112 @@
+"""
+Memory usage of the current process, for the statistics.
+
+The peak memory of a phase is measured on Linux by resetting the high-water
+mark of the resident set size (`/proc/self/clear_refs`) when the phase starts
+and reading it (`VmHWM`) when it ends. As the mark belongs to the whole
+process, every reset first passes the current mark to all running
+measurements (of nested or concurrent phases) and to the peak of the process.
+"""
+
+import os
+import sys
+import threading
+import typing
+import weakref
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore[assignment]
+
+_lock = threading.Lock()
+_active_measurements: "weakref.WeakSet[PeakRss]" = weakref.WeakSet()
+# the high-water mark of the process before the last reset (in MiB)
+_peak_before_reset_mb = 0.0
+
+
+def peak_rss_mb() -> typing.Optional[float]:
+    """
+    The maximum resident set size of the process so far in MiB, or None if it
+    cannot be determined on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB everywhere else
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    with _lock:
+        # the resets of `PeakRss` also reset ru_maxrss
+        return max(peak_mb, _peak_before_reset_mb)
+
+
+def current_rss_mb() -> typing.Optional[float]:
+    """
+    The current resident set size of the process in MiB (Linux only).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _high_water_mark_mb() -> typing.Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except (OSError, IndexError, ValueError):
+        return None
+    return None
+
+
+def _reset_high_water_mark() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class PeakRss:
+    """
+    Measures the peak resident set size from its creation until `peak_mb` is
+    called, like a `Timer` for the memory (Linux only).
+    """
+
+    def __init__(self) -> None:
+        global _peak_before_reset_mb  # noqa: PLW0603
+        self._peak_mb: typing.Optional[float] = None
+        with _lock:
+            mark = _high_water_mark_mb()
+            if mark is None:
+                return
+            _peak_before_reset_mb = max(_peak_before_reset_mb, mark)
+            for measurement in _active_measurements:
+                measurement._update(mark)
+            if not _reset_high_water_mark():
+                return
+            self._peak_mb = _high_water_mark_mb()
+            if self._peak_mb is not None:
+                _active_measurements.add(self)
+
+    def _update(self, mark: float) -> None:
+        if self._peak_mb is not None:
+            self._peak_mb = max(self._peak_mb, mark)
+
+    def peak_mb(self) -> typing.Optional[float]:
+        """
+        The peak resident set size in MiB since the creation, or None if it
+        cannot be determined on this platform. Ends the measurement.
+        """
+        with _lock:
+            if self in _active_measurements:
+                mark = _high_water_mark_mb()
+                if mark is not None:
+                    self._update(mark)
+                _active_measurements.discard(self)
+            return self._peak_mb
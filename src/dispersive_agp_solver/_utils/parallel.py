@@ -0,0 +1,36 @@
+"""
+Small helpers for distributing work over a pool of worker processes.
+"""
+
+import os
+import typing
+
+
+def effective_n_jobs(n_jobs: typing.Optional[int]) -> int:
+    """
+    Resolve the number of worker processes. `None` or 1 means serial execution,
+    non-positive values are counted back from the number of available cores
+    (-1 uses all cores, -2 all but one, ...).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs > 0:
+        return n_jobs
+    return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+
+
+def split_range(n: int, num_shards: int) -> typing.List[range]:
+    """
+    Split `range(n)` into at most `num_shards` contiguous, non-empty ranges of
+    nearly equal size.
+    """
+    num_shards = max(1, min(num_shards, n))
+    size, rest = divmod(n, num_shards)
+    shards = []
+    start = 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < rest else 0)
+        if end > start:
+            shards.append(range(start, end))
+        start = end
+    return shards
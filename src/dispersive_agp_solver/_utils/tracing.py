@@ -0,0 +1,181 @@
+"""
+Nested timing spans for the phases of a solve, exportable in the Chrome
+trace-event format (open in chrome://tracing or https://ui.perfetto.dev).
+
+The code is instrumented with `span("name", key=value)` blocks. They only record
+something while a `Tracer` is active, e.g.,
+
+    with Tracer() as tracer:
+        solve(instance)
+    tracer.export_chrome_trace("trace.json")
+"""
+
+import json
+import os
+import threading
+import time
+import typing
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+_current_tracer: "ContextVar[typing.Optional[Tracer]]" = ContextVar(
+    "current_tracer", default=None
+)
+_current_span: "ContextVar[typing.Optional[Span]]" = ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """
+    A finished or running phase. Further arguments can be attached via `set`.
+    """
+
+    __slots__ = ("name", "args", "track", "parent", "start", "end", "cpu_time")
+
+    def __init__(
+        self,
+        name: str,
+        args: typing.Dict[str, typing.Any],
+        track: typing.Union[int, str],
+        parent: typing.Optional["Span"] = None,
+        start: float = 0.0,
+    ) -> None:
+        self.name = name
+        self.args = args
+        self.track = track
+        self.parent = parent
+        self.start = start
+        self.end: typing.Optional[float] = None
+        self.cpu_time: typing.Optional[float] = None
+
+    def set(self, **args: typing.Any) -> None:
+        self.args.update(args)
+
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class _NullSpan:
+    """
+    Used if no tracer is active, such that the instrumented code does not have
+    to check for it.
+    """
+
+    def set(self, **args: typing.Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects the spans of everything that runs within its context.
+    """
+
+    def __init__(self) -> None:
+        self.spans: typing.List[Span] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._tokens: typing.List[typing.Any] = []
+
+    def __enter__(self) -> "Tracer":
+        self._tokens.append(_current_tracer.set(self))
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        _current_tracer.reset(self._tokens.pop())
+
+    def _add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def record(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        track: typing.Union[int, str],
+        **args: typing.Any,
+    ) -> None:
+        """
+        Add a span that was measured elsewhere (e.g., in a worker process), with
+        `time.perf_counter()` timestamps. Spans of the same track are shown in
+        the same row.
+        """
+        span = Span(name, args, track, _current_span.get(), start)
+        span.end = end
+        self._add(span)
+
+    def summary(self) -> typing.Dict[str, float]:
+        """
+        The total wall time per span name.
+        """
+        totals: typing.Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration()
+        return totals
+
+    def to_chrome_trace(self) -> typing.Dict[str, typing.Any]:
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            args = dict(span.args)
+            if span.cpu_time is not None:
+                args["cpu_ms"] = span.cpu_time * 1e3
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": (span.start - self._origin) * 1e6,
+                    "dur": span.duration() * 1e6,
+                    "pid": pid,
+                    "tid": span.track,
+                    "args": {k: _to_json(v) for k, v in args.items()},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: typing.Union[str, Path]) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+def _to_json(value: typing.Any) -> typing.Any:
+    if isinstance(value, (bool, int, str)) or value is None:
+        return value
+    if isinstance(value, float):
+        # JSON has no infinity
+        return value if value == value and abs(value) != float("inf") else str(value)
+    return str(value)
+
+
+def current_tracer() -> typing.Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextmanager
+def span(name: str, **args: typing.Any) -> typing.Iterator[typing.Union[Span, _NullSpan]]:
+    """
+    Measure the enclosed block as a span (nested in the currently open span)
+    if a tracer is active.
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NULL_SPAN
+        return
+    current = Span(
+        name, args, threading.get_ident(), _current_span.get(), time.perf_counter()
+    )
+    token = _current_span.set(current)
+    # the CPU time of this thread, as other solves may run concurrently
+    cpu_start = time.thread_time()
+    try:
+        yield current
+    finally:
+        current.cpu_time = time.thread_time() - cpu_start
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        tracer._add(current)
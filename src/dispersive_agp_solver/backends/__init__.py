@@ -1,38 +1,297 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import typing
+
+from dispersive_agp_solver._utils import Timer
+
+from ._common import PreprocessingCache, Progress
 from .cp import CpSatOptimizer
 from .mip import GurobiOptimizer
-from .sat import OptimizerParams, SatBasedOptimizer, SearchStrategy
+from .sat import (
+    OptimizerParams,
+    PreparedInstance,
+    SatBasedOptimizer,
+    SearchStrategy,
+)
 
 
-def solve(
+def create_optimizer(
     instance,
     backend: str = "SAT[Glucose4]",
-    time_limit=900.0,
-    opt_tol=0.0001,
     logger=None,
+    n_jobs=1,
+    witness_fan_out_depth=None,
+    cache=None,
+    distance_engine="visibility",
+    low_memory=False,
+    kernelize=True,
+    warm_start=True,
+    preprocessing=None,
     **params,
 ):
-    if backend == "SAT":
-        solver = SatBasedOptimizer(
-            instance, logger=logger, params=OptimizerParams(**params)
-        )
-        solver.solve(time_limit, opt_tol)
-        return solver.solution, solver.objective
-    elif backend.startswith("SAT["):
-        solver = SatBasedOptimizer(
-            instance, logger=logger, params=OptimizerParams(**params), solver=backend[4:-1]
+    """
+    Create the optimizer for the given backend, see `solve` for the arguments.
+    All optimizers provide `solve(time_limit, opt_tol)` returning a status,
+    `solution`, `objective`, `upper_bound`, `get_stats()`, and `interrupt()`,
+    which stops a running `solve` from another thread as on a timeout.
+    A `Preprocessing` of the instance can be reused via `preprocessing`.
+    """
+    if backend == "SAT" or backend.startswith("SAT["):
+        return SatBasedOptimizer(
+            instance,
+            logger=logger,
+            params=OptimizerParams(**params),
+            solver=backend[4:-1] if backend != "SAT" else "Glucose4",
+            n_jobs=n_jobs,
+            witness_fan_out_depth=witness_fan_out_depth,
+            cache=cache,
+            distance_engine=distance_engine,
+            low_memory=low_memory,
+            kernelize=kernelize,
+            warm_start=warm_start,
+            preprocessing=preprocessing,
         )
-        solver.solve(time_limit, opt_tol)
-        return solver.solution, solver.objective
     elif backend == "CP-SAT":
-        solver = CpSatOptimizer(instance, logger=logger)
-        solver.solve(time_limit, opt_tol)
-        return solver.solution, solver.objective
+        return CpSatOptimizer(
+            instance,
+            logger=logger,
+            n_jobs=n_jobs,
+            witness_fan_out_depth=witness_fan_out_depth,
+            cache=cache,
+            distance_engine=distance_engine,
+            low_memory=low_memory,
+            kernelize=kernelize,
+            warm_start=warm_start,
+            preprocessing=preprocessing,
+        )
     elif backend == "MIP":
-        solver = GurobiOptimizer(instance, logger=logger)
-        solver.solve(time_limit, opt_tol)
-        return solver.solution, solver.objective
+        return GurobiOptimizer(
+            instance,
+            logger=logger,
+            n_jobs=n_jobs,
+            witness_fan_out_depth=witness_fan_out_depth,
+            cache=cache,
+            distance_engine=distance_engine,
+            low_memory=low_memory,
+            kernelize=kernelize,
+            warm_start=warm_start,
+            preprocessing=preprocessing,
+        )
     msg = f"Invalid backend: {backend}"
     raise NotImplementedError(msg)
 
 
-__all__ = ["SatBasedOptimizer", "OptimizerParams", "solve", "SearchStrategy"]
+def solve(
+    instance,
+    backend: str = "SAT[Glucose4]",
+    time_limit=900.0,
+    opt_tol=0.0001,
+    logger=None,
+    n_jobs=1,
+    witness_fan_out_depth=None,
+    cache=None,
+    distance_engine="visibility",
+    low_memory=False,
+    kernelize=True,
+    warm_start=True,
+    progress_callback=None,
+    **params,
+):
+    """
+    Solve the instance with the given backend. `n_jobs` is the number of
+    processes used for the preprocessing (1 is serial, -1 uses all cores).
+    With `n_jobs` > 1, the shadow witnesses are computed on 2^`witness_fan_out_depth`
+    slabs (by default, two per process).
+    A `PreprocessingCache` allows to reuse the preprocessing of previous solves
+    of the same instance. The `distance_engine` "rectilinear" computes the
+    geodesic L1 distances without the quadratic number of visibility tests.
+    With `low_memory`, the geometry of the preprocessing is freed as soon as
+    the distances and witnesses are extracted.
+    With `kernelize`, subsumed witnesses and the guard pairs implied by forced
+    guards are removed from the model.
+    With `warm_start`, all backends start from a greedy solution, which is also
+    returned if the time limit is too short to find a better one.
+    The backend "SAT[portfolio]" races several PySAT solvers in parallel on
+    every probe (configurable via `portfolio_solvers`).
+    The `progress_callback` gets a `Progress` for every improved solution or
+    upper bound. If it returns True, the solve stops as on a timeout.
+    """
+    solver = create_optimizer(
+        instance,
+        backend=backend,
+        logger=logger,
+        n_jobs=n_jobs,
+        witness_fan_out_depth=witness_fan_out_depth,
+        cache=cache,
+        distance_engine=distance_engine,
+        low_memory=low_memory,
+        kernelize=kernelize,
+        warm_start=warm_start,
+        **params,
+    )
+    solver.solve(time_limit, opt_tol, progress_callback=progress_callback)
+    return solver.solution, solver.objective
+
+
+_DONE = object()
+
+
+# how long leaving `solve_iter` waits for the interrupted search (in seconds)
+_STOP_TIMEOUT = 1.0
+
+
+def solve_iter(
+    instance,
+    backend: str = "SAT[Glucose4]",
+    time_limit=900.0,
+    opt_tol=0.0001,
+    **kwargs,
+):
+    """
+    Like `solve` (with the same further arguments), but yields a `Progress`
+    for every improved solution or upper bound while the search runs. The last
+    one is the result of the solve and has `final` set.
+    The solve runs in a background thread. Leaving the loop early interrupts
+    the running search (see `create_optimizer`) and waits shortly for it.
+    """
+    updates: "queue.Queue[object]" = queue.Queue()
+    stopped = threading.Event()
+    # the optimizer of the thread, once created
+    optimizers: typing.List[typing.Any] = []
+
+    def report(progress: Progress) -> bool:
+        updates.put(progress)
+        return stopped.is_set()
+
+    def run() -> None:
+        try:
+            solver = create_optimizer(instance, backend=backend, **kwargs)
+            optimizers.append(solver)
+            # the loop may have been left during the preprocessing
+            if stopped.is_set():
+                solver.interrupt()
+            timer = Timer()
+            solver.solve(time_limit, opt_tol, progress_callback=report)
+            updates.put(
+                Progress(
+                    solver.solution if solver.solution is not None else [],
+                    solver.objective,
+                    solver.upper_bound,
+                    timer.time(),
+                    final=True,
+                )
+            )
+        except BaseException as e:  # noqa: BLE001
+            updates.put(e)
+        finally:
+            updates.put(_DONE)
+
+    # keep the active tracer (and other context variables) in the thread
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(run,), daemon=True)
+    thread.start()
+    try:
+        while True:
+            update = updates.get()
+            if update is _DONE:
+                return
+            if isinstance(update, BaseException):
+                raise update
+            yield update
+    finally:
+        stopped.set()
+        for solver in optimizers:
+            solver.interrupt()
+        thread.join(_STOP_TIMEOUT)
+
+
+# how often a cancelled `solve_async` repeats the interrupt (in seconds)
+_INTERRUPT_INTERVAL = 1.0
+
+
+async def solve_async(
+    instance,
+    backend: str = "SAT[Glucose4]",
+    time_limit=900.0,
+    opt_tol=0.0001,
+    progress_callback=None,
+    **kwargs,
+):
+    """
+    Like `solve` (with the same further arguments), but awaitable. The
+    preprocessing and the search run in a thread of their own, so one event
+    loop can await many solves at the same time. The `progress_callback` is
+    called from this thread.
+    Cancelling the awaiting task interrupts the running SAT, CP-SAT, or Gurobi
+    call and waits until the thread has stopped before the cancellation is
+    propagated. The preprocessing cannot be interrupted, but the search is not
+    started after it. Solvers that cannot be interrupted (CaDiCaL, Lingeling)
+    finish their current probe first.
+    """
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+    lock = threading.Lock()
+    optimizer = []  # once it is created
+    stopped = threading.Event()
+
+    def interrupt() -> None:
+        with lock:
+            stopped.set()
+            if optimizer:
+                optimizer[0].interrupt()
+
+    def resolve(value: typing.Any, error: typing.Optional[BaseException]) -> None:
+        if result.done():
+            return
+        if error is not None:
+            result.set_exception(error)
+        else:
+            result.set_result(value)
+
+    def run() -> None:
+        value, error = None, None
+        try:
+            solver = create_optimizer(instance, backend=backend, **kwargs)
+            with lock:
+                optimizer.append(solver)
+                if stopped.is_set():
+                    solver.interrupt()
+            solver.solve(time_limit, opt_tol, progress_callback=progress_callback)
+            value = (solver.solution, solver.objective)
+        except BaseException as e:  # noqa: BLE001
+            error = e
+        try:
+            loop.call_soon_threadsafe(resolve, value, error)
+        except RuntimeError:
+            pass  # the event loop is closed, nobody awaits the result
+
+    # keep the active tracer (and other context variables) in the thread
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), daemon=True).start()
+    try:
+        return await asyncio.shield(result)
+    except asyncio.CancelledError:
+        # A stop request right before CP-SAT or Gurobi start their search is
+        # lost, so the interrupt is repeated until the thread has stopped.
+        while not result.done():
+            interrupt()
+            await asyncio.wait([result], timeout=_INTERRUPT_INTERVAL)
+        if not result.cancelled():
+            result.exception()  # retrieved, no warning if it failed
+        raise
+
+
+__all__ = [
+    "SatBasedOptimizer",
+    "OptimizerParams",
+    "PreparedInstance",
+    "PreprocessingCache",
+    "create_optimizer",
+    "solve",
+    "solve_iter",
+    "solve_async",
+    "Progress",
+    "SearchStrategy",
+]
@@ -1,5 +1,26 @@
+from .bounds import compute_lower_bound, compute_upper_bound, greedy_solution
 from .guard_coverage import GuardCoverage
 from .guard_distances import GuardDistances
+from .kernelization import Kernel
+from .lazy_coverage import LazyCoverage
+from .local_search import LocalSearch
+from .preprocessing import Preprocessing
+from .preprocessing_cache import PreprocessingCache
+from .progress import Progress, ProgressCallback
 from .witness_strategy import WitnessStrategy
 
-__all__ = ["WitnessStrategy", "GuardCoverage", "GuardDistances"]
+__all__ = [
+    "WitnessStrategy",
+    "GuardCoverage",
+    "GuardDistances",
+    "Kernel",
+    "LazyCoverage",
+    "LocalSearch",
+    "Preprocessing",
+    "PreprocessingCache",
+    "Progress",
+    "ProgressCallback",
+    "compute_lower_bound",
+    "compute_upper_bound",
+    "greedy_solution",
+]
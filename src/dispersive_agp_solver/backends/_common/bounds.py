@@ -0,0 +1,122 @@
+"""
+Cheap bounds on the optimal dispersion distance, to narrow down the range of the
+search before any exact model is solved.
+
+Upper bound: if two witnesses have disjoint guard sets, every solution contains
+two different guards a and b seeing them, so the objective is at most the largest
+distance between any guard of the first and any guard of the second witness.
+
+Lower bound: the dispersion of any feasible solution. We construct one greedily
+for a threshold k by covering the witnesses one by one with guards that keep
+distance >= k to all selected guards, and search for the largest k for which the
+greedy succeeds.
+"""
+
+import math
+import typing
+
+import numpy as np
+
+from .guard_distances import GuardDistances
+
+# Only the witnesses with the fewest guards are paired for the upper bound, as
+# they give the tightest bounds and the pairing is quadratic.
+_MAX_WITNESSES_FOR_UPPER_BOUND = 256
+
+
+def compute_upper_bound(
+    witness_guards: typing.Sequence[typing.Sequence[int]],
+    guard_distances: GuardDistances,
+    max_witnesses: int = _MAX_WITNESSES_FOR_UPPER_BOUND,
+) -> float:
+    """
+    The smallest bound over all pairs of witnesses with disjoint guard sets,
+    or infinity if there are no such pairs (then a single guard may suffice).
+    """
+    witnesses = sorted(
+        (np.unique(np.asarray(guards, dtype=np.int64)) for guards in witness_guards),
+        key=len,
+    )[:max_witnesses]
+    if len(witnesses) < 2:
+        return math.inf
+    matrix = guard_distances.get_distance_matrix()
+    n = len(matrix)
+    # farthest[w, v]: the largest distance of vertex v to any guard of witness w
+    farthest = np.stack([matrix[guards].max(axis=0) for guards in witnesses])
+    membership = np.zeros((len(witnesses), n), dtype=bool)
+    for w, guards in enumerate(witnesses):
+        membership[w, guards] = True
+    best = math.inf
+    for w, guards in enumerate(witnesses):
+        bounds = farthest[:, guards].max(axis=1)
+        # witnesses sharing a guard can be covered by a single guard
+        disjoint = ~membership[:, guards].any(axis=1)
+        if disjoint.any():
+            best = min(best, float(bounds[disjoint].min()))
+    return best
+
+
+def greedy_solution(
+    witness_guards: typing.Sequence[typing.Sequence[int]],
+    guard_distances: GuardDistances,
+    k: float,
+) -> typing.Optional[typing.List[int]]:
+    """
+    Cover all witnesses with guards of pairwise distance >= k, or return None if
+    the greedy fails. Witnesses with few guards are covered first, each with the
+    allowed guard that covers the most further witnesses.
+    """
+    matrix = guard_distances.get_distance_matrix()
+    n = len(matrix)
+    witnesses = [np.asarray(guards, dtype=np.int64) for guards in witness_guards]
+    # witnesses of every guard
+    covers: typing.List[typing.List[int]] = [[] for _ in range(n)]
+    for w, guards in enumerate(witnesses):
+        for g in guards.tolist():
+            covers[g].append(w)
+    num_uncovered_witnesses = np.array([len(c) for c in covers], dtype=np.int64)
+    is_covered = np.zeros(len(witnesses), dtype=bool)
+    is_blocked = np.zeros(n, dtype=bool)
+    solution: typing.List[int] = []
+    for w in sorted(range(len(witnesses)), key=lambda w: len(witnesses[w])):
+        if is_covered[w]:
+            continue
+        guards = witnesses[w]
+        candidates = guards[~is_blocked[guards]]
+        if len(candidates) == 0:
+            return None
+        guard = int(candidates[np.argmax(num_uncovered_witnesses[candidates])])
+        solution.append(guard)
+        is_blocked |= matrix[guard] < k
+        for covered in covers[guard]:
+            if not is_covered[covered]:
+                is_covered[covered] = True
+                num_uncovered_witnesses[witnesses[covered]] -= 1
+    return solution
+
+
+def compute_lower_bound(
+    witness_guards: typing.Sequence[typing.Sequence[int]],
+    guard_distances: GuardDistances,
+    upper_bound: float = math.inf,
+) -> typing.Tuple[float, typing.List[int]]:
+    """
+    The objective and the solution of the best greedy solution, found by a
+    binary search over the distinct distances up to the upper bound.
+    """
+    distances = guard_distances.get_distinct_distances()
+    distances = distances[distances <= upper_bound]
+    best = greedy_solution(witness_guards, guard_distances, 0.0)
+    assert best is not None, "Without distance constraints, greedy always succeeds."
+    lo, hi = 0, len(distances) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        solution = greedy_solution(witness_guards, guard_distances, distances[mid])
+        if solution is None:
+            hi = mid - 1
+            continue
+        best = solution
+        # the greedy solution may be better than the threshold
+        objective = guard_distances.min_distance_of_guards(solution)
+        lo = max(mid + 1, int(np.searchsorted(distances, objective, side="right")))
+    return guard_distances.min_distance_of_guards(best), best
@@ -4,11 +4,181 @@ This file implements geometric computations for making sure that we cover the wh
 
 import logging
 import typing
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 from rvispoly import Point, Polygon, PolygonWithHoles, VisibilityPolygonCalculator
 
-from dispersive_agp_solver.instance import Instance
+from dispersive_agp_solver.instance import Instance, InstanceDiff
+from dispersive_agp_solver._utils.parallel import effective_n_jobs, split_range
+from dispersive_agp_solver._utils.memory import PeakRss
 from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver._utils.tracing import span
+
+from .spatial_index import BoundingBox, VertexGridIndex
+
+# (outer boundary, holes) as plain coordinate lists, such that polygons can be
+# passed between processes.
+PolygonCoordinates = typing.Tuple[
+    typing.List[typing.Tuple[float, float]],
+    typing.List[typing.List[typing.Tuple[float, float]]],
+]
+
+# Shards per worker. More shards than workers balance the load, as the
+# visibility polygons differ a lot in complexity.
+_SHARDS_PER_JOB = 4
+
+
+def polygon_to_coordinates(polygon: PolygonWithHoles) -> PolygonCoordinates:
+    """
+    Convert a polygon into plain (float) coordinates. This is only exact for
+    integral vertices, see `is_integral`.
+    """
+    outer = [(float(p.x()), float(p.y())) for p in polygon.outer_boundary().boundary()]
+    holes = [
+        [(float(p.x()), float(p.y())) for p in hole.boundary()]
+        for hole in polygon.holes()
+    ]
+    return outer, holes
+
+
+def is_integral(coordinates: PolygonCoordinates) -> bool:
+    """
+    Whether all vertices are integral, such that `polygon_from_coordinates`
+    restores the polygon exactly. The visibility polygons of integral instances
+    are not integral in general: a ray from a vertex past a reflex vertex hits
+    an edge at a rational point (e.g., 10/3). Their denominators are bounded by
+    the extent of the instance, so such a vertex never rounds to an integer.
+    """
+    outer, holes = coordinates
+    return all(
+        float(x).is_integer() and float(y).is_integer()
+        for ring in (outer, *holes)
+        for x, y in ring
+    )
+
+
+def bounding_box(polygon: typing.Union[Polygon, PolygonWithHoles]) -> BoundingBox:
+    """
+    The bounding box of the outer boundary of a polygon.
+    """
+    if isinstance(polygon, PolygonWithHoles):
+        polygon = polygon.outer_boundary()
+    xs = [float(p.x()) for p in polygon.boundary()]
+    ys = [float(p.y()) for p in polygon.boundary()]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def interior_point(polygon: PolygonWithHoles) -> Point:
+    """
+    A point in the interior of the polygon: the middle of the widest interval
+    of a horizontal line that passes no vertex. The intervals between
+    consecutive crossings of the boundary alternate between inside and outside.
+    """
+    outer, holes = polygon_to_coordinates(polygon)
+    rings = [outer, *holes]
+    ys = sorted({y for ring in rings for _, y in ring})
+    y_low, y_high = max(zip(ys, ys[1:]), key=lambda band: band[1] - band[0])
+    y = (y_low + y_high) / 2
+    crossings = sorted(
+        x_a + (y - y_a) * (x_b - x_a) / (y_b - y_a)
+        for ring in rings
+        for (x_a, y_a), (x_b, y_b) in zip(ring, ring[1:] + ring[:1])
+        if (y_a < y) != (y_b < y)
+    )
+    x_min, x_max = max(
+        zip(crossings[::2], crossings[1::2]),
+        key=lambda interval: interval[1] - interval[0],
+    )
+    return Point((x_min + x_max) / 2, y)
+
+
+def _overlaps(a: BoundingBox, b: BoundingBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def subtract_polygons(
+    area: typing.List[PolygonWithHoles],
+    polygons: typing.Sequence[PolygonWithHoles],
+) -> typing.List[PolygonWithHoles]:
+    """
+    The parts of the area that are not covered by any of the polygons.
+    A polygon is only subtracted from the pieces whose bounding box overlaps
+    with its own, and the polygons with the largest bounding boxes are
+    subtracted first, such that the remaining pieces become small early.
+    """
+    boxes = [bounding_box(polygon) for polygon in polygons]
+    order = sorted(
+        range(len(polygons)),
+        key=lambda i: (boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]),
+        reverse=True,
+    )
+    pieces = [(piece, bounding_box(piece)) for piece in area]
+    for i in order:
+        if not pieces:
+            break
+        remaining = []
+        for piece, box in pieces:
+            if not _overlaps(box, boxes[i]):
+                remaining.append((piece, box))
+                continue
+            # difference is always a list of polygons as it can split a polygon
+            remaining.extend(
+                (p, bounding_box(p)) for p in piece.difference(polygons[i])
+            )
+        pieces = remaining
+    return [piece for piece, _ in pieces]
+
+
+def polygon_from_coordinates(coordinates: PolygonCoordinates) -> PolygonWithHoles:
+    """
+    Inverse of `polygon_to_coordinates`.
+    """
+    outer, holes = coordinates
+    return PolygonWithHoles(
+        Polygon([Point(x, y) for x, y in outer]),
+        [Polygon([Point(x, y) for x, y in hole]) for hole in holes],
+    )
+
+
+# The worker processes build their own visibility polygon calculator once.
+_worker_instance: typing.Optional[Instance] = None
+_worker_calculator: typing.Optional[VisibilityPolygonCalculator] = None
+
+
+def init_visibility_worker(instance: Instance) -> None:
+    """
+    Initializer of the processes that use `worker_visibility_polygon`.
+    """
+    global _worker_instance, _worker_calculator  # noqa: PLW0603
+    _worker_instance = instance
+    _worker_calculator = VisibilityPolygonCalculator(instance.as_cgal_polygon())
+
+
+def worker_visibility_polygon(vertex: int) -> PolygonWithHoles:
+    """
+    The (exact) visibility polygon of a vertex, computed in a worker process.
+    """
+    assert _worker_instance is not None and _worker_calculator is not None
+    return PolygonWithHoles(
+        _worker_calculator.compute_visibility_polygon(
+            _worker_instance.as_cgal_position(vertex)
+        )
+    )
+
+
+def _compute_visibility_shard(
+    vertices: typing.Sequence[int],
+) -> typing.List[typing.Optional[PolygonCoordinates]]:
+    """
+    The coordinates of the visibility polygons, or None for the polygons that
+    cannot be passed exactly (see `is_integral`).
+    """
+    shard = []
+    for i in vertices:
+        coordinates = polygon_to_coordinates(worker_visibility_polygon(i))
+        shard.append(coordinates if is_integral(coordinates) else None)
+    return shard
 
 
 class GuardCoverage:
@@ -17,70 +187,175 @@ class GuardCoverage:
     """
 
     def __init__(
-        self, instance: Instance, logger: typing.Optional[logging.Logger] = None
+        self,
+        instance: Instance,
+        logger: typing.Optional[logging.Logger] = None,
+        n_jobs: typing.Optional[int] = 1,
+        visibility_polygons: typing.Optional[
+            typing.Dict[int, PolygonWithHoles]
+        ] = None,
     ) -> None:
+        """
+        `n_jobs` is the number of processes used for computing the visibility
+        polygons (1 is serial, -1 uses all cores).
+        Already known `visibility_polygons` of some vertices (e.g., from before
+        an edit, see `unaffected_vertices`) are not computed again.
+        """
         if logger is None:
             self._logger = logging.getLogger("DispAgpSatModel")
         else:
             self._logger = logger
         self._instance = instance
+        self._n_jobs = effective_n_jobs(n_jobs)
+        self._num_recomputed_vispolys = 0
         stop_watch = StopWatch()
-        self._visibility_polygon_calculator = VisibilityPolygonCalculator(
-            instance.as_cgal_polygon()
-        )
-        self._vis_polys = self._compute_visibilities()
-        self._stats = {"time_compute_vispolys": stop_watch.time()}
+        peak_rss = PeakRss()
+        with span("compute_vispolys", n_jobs=self._n_jobs):
+            self._polygon = instance.as_cgal_polygon()
+            self._visibility_polygon_calculator = VisibilityPolygonCalculator(
+                self._polygon
+            )
+            self._vis_polys = self._compute_visibilities(
+                visibility_polygons if visibility_polygons else {}
+            )
+        self._stats = {
+            "num_reused_vispolys": len(visibility_polygons or {}),
+            "num_recomputed_vispolys": self._num_recomputed_vispolys,
+            "time_compute_vispolys": stop_watch.time(),
+            "peak_rss_mb_compute_vispolys": peak_rss.peak_mb(),
+        }
+        # Only the vertices within the bounding box of a polygon need to be
+        # tested for containment.
+        self._cgal_positions = [
+            instance.as_cgal_position(i) for i in range(instance.num_positions())
+        ]
+        self._vertex_index = VertexGridIndex(instance.positions)
+        self._vis_poly_bboxes: typing.Dict[int, BoundingBox] = {}
 
-    def _compute_visibilities(self) -> typing.List[Polygon]:
-        return [
-            PolygonWithHoles(
-                self._visibility_polygon_calculator.compute_visibility_polygon(
-                    self._instance.as_cgal_position(i)
-                )
+    def _compute_visibilities(
+        self, known: typing.Dict[int, PolygonWithHoles]
+    ) -> typing.List[PolygonWithHoles]:
+        n = self._instance.num_positions()
+        missing = [i for i in range(n) if i not in known]
+        if self._n_jobs > 1 and len(missing) > self._n_jobs:
+            computed = self._compute_visibilities_in_parallel(missing)
+        else:
+            computed = [self._compute_visibility(i) for i in missing]
+        vis_polys = dict(known)
+        vis_polys.update(zip(missing, computed))
+        return [vis_polys[i] for i in range(n)]
+
+    def _compute_visibility(self, vertex: int) -> PolygonWithHoles:
+        return PolygonWithHoles(
+            self._visibility_polygon_calculator.compute_visibility_polygon(
+                self._instance.as_cgal_position(vertex)
             )
-            for i in range(self._instance.num_positions())
+        )
+
+    def _compute_visibilities_in_parallel(
+        self, vertices: typing.List[int]
+    ) -> typing.List[PolygonWithHoles]:
+        """
+        Shard the vertices into contiguous ranges and compute their visibility
+        polygons in a process pool. The result is in the order of the vertices,
+        i.e., the same as for the serial computation. The polygons with
+        non-integral vertices cannot be passed exactly as coordinates and are
+        computed again in this process.
+        """
+        shards = [
+            vertices[r.start : r.stop]
+            for r in split_range(len(vertices), _SHARDS_PER_JOB * self._n_jobs)
         ]
+        self._logger.info(
+            "Computing visibility polygons with %d processes (%d shards).",
+            self._n_jobs,
+            len(shards),
+        )
+        with ProcessPoolExecutor(
+            max_workers=self._n_jobs,
+            initializer=init_visibility_worker,
+            initargs=(self._instance,),
+        ) as pool:
+            results = [
+                coordinates
+                for shard in pool.map(_compute_visibility_shard, shards)
+                for coordinates in shard
+            ]
+        computed = []
+        for i, coordinates in zip(vertices, results):
+            if coordinates is None:
+                self._num_recomputed_vispolys += 1
+                computed.append(self._compute_visibility(i))
+            else:
+                computed.append(polygon_from_coordinates(coordinates))
+        return computed
 
     def can_guards_see_each_other(self, guard_a: int, guard_b: int) -> bool:
         return self.get_visibility_of_guard(guard_a).contains(
-            self._instance.as_cgal_position(guard_b)
+            self._cgal_positions[guard_b]
         )
 
+    def _vertices_within(
+        self, poly: typing.Union[Polygon, PolygonWithHoles], bbox: BoundingBox
+    ) -> np.ndarray:
+        candidates = self._vertex_index.query(bbox)
+        is_contained = np.fromiter(
+            (poly.contains(self._cgal_positions[i]) for i in candidates),
+            dtype=bool,
+            count=len(candidates),
+        )
+        return candidates[is_contained]
+
+    def bounding_box_of(self, guard: int) -> BoundingBox:
+        """
+        The bounding box of the visibility polygon of the guard.
+        """
+        if guard not in self._vis_poly_bboxes:
+            self._vis_poly_bboxes[guard] = bounding_box(self._vis_polys[guard])
+        return self._vis_poly_bboxes[guard]
+
+    def guards_visible_from(self, guard: int) -> np.ndarray:
+        """
+        The sorted indices of all vertices (including the guard itself) within
+        the visibility polygon of the guard.
+        """
+        return self._vertices_within(
+            self._vis_polys[guard], self.bounding_box_of(guard)
+        )
+
+    def unaffected_vertices(self, diff: InstanceDiff) -> typing.List[int]:
+        """
+        The vertices that keep their visibility polygon in the edited instance
+        of the diff. The polygons only differ within the changed region, so a
+        visibility polygon whose bounding box stays clear of it is not
+        changed (neither cut off nor extended by the edit).
+        """
+        region = diff.changed_region
+        return [
+            i
+            for i in diff.old_to_new
+            if region is None or not _overlaps(self.bounding_box_of(i), region)
+        ]
+
     def get_visibility_of_guard(self, guard: int):
         return self._vis_polys[guard]
 
     def compute_uncovered_area(
         self, guards: typing.List[int]
     ) -> typing.List[PolygonWithHoles]:
-        missing_area = [self._instance.as_cgal_polygon()]
         coverages = [self.get_visibility_of_guard(guard) for guard in guards]
-
-        def diff(poly_a, poly_b):
-            if self._logger.isEnabledFor(logging.DEBUG):
-                self._logger.debug("Polygons: %s and %s", poly_a, poly_b)
-                self._logger.debug(
-                    "Areas: %s and %s", float(poly_a.area()), float(poly_b.area())
-                )
-            res = poly_a.difference(poly_b)
-            self._logger.debug("Result: %s", res)
-            return res
-
-        for coverage in coverages:
-            assert all(isinstance(p, PolygonWithHoles) for p in missing_area)
-            assert isinstance(coverage, PolygonWithHoles)
-            # difference is always a list of polygons as it can split a polygon into multiple parts
-            missing_area = sum((diff(poly, coverage) for poly in missing_area), [])
+        assert all(isinstance(p, PolygonWithHoles) for p in coverages)
+        missing_area = subtract_polygons([self._polygon], coverages)
+        self._logger.debug(
+            "%d guards leave %d regions uncovered.", len(guards), len(missing_area)
+        )
         return missing_area
 
     def compute_guards_within_polygon(self, poly: Polygon) -> typing.List[int]:
         """
         Compute which vertex guard can see the given witness.
         """
-        return [
-            i
-            for i in range(self._instance.num_positions())
-            if poly.contains(self._instance.as_cgal_position(i))
-        ]
+        return self._vertices_within(poly, bounding_box(poly)).tolist()
 
     def compute_guards_for_witness(self, witness: Point) -> typing.List[int]:
         """
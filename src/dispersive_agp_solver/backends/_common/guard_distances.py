@@ -4,76 +4,367 @@ It is based on the visibility polygon calculator from the rvispoly package.
 It is a well known result that the geodesic distance between two points in a polygon
 can be computed purely by connecting all vertices that can view each other and then
 computing the shortest path between the two points in the resulting graph.
+Alternatively, the distances can be computed on the sparse rectilinear path graph
+from `rectilinear_distances`, which does not need any visibility computations.
 """
 
-import itertools
 import math
 import typing
 
+import numpy as np
 import rustworkx as rw
 
-from dispersive_agp_solver.instance import Instance
+from dispersive_agp_solver.instance import Instance, InstanceDiff
+from dispersive_agp_solver._utils.memory import PeakRss
 from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver._utils.tracing import span
 
 from .guard_coverage import GuardCoverage
+from .rectilinear_distances import RectilinearPathGraph
+
+DISTANCE_ENGINES = ("visibility", "rectilinear")
+
+
+def _distances_to_region(
+    positions: typing.Sequence[typing.Tuple[float, float]],
+    region: typing.Optional[typing.Tuple[float, float, float, float]],
+) -> np.ndarray:
+    """
+    The L1 distance of every position to the (closed) region.
+    """
+    if region is None:
+        return np.full(len(positions), math.inf)
+    x_min, y_min, x_max, y_max = region
+    coords = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    dx = np.maximum(0.0, np.maximum(x_min - coords[:, 0], coords[:, 0] - x_max))
+    dy = np.maximum(0.0, np.maximum(y_min - coords[:, 1], coords[:, 1] - y_max))
+    return dx + dy
+
+
+def _greedy_vertex_cover(uncovered: np.ndarray) -> typing.List[int]:
+    """
+    A small set of vertices that covers all pairs of the symmetric boolean
+    matrix, taking the vertex in most uncovered pairs first.
+    """
+    uncovered = uncovered.copy()
+    degrees = uncovered.sum(axis=1)
+    cover = []
+    while True:
+        v = int(np.argmax(degrees))
+        if degrees[v] == 0:
+            return cover
+        cover.append(v)
+        degrees -= uncovered[v]
+        uncovered[v, :] = False
+        uncovered[:, v] = False
+        degrees[v] = 0
+
+
+def _fit_distances(matrix: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    As the coordinates are integral, so are the L1 distances, and the distance
+    matrices are filled as int32 from the start. Returns the matrix, or a copy
+    with a wider dtype if the values do not fit (int64 for large distances,
+    float64 only for fractional coordinates).
+    """
+    if matrix.dtype.kind != "i" or values.size == 0:
+        return matrix
+    if not np.array_equal(np.rint(values), values):
+        return matrix.astype(np.float64)
+    if values.max() > np.iinfo(matrix.dtype).max:
+        return matrix.astype(np.int64)
+    return matrix
 
 
 class GuardDistances:
     def __init__(
-        self, instance: Instance, guard_coverage: typing.Optional[GuardCoverage]
+        self,
+        instance: Instance,
+        guard_coverage: typing.Optional[GuardCoverage],
+        visibility_edges: typing.Optional[typing.List[typing.Tuple[int, int]]] = None,
+        engine: str = "visibility",
     ) -> None:
-        guard_coverage = guard_coverage if guard_coverage else GuardCoverage(instance)
+        """
+        With the "visibility" engine, the distances are computed on the visibility
+        graph, which is computed from the guard coverage unless the
+        `visibility_edges` are given (e.g., from the preprocessing cache).
+        The "rectilinear" engine uses a sparse rectilinear path graph instead and
+        does not need the guard coverage at all.
+        """
+        if engine not in DISTANCE_ENGINES:
+            msg = f"Invalid distance engine: {engine}"
+            raise ValueError(msg)
         stop_watch = StopWatch()
-        self._graph = rw.PyGraph()
-        self._graph.add_nodes_from(range(instance.num_positions()))
-        for i in range(instance.num_positions()):
-            for j in range(i + 1, instance.num_positions()):
-                if guard_coverage.can_guards_see_each_other(i, j):
-                    dist = abs(instance.positions[i][0] - instance.positions[j][0]) + abs(instance.positions[i][1] - instance.positions[j][1])
-                    self._graph.add_edge(i, j, dist)
+        peak_rss = PeakRss()
+        self._instance = instance
+        self._num_positions = instance.num_positions()
+        self.engine = engine
+        self._visibility_edges = visibility_edges
+        with span("build_distance_graph", engine=engine) as current:
+            self._graph: typing.Optional[rw.PyGraph] = self._build_graph(
+                guard_coverage
+            )
+            current.set(num_edges=self._graph.num_edges())
         if not rw.is_connected(self._graph):
             msg = "Instance is not connected"
             raise ValueError(msg)
-        self._apsp = None
-        self._sorted_distances = None
-        self._stats = {"time_build_distance_graph": stop_watch.time()}
+        self._apsp: typing.Optional[np.ndarray] = None
+        self._distinct_distances: typing.Optional[np.ndarray] = None
+        self._sorted_pairs: typing.Optional[
+            typing.Tuple[np.ndarray, np.ndarray, np.ndarray]
+        ] = None
+        self._stats = {
+            "time_build_distance_graph": stop_watch.time(),
+            "peak_rss_mb_build_distance_graph": peak_rss.peak_mb(),
+        }
+
+    def _build_graph(self, guard_coverage: typing.Optional[GuardCoverage]) -> rw.PyGraph:
+        if self.engine == "rectilinear":
+            return RectilinearPathGraph(self._instance).graph
+        return self._build_visibility_graph(self._instance, guard_coverage)
+
+    def _get_graph(self) -> rw.PyGraph:
+        if self._graph is None:
+            # released, rebuild from the visibility edges (or the instance)
+            self._graph = self._build_graph(None)
+        return self._graph
+
+    def release_graph(self) -> None:
+        """
+        Free the graph once all distances are computed. The visibility edges
+        are kept as a compact array, from which the graph can be rebuilt if
+        shortest paths are requested.
+        """
+        self.compute_all_distances()
+        if self._visibility_edges is not None:
+            self._visibility_edges = np.asarray(
+                self._visibility_edges, dtype=np.int32
+            ).reshape(-1, 2)
+        self._graph = None
+
+    def _build_visibility_graph(
+        self, instance: Instance, guard_coverage: typing.Optional[GuardCoverage]
+    ) -> rw.PyGraph:
+        visibility_edges = self._visibility_edges
+        if visibility_edges is None:
+            guard_coverage = (
+                guard_coverage if guard_coverage else GuardCoverage(instance)
+            )
+            visibility_edges = [
+                (i, int(j))
+                for i in range(instance.num_positions())
+                for j in guard_coverage.guards_visible_from(i)
+                if j > i
+            ]
+        self._visibility_edges = visibility_edges
+        graph = rw.PyGraph()
+        graph.add_nodes_from(range(instance.num_positions()))
+        for i, j in visibility_edges:
+            dist = abs(instance.positions[i][0] - instance.positions[j][0]) + abs(instance.positions[i][1] - instance.positions[j][1])
+            graph.add_edge(i, j, dist)
+        return graph
+
+    def update(
+        self,
+        instance: Instance,
+        diff: InstanceDiff,
+        guard_coverage: typing.Optional[GuardCoverage] = None,
+        unaffected: typing.Iterable[int] = (),
+    ) -> "GuardDistances":
+        """
+        The distances of the edited instance of the diff. The visibility edges
+        of the `unaffected` (old) vertices are kept, the other vertices need the
+        `guard_coverage` of the edited instance.
+        A shortest path that is shorter than any detour over the changed region
+        does not touch it, and is a shortest path in both instances. Only the
+        rows of the remaining pairs are computed again, by one shortest path
+        search from each vertex of a (small) cover of these pairs.
+        """
+        stop_watch = StopWatch()
+        if self.engine == "visibility":
+            kept = set(unaffected)
+            edges = {
+                (diff.old_to_new[int(i)], diff.old_to_new[int(j)])
+                for i, j in self._visibility_edges
+                if i in kept and j in kept
+            }
+            if len(kept) < instance.num_positions():
+                if guard_coverage is None:
+                    guard_coverage = GuardCoverage(instance)
+                kept_new = {diff.old_to_new[i] for i in kept}
+                for i in range(instance.num_positions()):
+                    if i not in kept_new:
+                        edges.update(
+                            (min(i, int(j)), max(i, int(j)))
+                            for j in guard_coverage.guards_visible_from(i)
+                            if j != i
+                        )
+            updated = GuardDistances(instance, None, visibility_edges=sorted(edges))
+        else:
+            updated = GuardDistances(instance, None, engine=self.engine)
+        with span("update_distances") as current:
+            old_matrix = self.get_distance_matrix()
+            n = instance.num_positions()
+            matrix = np.zeros((n, n), dtype=np.result_type(old_matrix.dtype, np.int32))
+            olds = np.fromiter(diff.old_to_new.keys(), dtype=np.int64)
+            news = np.fromiter(diff.old_to_new.values(), dtype=np.int64)
+            matrix[np.ix_(news, news)] = old_matrix[np.ix_(olds, olds)]
+            # the shortest detour over the changed region
+            to_region = _distances_to_region(instance.positions, diff.changed_region)
+            is_known = np.zeros((n, n), dtype=bool)
+            is_known[np.ix_(news, news)] = (
+                matrix[np.ix_(news, news)]
+                < to_region[news][:, None] + to_region[news][None, :]
+            )
+            np.fill_diagonal(is_known, True)
+            sources = _greedy_vertex_cover(~is_known)
+            graph = updated._get_graph()
+            for source in sources:
+                lengths = rw.dijkstra_shortest_path_lengths(
+                    graph, source, lambda e: float(e)
+                )
+                targets = np.fromiter(
+                    lengths.keys(), dtype=np.int64, count=len(lengths)
+                )
+                values = np.fromiter(
+                    lengths.values(), dtype=np.float64, count=len(lengths)
+                )
+                is_position = targets < n
+                targets, values = targets[is_position], values[is_position]
+                matrix = _fit_distances(matrix, values)
+                matrix[source, targets] = values
+                matrix[targets, source] = values
+            updated.load_distance_matrix(matrix)
+            num_reused = (int(is_known.sum()) - n) // 2
+            current.set(num_reused_distances=num_reused, num_sources=len(sources))
+        updated._stats["num_reused_distances"] = num_reused
+        updated._stats["num_distance_update_sources"] = len(sources)
+        updated._stats["time_update_distances"] = stop_watch.time()
+        return updated
+
+    def get_visibility_edges(
+        self,
+    ) -> typing.Optional[
+        typing.Union[typing.List[typing.Tuple[int, int]], np.ndarray]
+    ]:
+        """
+        The pairs of vertices that can see each other (an n x 2 array after
+        `release_graph`). Not available for the rectilinear engine.
+        """
+        return self._visibility_edges
 
     def compute_all_distances(self) -> None:
         """
         Compute all distances.
         """
-        if not self._apsp is not None:
-            stop_watch = StopWatch()
-            self._apsp = dict(
-                rw.all_pairs_dijkstra_path_lengths(self._graph, lambda e: float(e))
+        if self._apsp is None:
+            with span("compute_distances_from_graph"):
+                stop_watch = StopWatch()
+                peak_rss = PeakRss()
+                # The nodes 0..n-1 are the positions. The rectilinear path graph has
+                # further (Steiner) nodes, whose distances we are not interested in.
+                n = self._num_positions
+                matrix = np.zeros((n, n), dtype=np.int32)
+                for i, lengths in rw.all_pairs_dijkstra_path_lengths(
+                    self._get_graph(), lambda e: float(e)
+                ).items():
+                    if i >= n:
+                        continue
+                    targets = np.fromiter(lengths.keys(), dtype=np.int64, count=len(lengths))
+                    values = np.fromiter(
+                        lengths.values(), dtype=np.float64, count=len(lengths)
+                    )
+                    is_position = targets < n
+                    matrix = _fit_distances(matrix, values[is_position])
+                    matrix[i, targets[is_position]] = values[is_position]
+                self._set_distance_matrix(matrix)
+                self._stats["time_compute_distances_from_graph"] = stop_watch.time()
+                self._stats[
+                    "peak_rss_mb_compute_distances_from_graph"
+                ] = peak_rss.peak_mb()
+
+    def _set_distance_matrix(self, matrix: np.ndarray) -> None:
+        self._apsp = matrix
+        self._sorted_pairs = None
+        # all distances that can occur between two different guards, sorted
+        self._distinct_distances = np.unique(matrix[np.triu_indices(len(matrix), 1)])
+
+    def get_distance_matrix(self) -> np.ndarray:
+        """
+        All pairwise distances as n x n matrix. The distances are integral for
+        integral coordinates, in which case the matrix has an integer dtype.
+        """
+        self.compute_all_distances()
+        assert self._apsp is not None
+        return self._apsp
+
+    def load_distance_matrix(self, matrix: np.ndarray) -> None:
+        """
+        Use previously computed distances instead of computing them from the graph.
+        """
+        n = self._num_positions
+        if matrix.shape != (n, n):
+            msg = "Distance matrix does not match the instance."
+            raise ValueError(msg)
+        self._set_distance_matrix(matrix)
+
+    def get_distinct_distances(self) -> np.ndarray:
+        """
+        The sorted distinct distances between pairs of different guards.
+        """
+        self.compute_all_distances()
+        assert self._distinct_distances is not None
+        return self._distinct_distances
+
+    def get_sorted_pairs(self) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        All pairs (a, b) with a < b and their distances as three arrays, sorted
+        by distance. Computed once on first use.
+        """
+        self.compute_all_distances()
+        assert self._apsp is not None
+        if self._sorted_pairs is None:
+            n = self._num_positions
+            index_dtype = np.int32 if n <= np.iinfo(np.int32).max else np.int64
+            guards_a, guards_b = np.triu_indices(n, 1)
+            dists = self._apsp[guards_a, guards_b]
+            order = np.argsort(dists, kind="stable")
+            self._sorted_pairs = (
+                guards_a[order].astype(index_dtype),
+                guards_b[order].astype(index_dtype),
+                dists[order],
             )
-            guards = list(range(self._graph.num_nodes()))
-            self._sorted_distances = [
-                ((i, j), self._apsp[i][j]) for i, j in itertools.combinations(guards, 2)
-            ]
-            self._sorted_distances.sort(key=lambda x: x[1])
-            self._stats["time_compute_distances_from_graph"] = stop_watch.time()
+        return self._sorted_pairs
+
+    def get_pairs_in_range(
+        self, min_dist: float, max_dist: float
+    ) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The slice of `get_sorted_pairs` with min_dist <= distance < max_dist.
+        """
+        guards_a, guards_b, dists = self.get_sorted_pairs()
+        begin = np.searchsorted(dists, min_dist, side="left")
+        end = np.searchsorted(dists, max_dist, side="left")
+        return guards_a[begin:end], guards_b[begin:end], dists[begin:end]
 
     def get_next_higher_distance(self, d: float) -> float:
         """
         Get the next higher distance.
         """
-        self.compute_all_distances()
-        assert self._sorted_distances is not None
-        for (_i, _j), dist in self._sorted_distances:
-            if dist > d:
-                return dist
+        distances = self.get_distinct_distances()
+        i = np.searchsorted(distances, d, side="right")
+        if i < len(distances):
+            return float(distances[i])
         return math.inf
 
     def get_next_lower_distance(self, d: float) -> float:
         """
         Get the next lower distance.
         """
-        self.compute_all_distances()
-        assert self._sorted_distances is not None
-        for (_i, _j), dist in reversed(self._sorted_distances):
-            if dist < d:
-                return dist
+        distances = self.get_distinct_distances()
+        i = np.searchsorted(distances, d, side="left")
+        if i > 0:
+            return float(distances[i - 1])
         return 0.0
 
     def min_distance_of_guards(self, guards: typing.List[int]) -> float:
@@ -87,25 +378,46 @@ class GuardDistances:
             raise ValueError(msg)
         if len(guards) == 1:
             return math.inf
-        return min(self._apsp[i][j] for i, j in itertools.combinations(guards, 2))
+        indices = np.asarray(guards)
+        sub_matrix = self._apsp[np.ix_(indices, indices)]
+        return float(sub_matrix[np.triu_indices(len(indices), 1)].min())
+
+    def distances_between(self, guards: typing.List[int]) -> np.ndarray:
+        """
+        The distance matrix of the given guards. Without the matrix of all
+        distances, only one shortest path search per guard is done.
+        """
+        if self._apsp is not None:
+            return self._apsp[np.ix_(guards, guards)]
+        matrix = np.zeros((len(guards), len(guards)), dtype=np.float64)
+        for i, guard in enumerate(guards):
+            lengths = rw.dijkstra_shortest_path_lengths(
+                self._get_graph(), guard, lambda e: float(e)
+            )
+            for j, other in enumerate(guards):
+                if other != guard:
+                    matrix[i, j] = lengths[other]
+        return matrix
 
     def max(self) -> float:
         """
         Compute the maximum distance.
         """
-        self.compute_all_distances()
-        assert self._sorted_distances is not None
-        return self._sorted_distances[-1][1]
+        return float(self.get_distinct_distances()[-1])
 
     def distance(self, i: int, j: int) -> float:
-        if self._apsp:
-            return self._apsp[i][j]
-        return rw.dijkstra_shortest_path_lengths(self._graph, i, lambda e: float(e))[j]
+        if self._apsp is not None:
+            return float(self._apsp[i, j])
+        return rw.dijkstra_shortest_path_lengths(
+            self._get_graph(), i, lambda e: float(e)
+        )[j]
 
     def shortest_path(self, i: int, j: int) -> typing.List[int]:
-        sp = rw.dijkstra_shortest_paths(self._graph, i, lambda e: float(e))[j]
-        assert isinstance(sp, list)
-        return sp
+        sp = rw.dijkstra_shortest_paths(
+            self._get_graph(), i, weight_fn=lambda e: float(e)
+        )[j]
+        # skip the Steiner nodes of the rectilinear path graph
+        return [v for v in sp if v < self._num_positions]
     
     def get_stats(self):
         return self._stats
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Reduction rules that shrink the models of all backends without changing the
+optimal solutions.
+
+1. Subsumption: a witness whose guard set is a superset of the guard set of
+   another witness is covered whenever the other one is. Its coverage
+   constraint is redundant.
+2. Forced guards: a witness that is seen by a single guard forces this guard
+   into every solution. All other witnesses it sees are subsumed by rule 1.
+3. Exclusion: for a threshold k, no vertex within distance < k of a forced
+   guard f can be selected. This is already implied by the prohibited pair
+   (f, v), so we drop the pairs of such vertices instead: if the nearest forced
+   guard of v has distance < d, every pair (v, w) with distance d is implied
+   by the pair of v and its nearest forced guard. The remaining pair
+   constraints only concern vertices that can still be selected at distance d.
+"""
+
+import math
+import typing
+
+import numpy as np
+
+from dispersive_agp_solver._utils.timer import Timer as StopWatch
+
+from .guard_distances import GuardDistances
+
+Pairs = typing.Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def remove_subsumed_witnesses(
+    witnesses: typing.Sequence[typing.Tuple[typing.Any, typing.List[int]]],
+) -> typing.List[typing.Tuple[typing.Any, typing.List[int]]]:
+    """
+    Keep only the witnesses whose guard set contains no other guard set
+    (identical guard sets are kept once).
+    """
+    order = sorted(range(len(witnesses)), key=lambda w: len(witnesses[w][1]))
+    # guard -> kept witnesses that it sees
+    postings: typing.Dict[int, typing.List[int]] = {}
+    kept: typing.List[typing.Tuple[typing.Any, typing.List[int]]] = []
+    sizes: typing.List[int] = []
+    for w in order:
+        key, guards = witnesses[w]
+        guards = sorted(set(guards))
+        hits = [postings[g] for g in guards if g in postings]
+        if hits:
+            # a kept witness is a subset iff all of its guards are hit
+            counts = np.bincount(np.concatenate(hits), minlength=len(kept))
+            if np.any(counts == np.asarray(sizes)):
+                continue
+        for g in guards:
+            postings.setdefault(g, []).append(len(kept))
+        kept.append((key, guards))
+        sizes.append(len(guards))
+    return kept
+
+
+class Kernel:
+    """
+    The reduced witness set and the guard pairs that still have to be
+    prohibited. The forced guards are part of the witnesses (as witnesses with a
+    single guard), so the backends do not need to handle them separately.
+    """
+
+    def __init__(
+        self,
+        witnesses: typing.Sequence[typing.Tuple[typing.Any, typing.List[int]]],
+        guard_distances: GuardDistances,
+    ) -> None:
+        stop_watch = StopWatch()
+        self._guard_distances = guard_distances
+        self.witnesses = remove_subsumed_witnesses(witnesses)
+        self.forced_guards = sorted(
+            guards[0] for _, guards in self.witnesses if len(guards) == 1
+        )
+        matrix = guard_distances.get_distance_matrix()
+        # distance of every vertex to its nearest forced guard (other than itself)
+        self._nearest_forced = np.full(len(matrix), math.inf)
+        if self.forced_guards:
+            self._nearest_forced = matrix[self.forced_guards].min(axis=0).astype(float)
+            self._nearest_forced[self.forced_guards] = math.inf
+        self._stats = {
+            "kernel_num_witnesses": len(self.witnesses),
+            "kernel_num_subsumed_witnesses": len(witnesses) - len(self.witnesses),
+            "kernel_num_forced_guards": len(self.forced_guards),
+            "time_kernelization": stop_watch.time(),
+        }
+
+    def _filter(self, pairs: Pairs) -> Pairs:
+        guards_a, guards_b, dists = pairs
+        if not self.forced_guards:
+            return pairs
+        nearest = np.minimum(
+            self._nearest_forced[guards_a], self._nearest_forced[guards_b]
+        )
+        keep = nearest >= dists
+        return guards_a[keep], guards_b[keep], dists[keep]
+
+    def get_pairs_in_range(self, min_dist: float, max_dist: float) -> Pairs:
+        """
+        Like `GuardDistances.get_pairs_in_range`, but without the implied pairs.
+        """
+        pairs = self._guard_distances.get_pairs_in_range(min_dist, max_dist)
+        return self._filter(pairs)
+
+    def get_pairs(self) -> Pairs:
+        """
+        All pairs that are not implied, sorted by distance.
+        """
+        return self._filter(self._guard_distances.get_sorted_pairs())
+
+    def upper_bound(self) -> float:
+        """
+        The forced guards bound the objective by their own distances, and every
+        other witness has to be covered by a guard with at most the largest
+        distance of its guards to the forced guards.
+        """
+        if not self.forced_guards:
+            return math.inf
+        bound = self._guard_distances.min_distance_of_guards(self.forced_guards)
+        for _, guards in self.witnesses:
+            if len(guards) > 1:
+                bound = min(bound, float(self._nearest_forced[guards].max()))
+        return bound
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        return self._stats.copy()
@@ -0,0 +1,104 @@
+"""
+Lazy witness generation as an alternative to the shadow witnesses.
+
+Instead of overlaying all visibility polygons to an arrangement up front, we
+start with the vertices as witnesses (their guards are known from the
+visibility polygons) and only check the solutions of the model: every region
+that a solution leaves uncovered yields a further witness, which is added as a
+coverage cut and the model is solved again.
+"""
+
+import logging
+import typing
+
+from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver._utils.tracing import span
+from dispersive_agp_solver.instance import Instance
+
+from .guard_coverage import GuardCoverage, interior_point
+
+
+class LazyCoverage:
+    """
+    Provides the seed witnesses and the callback that checks the coverage of a
+    solution, in the format of the `callback` of `DistanceOptimizer.solve`.
+    """
+
+    def __init__(
+        self,
+        instance: Instance,
+        coverage: GuardCoverage,
+        logger: typing.Optional[logging.Logger] = None,
+        witnesses: typing.Sequence[typing.Tuple[typing.Any, typing.List[int]]] = (),
+    ) -> None:
+        """
+        Further valid `witnesses` (e.g., carried over from before an edit) are
+        added to the seed witnesses.
+        """
+        self._logger = logger if logger else logging.getLogger("LazyCoverage")
+        self.instance = instance
+        self.coverage = coverage
+        self._witnesses = list(witnesses)
+        # the guard sets that are exactly the guards seeing a point
+        self._exact_guard_sets: typing.Set[typing.FrozenSet[int]] = set()
+        self._stats = {
+            "num_coverage_checks": 0,
+            "num_lazy_witnesses": 0,
+            "time_coverage_checks": 0.0,
+        }
+
+    def get_seed_witnesses(self) -> typing.List[typing.Tuple[int, typing.List[int]]]:
+        """
+        The vertices as witnesses. A vertex is seen by exactly the guards within
+        its visibility polygon.
+        """
+        stop_watch = StopWatch()
+        guard_sets = {
+            frozenset(self.coverage.guards_visible_from(i).tolist())
+            for i in range(self.instance.num_positions())
+        }
+        self._exact_guard_sets.update(guard_sets)
+        guard_sets |= {frozenset(guards) for _, guards in self._witnesses}
+        witnesses = [
+            (i, sorted(s)) for i, s in enumerate(sorted(guard_sets, key=sorted))
+        ]
+        self._stats["num_seed_witnesses"] = len(witnesses)
+        self._stats["time_compute_seed_witnesses"] = stop_watch.time()
+        return witnesses
+
+    def __call__(self, guards: typing.List[int]) -> typing.List[typing.List[int]]:
+        """
+        The guard sets of one witness per region that the guards leave
+        uncovered. Empty if the guards cover the whole polygon.
+        """
+        stop_watch = StopWatch()
+        with span("check_coverage", num_guards=len(guards)) as current:
+            uncovered = self.coverage.compute_uncovered_area(guards)
+            cuts = {
+                frozenset(
+                    self.coverage.compute_guards_for_witness(interior_point(region))
+                )
+                for region in uncovered
+            }
+            current.set(num_uncovered_regions=len(uncovered))
+        self._exact_guard_sets.update(cuts)
+        self._stats["num_coverage_checks"] += 1
+        self._stats["num_lazy_witnesses"] += len(cuts)
+        self._stats["time_coverage_checks"] += stop_watch.time()
+        if cuts:
+            self._logger.info(
+                "Solution leaves %d regions uncovered, adding %d witnesses.",
+                len(uncovered),
+                len(cuts),
+            )
+        return [sorted(cut) for cut in cuts]
+
+    def get_exact_guard_sets(self) -> typing.List[typing.List[int]]:
+        """
+        The guard sets of the seed vertices and the witnesses of the coverage
+        checks so far, without the further witnesses.
+        """
+        return [sorted(s) for s in self._exact_guard_sets]
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        return self._stats.copy()
@@ -0,0 +1,124 @@
+"""
+A local search that improves solutions by moving the guards of the closest
+pair away from each other.
+
+Every step looks at the guards in a closest (bottleneck) pair. Such a guard is
+removed if all its witnesses are covered by other guards, or otherwise replaced
+by a guard that covers all the witnesses that only it covers and has a larger
+distance to the remaining guards. Both moves decrease the number of closest
+pairs or increase their distance, such that the search terminates.
+Forbidden guards are never added and required guards never moved.
+"""
+
+import math
+import typing
+
+import numpy as np
+
+from dispersive_agp_solver._utils.timer import Timer as StopWatch
+
+from .guard_distances import GuardDistances
+
+
+class LocalSearch:
+    """
+    Keeps the witnesses of every guard, such that it can be applied to many
+    solutions of the same (growing) witness set.
+    """
+
+    def __init__(
+        self,
+        guard_distances: GuardDistances,
+        witness_guards: typing.Iterable[typing.Sequence[int]] = (),
+    ) -> None:
+        self._matrix = guard_distances.get_distance_matrix()
+        self._witnesses: typing.List[typing.Set[int]] = []
+        # witnesses of every guard
+        self._covers: typing.List[typing.List[int]] = [
+            [] for _ in range(len(self._matrix))
+        ]
+        for guards in witness_guards:
+            self.add_witness(guards)
+
+    def add_witness(self, guards: typing.Sequence[int]) -> None:
+        for g in set(guards):
+            self._covers[g].append(len(self._witnesses))
+        self._witnesses.append(set(guards))
+
+    def _distance_to(self, guard: int, guards: typing.List[int]) -> float:
+        if not guards:
+            return math.inf
+        return float(self._matrix[guard, guards].min())
+
+    def _improve_guard(
+        self,
+        guard: int,
+        selected: typing.Set[int],
+        num_covering: np.ndarray,
+        d: float,
+        forbidden: typing.Set[int],
+    ) -> bool:
+        """
+        Remove or replace the guard if this does not lose coverage and its
+        replacement (not a forbidden guard) has a distance > d to all other
+        guards.
+        """
+        lost = [w for w in self._covers[guard] if num_covering[w] == 1]
+        others = [g for g in selected if g != guard]
+        if not lost:
+            replacement = None
+        else:
+            candidates = set.intersection(*(self._witnesses[w] for w in lost))
+            candidates -= selected
+            candidates -= forbidden
+            if not candidates:
+                return False
+            distances = {c: self._distance_to(c, others) for c in candidates}
+            replacement = max(candidates, key=lambda c: (distances[c], -c))
+            if distances[replacement] <= d:
+                return False
+        selected.remove(guard)
+        num_covering[self._covers[guard]] -= 1
+        if replacement is not None:
+            selected.add(replacement)
+            num_covering[self._covers[replacement]] += 1
+        return True
+
+    def improve(
+        self,
+        solution: typing.Sequence[int],
+        time_limit: float = math.inf,
+        forbidden: typing.Iterable[int] = (),
+        required: typing.Iterable[int] = (),
+    ) -> typing.List[int]:
+        """
+        Improve the solution, which has to cover all witnesses, until no move
+        is possible or the time limit is reached. The `forbidden` guards are
+        never swapped in and the `required` guards never removed or replaced.
+        """
+        stop_watch = StopWatch()
+        forbidden = set(forbidden)
+        required = set(required)
+        selected = set(solution)
+        num_covering = np.zeros(len(self._witnesses), dtype=np.int64)
+        for g in selected:
+            num_covering[self._covers[g]] += 1
+        assert np.all(num_covering > 0), "The solution has to cover all witnesses."
+        while len(selected) > 1 and stop_watch.time() < time_limit:
+            guards = sorted(selected)
+            distances = self._matrix[np.ix_(guards, guards)].astype(float)
+            np.fill_diagonal(distances, math.inf)
+            d = distances.min()
+            # the guards of the closest pairs, the ones in most of them first
+            num_closest = (distances == d).sum(axis=1)
+            bottleneck = [
+                guards[i]
+                for i in np.argsort(-num_closest)
+                if num_closest[i] and guards[i] not in required
+            ]
+            if not any(
+                self._improve_guard(g, selected, num_covering, d, forbidden)
+                for g in bottleneck
+            ):
+                break
+        return sorted(selected)
@@ -0,0 +1,320 @@
+"""
+This file bundles the geometric preprocessing that is shared by all backends:
+the visibility polygons, the guard distances, the shadow witnesses, and their
+kernel.
+"""
+
+import logging
+import threading
+import typing
+
+import numpy as np
+
+from dispersive_agp_solver._utils.memory import current_rss_mb, peak_rss_mb
+from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver._utils.tracing import span
+from dispersive_agp_solver.instance import Instance, InstanceDiff
+
+from .guard_coverage import GuardCoverage
+from .guard_distances import GuardDistances
+from .kernelization import Kernel
+from .lazy_coverage import LazyCoverage
+from .preprocessing_cache import PreprocessingCache
+from .witness_strategy import WitnessStrategy, carry_over_witnesses
+
+Witnesses = typing.List[typing.Tuple[typing.Any, typing.List[int]]]
+
+
+class Preprocessing:
+    """
+    Computes (or loads from the cache) everything the models need about an
+    instance. The visibility polygons are only computed if they are actually
+    needed, i.e., on a cache miss. The parts are computed at most once, also if
+    several optimizers share the preprocessing in different threads.
+    """
+
+    def __init__(
+        self,
+        instance: Instance,
+        logger: typing.Optional[logging.Logger] = None,
+        n_jobs: typing.Optional[int] = 1,
+        cache: typing.Optional[PreprocessingCache] = None,
+        distance_engine: str = "visibility",
+        witness_fan_out_depth: typing.Optional[int] = None,
+        low_memory: bool = False,
+        previous: typing.Optional["Preprocessing"] = None,
+    ) -> None:
+        """
+        `witness_fan_out_depth` controls into how many slabs (2^depth) the
+        computation of the shadow witnesses is split if `n_jobs` > 1.
+        With `low_memory`, the visibility polygons, the arrangement, and the
+        distance graph are freed as soon as the distances and the witnesses
+        are extracted. Only the distance matrix and the guard lists of the
+        witnesses are kept (the geometry is recomputed if needed again).
+        With the `previous` preprocessing of a version of the instance before an
+        edit, only the parts that the edit can change are computed, see
+        `update`.
+        """
+        self._logger = logger if logger else logging.getLogger("Preprocessing")
+        self.instance = instance
+        self._n_jobs = n_jobs
+        self._cache = cache
+        self._witness_fan_out_depth = witness_fan_out_depth
+        self._low_memory = low_memory
+        # computed before the geometry is touched, as `as_cgal_polygon` may
+        # change the orientation of the boundary
+        self._fingerprint = instance.fingerprint()
+        self._guard_coverage: typing.Optional[GuardCoverage] = None
+        self._witness_strategy: typing.Optional[WitnessStrategy] = None
+        self._witnesses: typing.Optional[Witnesses] = None
+        self._kernel: typing.Optional[Kernel] = None
+        self._lazy_coverage: typing.Optional[LazyCoverage] = None
+        self.diff: typing.Optional[InstanceDiff] = None
+        # from the previous preprocessing, used once the geometry is needed
+        self._unaffected: typing.List[int] = []
+        self._reused_polygons: typing.Dict[int, typing.Any] = {}
+        self._previous_guard_sets: typing.List[typing.List[int]] = []
+        self._stats: typing.Dict[str, typing.Any] = {}
+        self._lock = threading.RLock()
+        with span("load_preprocessing_cache"):
+            entry = (
+                cache.load(self._fingerprint, instance.num_positions())
+                if cache is not None
+                else None
+            )
+        self._stats["preprocessing_cache_hit"] = entry is not None
+        if entry is not None:
+            self._load_entry(entry)
+        elif previous is not None:
+            self._update(previous, distance_engine)
+            self._store_entry()
+        else:
+            self._logger.info("Setting up guard distances...")
+            self.guard_distances = GuardDistances(
+                instance,
+                self.guard_coverage if distance_engine == "visibility" else None,
+                engine=distance_engine,
+            )
+            self._store_entry()
+        if low_memory:
+            self.guard_distances.release_graph()
+
+    @property
+    def guard_coverage(self) -> GuardCoverage:
+        with self._lock:
+            if self._guard_coverage is None:
+                self._logger.info("Setting up coverage calculator...")
+                self._guard_coverage = GuardCoverage(
+                    self.instance,
+                    logger=self._logger,
+                    n_jobs=self._n_jobs,
+                    visibility_polygons=self._reused_polygons,
+                )
+                self._reused_polygons = {}
+            return self._guard_coverage
+
+    @property
+    def witness_strategy(self) -> WitnessStrategy:
+        with self._lock:
+            if self._witness_strategy is None:
+                self._logger.info("Setting up witness strategy...")
+                self._witness_strategy = WitnessStrategy(
+                    self.instance,
+                    self.guard_coverage,
+                    logger=self._logger,
+                    n_jobs=self._n_jobs,
+                    fan_out_depth=self._witness_fan_out_depth,
+                )
+            return self._witness_strategy
+
+    def get_shadow_witnesses(self) -> Witnesses:
+        """
+        The shadow witnesses with the guards that can see them.
+        """
+        with self._lock:
+            if self._witnesses is None:
+                self._witnesses = self.witness_strategy.get_shadow_witnesses()
+                self._store_entry()
+                if self._low_memory:
+                    self.release_geometry()
+            return self._witnesses
+
+    def get_kernel(self) -> Kernel:
+        """
+        The shadow witnesses without subsumed ones, with the forced guards and
+        the guard pairs that are not implied by them.
+        """
+        with self._lock:
+            if self._kernel is None:
+                witnesses = self.get_shadow_witnesses()
+                with span("kernelize") as current:
+                    self._kernel = Kernel(witnesses, self.guard_distances)
+                    current.set(**self._kernel.get_stats())
+                self._logger.info(
+                    "Kernel has %d witnesses (%d subsumed) and %d forced guards.",
+                    len(self._kernel.witnesses),
+                    len(witnesses) - len(self._kernel.witnesses),
+                    len(self._kernel.forced_guards),
+                )
+            return self._kernel
+
+    def get_lazy_coverage(self) -> LazyCoverage:
+        """
+        The seed witnesses and the coverage check for a lazy witness generation
+        instead of the shadow witnesses.
+        """
+        with self._lock:
+            if self._lazy_coverage is None:
+                carried = []
+                if self.diff is not None and self._previous_guard_sets:
+                    carried = carry_over_witnesses(
+                        self._previous_guard_sets,
+                        self.diff,
+                        self._unaffected,
+                        self.guard_coverage,
+                    )
+                    self._stats["num_carried_witnesses"] = len(carried)
+                self._lazy_coverage = LazyCoverage(
+                    self.instance,
+                    self.guard_coverage,
+                    logger=self._logger,
+                    witnesses=carried,
+                )
+            return self._lazy_coverage
+
+    def update(self, instance: Instance) -> "Preprocessing":
+        """
+        The preprocessing of an edited version of the instance, e.g., with a
+        moved wall or a further hole, with the same settings.
+        The visibility polygons that stay clear of the edit are kept, and so
+        are the distances whose shortest paths cannot pass the edit. The
+        witnesses of this preprocessing are carried over to the lazy coverage
+        of the new one (as valid but weaker witnesses, which the coverage
+        checks complete), such that it has to be used instead of the shadow
+        witnesses to avoid the arrangement.
+        """
+        return Preprocessing(
+            instance,
+            logger=self._logger,
+            n_jobs=self._n_jobs,
+            cache=self._cache,
+            distance_engine=self.guard_distances.engine,
+            witness_fan_out_depth=self._witness_fan_out_depth,
+            low_memory=self._low_memory,
+            previous=self,
+        )
+
+    def _update(self, previous: "Preprocessing", distance_engine: str) -> None:
+        stop_watch = StopWatch()
+        with span("update_preprocessing") as current:
+            self.diff = previous.instance.diff(self.instance)
+            with previous._lock:
+                old_coverage = previous._guard_coverage
+                if old_coverage is not None:
+                    self._unaffected = old_coverage.unaffected_vertices(self.diff)
+                    self._reused_polygons = {
+                        self.diff.old_to_new[i]: old_coverage.get_visibility_of_guard(i)
+                        for i in self._unaffected
+                    }
+                    # only the guard sets of exact witnesses can be carried over
+                    guard_sets = {frozenset(g) for _, g in previous._witnesses or []}
+                    if previous._lazy_coverage is not None:
+                        guard_sets.update(
+                            map(
+                                frozenset,
+                                previous._lazy_coverage.get_exact_guard_sets(),
+                            )
+                        )
+                    self._previous_guard_sets = [sorted(g) for g in guard_sets]
+            self._logger.info(
+                "Updating the preprocessing for %s (%d unaffected vertices).",
+                self.diff,
+                len(self._unaffected),
+            )
+            if previous.guard_distances.engine == distance_engine:
+                self.guard_distances = previous.guard_distances.update(
+                    self.instance,
+                    self.diff,
+                    self.guard_coverage if distance_engine == "visibility" else None,
+                    self._unaffected,
+                )
+            else:
+                self.guard_distances = GuardDistances(
+                    self.instance,
+                    self.guard_coverage if distance_engine == "visibility" else None,
+                    engine=distance_engine,
+                )
+            current.set(num_unaffected_vertices=len(self._unaffected))
+        self._stats["num_unaffected_vertices"] = len(self._unaffected)
+        self._stats["time_update_preprocessing"] = stop_watch.time()
+
+    def release_geometry(self) -> None:
+        """
+        Free the visibility polygons and the arrangement. Their statistics are
+        kept.
+        """
+        for component in (self._guard_coverage, self._witness_strategy):
+            if component is not None:
+                self._stats.update(component.get_stats())
+        self._guard_coverage = None
+        self._witness_strategy = None
+        self._stats["rss_mb_after_release"] = current_rss_mb()
+        self._logger.info("Released the geometry of the preprocessing.")
+
+    def _load_entry(self, entry: typing.Dict[str, typing.Any]) -> None:
+        stop_watch = StopWatch()
+        edges = entry["visibility_edges"]
+        if edges is None:
+            # computed with the rectilinear engine, whose graph is cheap to rebuild
+            self.guard_distances = GuardDistances(
+                self.instance, None, engine="rectilinear"
+            )
+        else:
+            self.guard_distances = GuardDistances(
+                self.instance,
+                None,
+                visibility_edges=[(int(i), int(j)) for i, j in edges],
+            )
+        self.guard_distances.load_distance_matrix(entry["distances"])
+        if entry.get("witnesses") is not None:
+            self._witnesses = [
+                (i, guards.tolist()) for i, guards in enumerate(entry["witnesses"])
+            ]
+        self._stats["time_load_preprocessing_cache"] = stop_watch.time()
+
+    def _store_entry(self) -> None:
+        if self._cache is None:
+            return
+        with span("store_preprocessing_cache"):
+            self._cache.store(self._fingerprint, self._make_entry())
+
+    def _make_entry(self) -> typing.Dict[str, typing.Any]:
+        edges = self.guard_distances.get_visibility_edges()
+        return {
+            "num_positions": self.instance.num_positions(),
+            "visibility_edges": (
+                np.array(edges, dtype=np.int32).reshape(-1, 2)
+                if edges is not None
+                else None
+            ),
+            "distances": self.guard_distances.get_distance_matrix(),
+            "witnesses": (
+                [np.array(sorted(guards), dtype=np.int32) for _, guards in self._witnesses]
+                if self._witnesses is not None
+                else None
+            ),
+        }
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        stats = self._stats.copy()
+        stats["process_peak_rss_mb"] = peak_rss_mb()
+        if self._guard_coverage is not None:
+            stats.update(self._guard_coverage.get_stats())
+        stats.update(self.guard_distances.get_stats())
+        if self._witness_strategy is not None:
+            stats.update(self._witness_strategy.get_stats())
+        if self._kernel is not None:
+            stats.update(self._kernel.get_stats())
+        if self._lazy_coverage is not None:
+            stats.update(self._lazy_coverage.get_stats())
+        return stats
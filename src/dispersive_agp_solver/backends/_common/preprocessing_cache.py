@@ -0,0 +1,122 @@
+"""
+A persistent on-disk cache for the preprocessing of instances.
+
+The visibility graph, the pairwise distances, and the shadow witnesses only depend
+on the geometry of an instance. They are stored in one compressed file per
+instance, addressed by `Instance.fingerprint()`, such that a re-solve of the same
+instance (e.g., with a different backend or time limit) can skip the geometric
+computations. The cache is bounded in size and evicts the least recently used
+entries.
+"""
+
+import logging
+import lzma
+import os
+import pickle
+import tempfile
+import typing
+from pathlib import Path
+
+# Bump whenever the layout of the entries changes. Entries of other versions are
+# treated as misses.
+_FORMAT_VERSION = 2
+_SUFFIX = ".pkl.xz"
+
+
+class PreprocessingCache:
+    """
+    Content-addressed cache for preprocessing results with LRU eviction.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Union[str, Path],
+        max_size_bytes: int = 1 << 30,
+        logger: typing.Optional[logging.Logger] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self._logger = logger if logger else logging.getLogger("PreprocessingCache")
+
+    def _path(self, fingerprint: str) -> Path:
+        return self.directory / f"{fingerprint}{_SUFFIX}"
+
+    def load(
+        self, fingerprint: str, num_positions: int
+    ) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        Return the entry for the fingerprint or None if there is none. Entries
+        for a different number of positions (which can only come from a
+        fingerprint collision or a damaged entry) are treated as misses.
+        """
+        path = self._path(fingerprint)
+        try:
+            with lzma.open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, lzma.LZMAError):
+            self._logger.warning("Ignoring corrupted cache entry %s.", path)
+            path.unlink(missing_ok=True)
+            return None
+        if entry.get("version") != _FORMAT_VERSION:
+            return None
+        if entry["data"].get("num_positions") != num_positions:
+            self._logger.warning(
+                "Ignoring cache entry %s for a different number of positions.", path
+            )
+            return None
+        # mark as recently used
+        os.utime(path)
+        self._logger.info("Loaded preprocessing from cache entry %s.", path)
+        return entry["data"]
+
+    def store(self, fingerprint: str, data: typing.Dict[str, typing.Any]) -> None:
+        """
+        Store (or replace) the entry for the fingerprint and evict old entries
+        if the cache became too large.
+        """
+        path = self._path(fingerprint)
+        # write to a temporary file first such that concurrent readers never see
+        # a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, lzma.open(raw, "wb") as f:
+                pickle.dump(
+                    {"version": _FORMAT_VERSION, "data": data},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self._logger.info("Stored preprocessing in cache entry %s.", path)
+        self._evict(keep=path)
+
+    def _evict(self, keep: Path) -> None:
+        """
+        Remove the least recently used entries until the cache fits its size,
+        but never `keep`, the entry just stored.
+        """
+        entries = []
+        for path in self.directory.glob(f"*{_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total_size <= self.max_size_bytes:
+                break
+            if path == keep:
+                continue
+            self._logger.info("Evicting cache entry %s.", path)
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob(f"*{_SUFFIX}"):
+            path.unlink(missing_ok=True)
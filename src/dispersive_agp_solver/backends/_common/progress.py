@@ -0,0 +1,48 @@
+"""
+Snapshots of a running solve, reported to the `progress_callback` of the
+optimizers and yielded by `solve_iter`.
+"""
+
+import math
+import typing
+
+# Returning True stops the solve early, which is then handled like a timeout.
+ProgressCallback = typing.Callable[["Progress"], typing.Optional[bool]]
+
+
+class Progress:
+    """
+    The best solution and upper bound known after `time` seconds of the solve.
+    """
+
+    def __init__(
+        self,
+        solution: typing.List[int],
+        objective: float,
+        upper_bound: float,
+        time: float,
+        final: bool = False,
+    ) -> None:
+        self.solution = list(solution)
+        self.objective = objective
+        self.upper_bound = upper_bound
+        self.time = time
+        # the result of the solve, no further snapshots follow
+        self.final = final
+
+    @property
+    def gap(self) -> float:
+        """
+        The optimality gap as defined by the SAT backend.
+        """
+        if self.objective >= self.upper_bound:
+            return 0.0
+        if self.objective == 0:
+            return math.inf
+        return (self.upper_bound - self.objective) / self.objective
+
+    def __repr__(self) -> str:
+        return (
+            f"Progress(objective={self.objective}, upper_bound={self.upper_bound},"
+            f" gap={self.gap}, time={self.time:.3f}, final={self.final})"
+        )
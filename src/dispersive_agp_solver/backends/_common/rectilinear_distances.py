@@ -0,0 +1,136 @@
+"""
+This file computes geodesic L1 distances in orthogonal polygons without any
+visibility computations.
+
+All edges of an orthogonal polygon lie on the lines of its Hanan grid (the grid
+spanned by the x- and y-coordinates of its vertices), so every grid cell is
+either completely inside or completely outside. This allows to answer whether an
+axis-parallel segment between grid points is free with a few prefix sums.
+On top of that, we build the path-preserving graph of Clarkson, Kapoor, and
+Vaidya: recursively split the vertices at the median x-coordinate, project every
+vertex horizontally onto the split line if the projection is free, and connect
+consecutive projections along the line. The graph has O(n log n) nodes and edges
+and contains an L1-shortest path between every pair of vertices.
+"""
+
+import typing
+
+import numpy as np
+import rustworkx as rw
+
+from dispersive_agp_solver.instance import Instance
+
+
+class _FreeSpaceGrid:
+    """
+    The Hanan grid of an orthogonal polygon with the information which of its
+    cells lie inside the polygon.
+    """
+
+    def __init__(self, instance: Instance) -> None:
+        self.xs = np.unique([p[0] for p in instance.positions])
+        self.ys = np.unique([p[1] for p in instance.positions])
+        self.vertex_cells = [
+            (int(np.searchsorted(self.xs, p[0])), int(np.searchsorted(self.ys, p[1])))
+            for p in instance.positions
+        ]
+        inside = self._compute_inside(instance)
+        # An axis-parallel segment along a grid line is free (inside the closed
+        # polygon) if one of the two cells next to it is inside.
+        nx, ny = len(self.xs), len(self.ys)
+        h_free = np.zeros((nx - 1, ny), dtype=bool)
+        h_free[:, :-1] |= inside
+        h_free[:, 1:] |= inside
+        v_free = np.zeros((nx, ny - 1), dtype=bool)
+        v_free[:-1, :] |= inside
+        v_free[1:, :] |= inside
+        # prefix sums of blocked unit segments for O(1) queries
+        self._h_blocked = np.zeros((nx, ny), dtype=np.int64)
+        self._h_blocked[1:, :] = np.cumsum(~h_free, axis=0)
+        self._v_blocked = np.zeros((nx, ny), dtype=np.int64)
+        self._v_blocked[:, 1:] = np.cumsum(~v_free, axis=1)
+
+    def _compute_inside(self, instance: Instance) -> np.ndarray:
+        """
+        Scanline parity: a cell is inside if an odd number of vertical polygon
+        edges lies to its left within its row.
+        """
+        nx, ny = len(self.xs), len(self.ys)
+        toggles = np.zeros((nx, ny), dtype=np.int64)
+        for cycle in [instance.boundary, *instance.holes]:
+            for a, b in zip(cycle, cycle[1:] + cycle[:1]):
+                (xa, ya), (xb, yb) = self.vertex_cells[a], self.vertex_cells[b]
+                if xa != xb:
+                    continue
+                # the vertical edge covers the rows between ya and yb
+                toggles[xa, min(ya, yb)] += 1
+                toggles[xa, max(ya, yb)] -= 1
+        crossings = np.cumsum(toggles, axis=1)[:, :-1]
+        return (np.cumsum(crossings, axis=0)[:-1, :] % 2).astype(bool)
+
+    def is_horizontal_free(self, xa: int, xb: int, y: int) -> bool:
+        xa, xb = min(xa, xb), max(xa, xb)
+        return self._h_blocked[xb, y] == self._h_blocked[xa, y]
+
+    def is_vertical_free(self, x: int, ya: int, yb: int) -> bool:
+        ya, yb = min(ya, yb), max(ya, yb)
+        return self._v_blocked[x, yb] == self._v_blocked[x, ya]
+
+
+class RectilinearPathGraph:
+    """
+    Sparse graph whose shortest paths between the nodes 0..n-1 (the vertices of
+    the instance) have the length of the geodesic L1 distances. All other nodes
+    are Steiner points on the split lines.
+    """
+
+    def __init__(self, instance: Instance) -> None:
+        self._grid = _FreeSpaceGrid(instance)
+        self.graph = rw.PyGraph()
+        self._nodes: typing.Dict[typing.Tuple[int, int], int] = {}
+        for i, cell in enumerate(self._grid.vertex_cells):
+            if cell in self._nodes:
+                msg = "Instance has duplicate positions"
+                raise ValueError(msg)
+            self._nodes[cell] = self.graph.add_node(i)
+        self._edges: typing.Set[typing.Tuple[int, int]] = set()
+        self._build(list(self._grid.vertex_cells))
+
+    def _node(self, cell: typing.Tuple[int, int]) -> int:
+        if cell not in self._nodes:
+            self._nodes[cell] = self.graph.add_node(None)
+        return self._nodes[cell]
+
+    def _connect(self, a: typing.Tuple[int, int], b: typing.Tuple[int, int]) -> None:
+        u, v = self._node(a), self._node(b)
+        if u == v or (min(u, v), max(u, v)) in self._edges:
+            return
+        self._edges.add((min(u, v), max(u, v)))
+        xs, ys = self._grid.xs, self._grid.ys
+        length = (abs(xs[a[0]] - xs[b[0]]) + abs(ys[a[1]] - ys[b[1]])).item()
+        self.graph.add_edge(u, v, length)
+
+    def _connect_along_line(self, x: int, ys: typing.Iterable[int]) -> None:
+        ys = sorted(set(ys))
+        for ya, yb in zip(ys, ys[1:]):
+            if self._grid.is_vertical_free(x, ya, yb):
+                self._connect((x, ya), (x, yb))
+
+    def _build(self, cells: typing.List[typing.Tuple[int, int]]) -> None:
+        stack = [cells]
+        while stack:
+            cells = stack.pop()
+            if len(cells) <= 1:
+                continue
+            columns = sorted({x for x, _ in cells})
+            split = columns[len(columns) // 2]
+            on_line = []
+            for x, y in cells:
+                if x == split:
+                    on_line.append(y)
+                elif self._grid.is_horizontal_free(x, split, y):
+                    self._connect((x, y), (split, y))
+                    on_line.append(y)
+            self._connect_along_line(split, on_line)
+            stack.append([c for c in cells if c[0] < split])
+            stack.append([c for c in cells if c[0] > split])
@@ -0,0 +1,63 @@
+"""
+A uniform grid over the vertices of an instance for finding the vertices within
+a bounding box without testing all of them.
+"""
+
+import math
+import typing
+
+import numpy as np
+
+BoundingBox = typing.Tuple[float, float, float, float]  # x_min, y_min, x_max, y_max
+
+
+class VertexGridIndex:
+    """
+    Buckets the positions into a grid of roughly one position per cell.
+    """
+
+    def __init__(self, positions: typing.Sequence[typing.Tuple[float, float]]) -> None:
+        self._positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        n = len(self._positions)
+        self._num_cells = max(1, math.isqrt(n))
+        self._min = self._positions.min(axis=0) if n else np.zeros(2)
+        extent = (self._positions.max(axis=0) - self._min) if n else np.ones(2)
+        # avoid division by zero for degenerate extents
+        self._cell_size = np.where(extent > 0, extent / self._num_cells, 1.0)
+        cells = self._cells_of(self._positions)
+        cell_ids = cells[:, 1] * self._num_cells + cells[:, 0]
+        self._order = np.argsort(cell_ids, kind="stable")
+        self._starts = np.searchsorted(
+            cell_ids[self._order], np.arange(self._num_cells**2 + 1)
+        )
+
+    def _cells_of(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((points - self._min) / self._cell_size).astype(np.int64)
+        return np.clip(cells, 0, self._num_cells - 1)
+
+    def query(self, bbox: BoundingBox) -> np.ndarray:
+        """
+        The sorted indices of all positions within the (closed) bounding box.
+        """
+        x_min, y_min, x_max, y_max = bbox
+        (cx_min, cy_min), (cx_max, cy_max) = self._cells_of(
+            np.array([[x_min, y_min], [x_max, y_max]], dtype=np.float64)
+        )
+        candidates = np.concatenate(
+            [
+                self._order[
+                    self._starts[cy * self._num_cells + cx_min] : self._starts[
+                        cy * self._num_cells + cx_max + 1
+                    ]
+                ]
+                for cy in range(cy_min, cy_max + 1)
+            ]
+        )
+        points = self._positions[candidates]
+        inside = (
+            (points[:, 0] >= x_min)
+            & (points[:, 0] <= x_max)
+            & (points[:, 1] >= y_min)
+            & (points[:, 1] <= y_max)
+        )
+        return np.sort(candidates[inside])
@@ -1,44 +1,236 @@
 """
 This file implements the shadow witness strategy.
+
+For parallel computation, the plane is cut into vertical slabs and the arrangement
+of the visibility polygons clipped to each slab is computed in its own process.
+A point in a slab is seen by the same guards as before, and the shadow witnesses
+of all slabs together ensure the coverage of every slab. Hence, they form a valid
+(possibly slightly larger) witness set. Only guard indices are passed between the
+processes: neither the arrangements nor the exact (rational) visibility polygons
+can be transferred, so every process computes the polygons of its slab itself.
 """
+import logging
+import math
 import typing
+from concurrent.futures import ProcessPoolExecutor
 
-from rvispoly import Point, Polygon, AVP_Arrangement
+import numpy as np
+from rvispoly import Point, Polygon, PolygonWithHoles, AVP_Arrangement
 
-from dispersive_agp_solver.instance import Instance
+from dispersive_agp_solver.instance import Instance, InstanceDiff
+from dispersive_agp_solver._utils.memory import PeakRss
+from dispersive_agp_solver._utils.parallel import effective_n_jobs
 from dispersive_agp_solver._utils.timer import Timer as StopWatch
-from .guard_coverage import GuardCoverage
+from dispersive_agp_solver._utils.tracing import span
+from .guard_coverage import (
+    GuardCoverage,
+    bounding_box,
+    init_visibility_worker,
+    worker_visibility_polygon,
+)
+from .spatial_index import BoundingBox
+
+# x_min, x_max of a slab
+Slab = typing.Tuple[float, float]
+
+
+def _rectangle(x_min: float, y_min: float, x_max: float, y_max: float) -> PolygonWithHoles:
+    return PolygonWithHoles(
+        Polygon(
+            [
+                Point(x_min, y_min),
+                Point(x_max, y_min),
+                Point(x_max, y_max),
+                Point(x_min, y_max),
+            ]
+        )
+    )
+
+
+def _clip_to_slab(
+    polygon: PolygonWithHoles, slab: Slab, frame: BoundingBox
+) -> typing.List[PolygonWithHoles]:
+    """
+    The parts of the polygon within the slab, by cutting away the parts of the
+    frame to the left and to the right of the slab.
+    """
+    x_min, y_min, x_max, y_max = frame
+    pieces = [polygon]
+    if slab[0] > x_min:
+        left = _rectangle(x_min, y_min, slab[0], y_max)
+        pieces = sum((p.difference(left) for p in pieces), [])
+    if slab[1] < x_max:
+        right = _rectangle(slab[1], y_min, x_max, y_max)
+        pieces = sum((p.difference(right) for p in pieces), [])
+    return pieces
+
+
+def _compute_slab_witnesses(
+    task: typing.Tuple[Slab, BoundingBox, typing.List[int]]
+) -> typing.List[typing.FrozenSet[int]]:
+    slab, frame, guards = task
+    clipped = {}
+    for guard in guards:
+        pieces = _clip_to_slab(worker_visibility_polygon(guard), slab, frame)
+        for j, piece in enumerate(pieces):
+            clipped[(guard, j)] = piece
+    if not clipped:
+        return []
+    avps = WitnessStrategy._compute_avps(clipped, guard_of=lambda key: key[0])
+    return list({frozenset(s) for s in avps.get_shadow_witnesses().values()})
+
 
 class WitnessStrategy:
     def __init__(
         self,
         instance: Instance,
-        coverage: GuardCoverage
+        coverage: GuardCoverage,
+        logger: typing.Optional[logging.Logger] = None,
+        n_jobs: typing.Optional[int] = 1,
+        fan_out_depth: typing.Optional[int] = None,
     ) -> None:
+        """
+        With `n_jobs` > 1, the arrangement is computed on 2^`fan_out_depth`
+        slabs in parallel (by default, two slabs per process).
+        """
+        self._logger = logger if logger else logging.getLogger("WitnessStrategy")
         self.instance = instance
         self.coverage = coverage
+        self._n_jobs = effective_n_jobs(n_jobs)
+        if fan_out_depth is None:
+            fan_out_depth = math.ceil(math.log2(self._n_jobs)) + 1 if self._n_jobs > 1 else 0
+        if fan_out_depth < 0:
+            msg = "fan_out_depth must be non-negative"
+            raise ValueError(msg)
+        self._fan_out_depth = fan_out_depth
         self.visibility_polygons = self._get_visibility_polygons()
         self._stats = {}
 
     def _get_visibility_polygons(self):
         return {i: self.coverage.get_visibility_of_guard(i) for i in range(self.instance.num_positions())}
-    
-    def _compute_avps(visibility_polygons):
+
+    def _compute_avps(visibility_polygons, guard_of=lambda key: key):
         if len(visibility_polygons) == 1:
-            return AVP_Arrangement(list(visibility_polygons.values())[0], {list(visibility_polygons.keys())[0]})
+            key, polygon = list(visibility_polygons.items())[0]
+            return AVP_Arrangement(polygon, {guard_of(key)})
         vis_A = dict(list(visibility_polygons.items())[:len(visibility_polygons)//2])
         vis_B = dict(list(visibility_polygons.items())[len(visibility_polygons)//2:])
-        arr_A = WitnessStrategy._compute_avps(vis_A)
-        arr_B = WitnessStrategy._compute_avps(vis_B)
+        arr_A = WitnessStrategy._compute_avps(vis_A, guard_of)
+        arr_B = WitnessStrategy._compute_avps(vis_B, guard_of)
         return arr_A.overlay(arr_B)
-    
+
+    def _compute_slabs(self) -> typing.List[Slab]:
+        """
+        Split the x-coordinates of the vertices recursively at their median,
+        like the recursion of `_compute_avps` splits the polygons.
+        """
+        splits = []
+        stack = [(sorted({p[0] for p in self.instance.positions}), 0)]
+        while stack:
+            xs, depth = stack.pop()
+            if depth >= self._fan_out_depth or len(xs) < 3:
+                continue
+            median = len(xs) // 2
+            splits.append(xs[median])
+            stack.append((xs[: median + 1], depth + 1))
+            stack.append((xs[median:], depth + 1))
+        bounds = [-math.inf, *sorted(set(splits)), math.inf]
+        return list(zip(bounds, bounds[1:]))
+
+    def _compute_witness_sets_in_parallel(self) -> typing.List[typing.FrozenSet[int]]:
+        xs = [p[0] for p in self.instance.positions]
+        ys = [p[1] for p in self.instance.positions]
+        frame = (min(xs) - 1, min(ys) - 1, max(xs) + 1, max(ys) + 1)
+        slabs = [
+            (max(x_min, frame[0]), min(x_max, frame[2]))
+            for x_min, x_max in self._compute_slabs()
+        ]
+        bboxes = {i: bounding_box(p) for i, p in self.visibility_polygons.items()}
+        tasks = []
+        for slab in slabs:
+            # only the guards whose polygons overlap with the slab
+            guards = [
+                i
+                for i in self.visibility_polygons
+                if bboxes[i][0] < slab[1] and bboxes[i][2] > slab[0]
+            ]
+            tasks.append((slab, frame, guards))
+        self._logger.info(
+            "Computing shadow witnesses on %d slabs with %d processes.",
+            len(slabs),
+            self._n_jobs,
+        )
+        self._stats["num_witness_slabs"] = len(slabs)
+        with ProcessPoolExecutor(
+            max_workers=self._n_jobs,
+            initializer=init_visibility_worker,
+            initargs=(self.instance,),
+        ) as pool:
+            return [
+                witness
+                for witnesses in pool.map(_compute_slab_witnesses, tasks)
+                for witness in witnesses
+            ]
+
     def get_shadow_witnesses(self) -> typing.List[typing.Tuple[typing.Optional[Point], typing.List[int]]]:
         stop_watch = StopWatch()
-        self.avps = WitnessStrategy._compute_avps(self.visibility_polygons)
-        witnesses = self.avps.get_shadow_witnesses().values()
-        unique_witnesses = list(map(set, {frozenset(s) for s in witnesses}))
+        peak_rss = PeakRss()
+        with span("compute_shadow_witnesses", n_jobs=self._n_jobs) as current:
+            if self._n_jobs > 1 and self._fan_out_depth > 0:
+                witnesses = self._compute_witness_sets_in_parallel()
+                unique_witnesses = [
+                    set(s) for s in sorted({frozenset(s) for s in witnesses}, key=sorted)
+                ]
+            else:
+                self.avps = WitnessStrategy._compute_avps(self.visibility_polygons)
+                witnesses = self.avps.get_shadow_witnesses().values()
+                unique_witnesses = list(map(set, {frozenset(s) for s in witnesses}))
+            current.set(num_witnesses=len(unique_witnesses))
         self._stats["time_compute_shadow_witnesses"] = stop_watch.time()
+        self._stats["peak_rss_mb_compute_shadow_witnesses"] = peak_rss.peak_mb()
         return [(i,w) for i,w in enumerate(unique_witnesses)]
-    
+
     def get_stats(self):
-        return self._stats
\ No newline at end of file
+        return self._stats
+
+
+def carry_over_witnesses(
+    witnesses: typing.Iterable[typing.Sequence[int]],
+    diff: InstanceDiff,
+    unaffected: typing.Iterable[int],
+    coverage: GuardCoverage,
+) -> typing.List[typing.Tuple[int, typing.List[int]]]:
+    """
+    Witnesses for the edited instance of the diff, derived from the (exact)
+    guard sets of witnesses of the old instance, without an arrangement.
+    The point of a witness is within the visibility polygons of its unaffected
+    guards (see `GuardCoverage.unaffected_vertices`), which are the same in
+    both instances. In the edited instance, it is seen by these guards and at
+    most by the other guards whose visibility polygon (from `coverage`)
+    overlaps with the intersection of their bounding boxes. The resulting guard
+    sets may be too large, i.e., the witnesses are valid but weaker, and a
+    witness without unaffected guards is dropped.
+    """
+    unaffected = set(unaffected)
+    kept = {diff.old_to_new[i] for i in unaffected}
+    others = [i for i in range(diff.new.num_positions()) if i not in kept]
+    other_boxes = np.array(
+        [coverage.bounding_box_of(i) for i in others], dtype=np.float64
+    ).reshape(-1, 4)
+    carried = set()
+    for guards in witnesses:
+        mapped = [diff.old_to_new[g] for g in guards if g in unaffected]
+        if not mapped:
+            continue
+        boxes = np.array([coverage.bounding_box_of(g) for g in mapped])
+        x_min, y_min = boxes[:, 0].max(), boxes[:, 1].max()
+        x_max, y_max = boxes[:, 2].min(), boxes[:, 3].min()
+        overlapping = (
+            (other_boxes[:, 0] <= x_max)
+            & (x_min <= other_boxes[:, 2])
+            & (other_boxes[:, 1] <= y_max)
+            & (y_min <= other_boxes[:, 3])
+        )
+        mapped.extend(others[i] for i in np.flatnonzero(overlapping))
+        carried.add(frozenset(mapped))
+    return [(i, sorted(s)) for i, s in enumerate(sorted(carried, key=sorted))]
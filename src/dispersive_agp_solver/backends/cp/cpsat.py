@@ -7,6 +7,7 @@ Using a SAT-solver directly, allows for a more efficient search strategy.
 import itertools
 import logging
 import math
+import threading
 import typing
 from enum import Enum
 from typing import Any
@@ -14,20 +15,33 @@ from typing import Any
 from ortools.sat.python import cp_model
 
 from dispersive_agp_solver._utils.timer import Timer
+from dispersive_agp_solver._utils.tracing import span
 from dispersive_agp_solver.instance import Instance
 
-from .._common import GuardCoverage, GuardDistances, WitnessStrategy
+from .._common import (
+    GuardDistances,
+    Kernel,
+    Preprocessing,
+    PreprocessingCache,
+    Progress,
+    ProgressCallback,
+    compute_lower_bound,
+)
 
 
 class _VarMap:
 
-    def __init__(self, n: int, model: cp_model.CpModel, max_dist: int) -> None:
+    def __init__(
+        self,
+        n: int,
+        model: cp_model.CpModel,
+        max_dist: int,
+        pairs: typing.Iterable[typing.Tuple[int, int]],
+    ) -> None:
         self._model = model
         self._vars = [self._model.NewBoolVar(f"x_{i}") for i in range(n)]
         self._combi_vars = {
-            (g, g_): self._model.NewBoolVar(f"y_{g}_{g_}")
-            for g in range(n)
-            for g_ in range(g + 1, n)
+            (g, g_): self._model.NewBoolVar(f"y_{g}_{g_}") for g, g_ in pairs
         }
         self._l = self._model.NewIntVar(0, max_dist, "l")
         for (g, g_), x in self._combi_vars.items():
@@ -43,12 +57,50 @@ class _VarMap:
     def l(self) -> cp_model.IntVar:  # noqa: E743
         return self._l
 
+    def pairs(self) -> typing.Iterable[typing.Tuple[int, int]]:
+        return self._combi_vars.keys()
+
     def get_guards(
         self, get_val: typing.Callable[[cp_model.IntVar], int]
     ) -> typing.List[int]:
         return [g for g, x in enumerate(self._vars) if get_val(x)]
 
 
+class _ProgressReporter(cp_model.CpSolverSolutionCallback):
+    """
+    Passes every solution of CP-SAT to the progress callback.
+    """
+
+    def __init__(
+        self,
+        vars: _VarMap,
+        scaling_factor: int,
+        timer: Timer,
+        progress_callback: ProgressCallback,
+    ) -> None:
+        super().__init__()
+        self._vars = vars
+        self._scaling_factor = scaling_factor
+        self._timer = timer
+        self._progress_callback = progress_callback
+
+    def on_solution_callback(self) -> None:
+        solution = self._vars.get_guards(self.Value)
+        objective = (
+            math.inf
+            if len(solution) == 1
+            else self.ObjectiveValue() / self._scaling_factor
+        )
+        progress = Progress(
+            solution,
+            objective,
+            self.BestObjectiveBound() / self._scaling_factor,
+            self._timer.time(),
+        )
+        if self._progress_callback(progress):
+            self.StopSearch()
+
+
 class _CpSatModel:
 
     def __init__(
@@ -57,23 +109,38 @@ class _CpSatModel:
         dists: GuardDistances,
         logger: logging.Logger,
         scaling_factor: int = 10_000,
+        kernel: typing.Optional[Kernel] = None,
     ) -> None:
+        """
+        With a `kernel`, only the guard pairs that are not implied by its forced
+        guards get a distance constraint.
+        """
         self.logger = logger
         self.instance = instance
         self.model = cp_model.CpModel()
         self.solver = cp_model.CpSolver()
         self.solver.log_callback = self.logger.info
         self.scaling_factor = scaling_factor
+        self._max_dist = round(dists.max() * scaling_factor + 1)
+        if kernel is not None:
+            guards_a, guards_b, _ = kernel.get_pairs()
+            pairs = zip(guards_a.tolist(), guards_b.tolist())
+        else:
+            pairs = itertools.combinations(range(instance.num_positions()), 2)
         self._vars = _VarMap(
             instance.num_positions(),
             self.model,
-            round(dists.max() * scaling_factor + 1),
+            self._max_dist,
+            pairs,
         )
         self._dists = dists
-        self._build_objective()
+        with span("build_model"):
+            self._build_objective()
         self.upper_bound = math.inf
         self.solution = list(range(instance.num_positions()))
         self.objective = 0
+        self.status = cp_model.UNKNOWN
+        self._interrupted = threading.Event()
         self._stats = {
             "num_witnesses": 0,
             "solve_stats": [],
@@ -85,7 +152,7 @@ class _CpSatModel:
         def dist(g: int, g_: int) -> float:
             return round(self._dists.distance(g, g_) * self.scaling_factor)
 
-        for g, g_ in itertools.combinations(range(self.instance.num_positions()), 2):
+        for g, g_ in self._vars.pairs():
             self.model.Add(self._vars.l() <= dist(g, g_)).OnlyEnforceIf(
                 self._vars.y(g, g_)
             )
@@ -97,9 +164,35 @@ class _CpSatModel:
     def add_upper_bound(self, d: float):
         self.model.Add(self._vars.l() <= round(d * self.scaling_factor))
 
+    def add_hint(self, solution: typing.List[int], objective: float):
+        """
+        Hint a known solution to CP-SAT. It is also returned if CP-SAT does not
+        find a solution itself.
+        """
+        selected = set(solution)
+        for g in range(self.instance.num_positions()):
+            self.model.AddHint(self._vars.x(g), g in selected)
+        self.model.AddHint(
+            self._vars.l(),
+            min(round(objective * self.scaling_factor), self._max_dist)
+            if objective < math.inf
+            else self._max_dist,
+        )
+        self.solution = list(solution)
+        self.objective = objective
+
+    def interrupt(self) -> None:
+        """
+        Stop the running (or next) solve call as on a timeout.
+        """
+        self._interrupted.set()
+        self.solver.StopSearch()
+
     def _update_solution(self, status, solver: cp_model.CpSolver):
+        self.status = status
+        # equal to the objective if the solve was not stopped early
         self.upper_bound = min(
-            self.upper_bound, solver.ObjectiveValue() / self.scaling_factor
+            self.upper_bound, solver.BestObjectiveBound() / self.scaling_factor
         )
         if status != cp_model.UNKNOWN:
             assert status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
@@ -108,9 +201,7 @@ class _CpSatModel:
                 self.objective = math.inf
             else:
                 self.objective = solver.ObjectiveValue() / self.scaling_factor
-        else:
-            self.solution = list(range(self.instance.num_positions()))
-            self.objective = 0
+        # otherwise, keep the hinted (or trivial) solution
         self._stats["solve_stats"].append(
             {
                 "CP-SAT": solver.ResponseStats(),
@@ -121,12 +212,26 @@ class _CpSatModel:
         )
 
     def solve(
-        self, timer: Timer, opt_tol: float
+        self,
+        timer: Timer,
+        opt_tol: float,
+        progress_callback: typing.Optional[ProgressCallback] = None,
     ) -> typing.Tuple[float, typing.List[int]]:
         solver = self.solver
         solver.parameters.max_time_in_seconds = timer.remaining()
         solver.parameters.relative_gap_limit = opt_tol
-        status = solver.Solve(self.model)
+        reporter = (
+            _ProgressReporter(self._vars, self.scaling_factor, timer, progress_callback)
+            if progress_callback is not None
+            else None
+        )
+        if self._interrupted.is_set():
+            # StopSearch has no effect before the search started
+            msg = "CP-SAT interrupted"
+            raise TimeoutError(msg)
+        with span("cp_sat_solve") as current:
+            status = solver.Solve(self.model, reporter)
+            current.set(status=solver.StatusName(status))
         self._update_solution(status, solver)
         return self.objective, self.solution
 
@@ -141,17 +246,52 @@ class CpSatOptimizer:
         UNKNOWN = 2
 
     def __init__(
-        self, instance: Instance, logger: typing.Optional[logging.Logger] = None
+        self,
+        instance: Instance,
+        logger: typing.Optional[logging.Logger] = None,
+        n_jobs: typing.Optional[int] = 1,
+        witness_fan_out_depth: typing.Optional[int] = None,
+        cache: typing.Optional[PreprocessingCache] = None,
+        distance_engine: str = "visibility",
+        low_memory: bool = False,
+        kernelize: bool = True,
+        warm_start: bool = True,
+        preprocessing: typing.Optional[Preprocessing] = None,
     ):
+        """
+        With `kernelize`, the model is built for the kernel of the witnesses.
+        With `warm_start`, a greedy solution is passed to CP-SAT as hint.
+        An existing `preprocessing` of the instance is used instead of a new
+        one.
+        """
         self._logger = (
             logger if logger is not None else logging.getLogger("CpSatOptimizer")
         )
         self._logger.info("Initializing CP-SAT optimizer")
         self.instance = instance
-        self._guard_coverage = GuardCoverage(instance)
-        self._dists = GuardDistances(instance, self._guard_coverage)
-        self._witness_strategy = WitnessStrategy(instance, self._guard_coverage)
-        self._model = _CpSatModel(instance, self._dists, logger=self._logger)
+        self._preprocessing = (
+            preprocessing
+            if preprocessing is not None
+            else Preprocessing(
+                instance,
+                logger=self._logger,
+                n_jobs=n_jobs,
+                witness_fan_out_depth=witness_fan_out_depth,
+                cache=cache,
+                distance_engine=distance_engine,
+                low_memory=low_memory,
+            )
+        )
+        self._dists = self._preprocessing.guard_distances
+        self._kernel = self._preprocessing.get_kernel() if kernelize else None
+        self._warm_start = warm_start
+        self._model = _CpSatModel(
+            instance, self._dists, logger=self._logger, kernel=self._kernel
+        )
+        if self._kernel is not None:
+            upper_bound = self._kernel.upper_bound()
+            if upper_bound < math.inf:
+                self._model.add_upper_bound(upper_bound)
         self.solution = None
         self.upper_bound = math.inf
         self.objective = 0
@@ -163,23 +303,61 @@ class CpSatOptimizer:
         """
         return (self.upper_bound - self.objective) / self.objective
 
-    def solve(self, time_limit: float, opt_tol: float = 0.0001):
+    def interrupt(self) -> None:
+        """
+        Stop the search as on a timeout. Can be called from any thread.
+        """
+        self._model.interrupt()
+
+    def solve(
+        self,
+        time_limit: float,
+        opt_tol: float = 0.0001,
+        progress_callback: typing.Optional[ProgressCallback] = None,
+    ):
+        """
+        The `progress_callback` gets a `Progress` for every solution. If it
+        returns True, the search stops as on a timeout.
+        """
         try:
             timer = Timer(time_limit)
-            for _, guards in self._witness_strategy.get_shadow_witnesses():
+            if self._kernel is not None:
+                witnesses = self._kernel.witnesses
+            else:
+                witnesses = self._preprocessing.get_shadow_witnesses()
+            for _, guards in witnesses:
                 self._model.add_witness(guards)
-            obj, solution = self._model.solve(timer, opt_tol)
-            self.upper_bound = obj
+            if self._warm_start:
+                with span("warm_start"):
+                    objective, solution = compute_lower_bound(
+                        [guards for _, guards in witnesses], self._dists
+                    )
+                self._logger.info("Greedy warm start with objective %f.", objective)
+                self._model.add_hint(solution, objective)
+                if progress_callback is not None and progress_callback(
+                    Progress(solution, objective, math.inf, timer.time())
+                ):
+                    raise TimeoutError()
+            obj, solution = self._model.solve(timer, opt_tol, progress_callback)
             self.solution = solution
-            if len(self.solution) == 1:
-                self.objective = math.inf
             self.objective = obj
-            return self.Status.OPTIMAL
+            if len(self.solution) == 1:
+                self.upper_bound = math.inf
+                return self.Status.OPTIMAL
+            self.upper_bound = self._model.upper_bound
+            if self._model.status == cp_model.OPTIMAL:
+                return self.Status.OPTIMAL
+            return self.Status.FEASIBLE
         except TimeoutError:
+            if self._model.objective > 0:
+                # the warm start
+                self.solution = self._model.solution
+                self.objective = self._model.objective
             if self.solution is not None:
                 return self.Status.FEASIBLE
         return self.Status.UNKNOWN
 
     def get_stats(self) -> dict[str, Any]:
         stats = self._model.get_stats()
+        stats.update(self._preprocessing.get_stats())
         return stats
@@ -6,15 +6,23 @@ It is not competitive with the SAT-based solver, and is only included for compar
 import itertools
 import logging
 import math
+import threading
 import typing
 from enum import Enum
 
 import gurobipy as gp
 from gurobipy import GRB
 
+from dispersive_agp_solver._utils.tracing import span
 from dispersive_agp_solver.instance import Instance
 
-from .._common import GuardCoverage, GuardDistances, WitnessStrategy
+from .._common import (
+    Preprocessing,
+    PreprocessingCache,
+    Progress,
+    ProgressCallback,
+    compute_lower_bound,
+)
 
 
 class _VarMap:
@@ -34,6 +42,10 @@ class _VarMap:
     def get_guards(self, get_val: typing.Callable[[gp.Var], int]) -> typing.List[int]:
         return [g for g, x in enumerate(self._vars) if get_val(x)]
 
+    def get_guards_in_callback(self, model: gp.Model) -> typing.List[int]:
+        values = model.cbGetSolution(self._vars)
+        return [g for g, value in enumerate(values) if value > 0.5]
+
 
 class GurobiOptimizer:
     class Status(Enum):
@@ -42,26 +54,80 @@ class GurobiOptimizer:
         UNKNOWN = 2
 
     def __init__(
-        self, instance: Instance, logger: typing.Optional[logging.Logger] = None
+        self,
+        instance: Instance,
+        logger: typing.Optional[logging.Logger] = None,
+        n_jobs: typing.Optional[int] = 1,
+        witness_fan_out_depth: typing.Optional[int] = None,
+        cache: typing.Optional[PreprocessingCache] = None,
+        distance_engine: str = "visibility",
+        low_memory: bool = False,
+        kernelize: bool = True,
+        warm_start: bool = True,
+        preprocessing: typing.Optional[Preprocessing] = None,
     ) -> None:
+        """
+        With `kernelize`, the model is built for the kernel of the witnesses.
+        With `warm_start`, a greedy solution is passed to Gurobi as MIP start.
+        An existing `preprocessing` of the instance is used instead of a new
+        one.
+        """
         self._logger = logger if logger else logging.getLogger("GurobiOptimizer")
         self._logger.info("Initializing GurobiOptimizer")
         self.instance = instance
-        self._coverages = GuardCoverage(instance)
-        self._witness_strategy = WitnessStrategy(instance, self._coverages)
-        self._dists = GuardDistances(instance, self._coverages)
+        self._preprocessing = (
+            preprocessing
+            if preprocessing is not None
+            else Preprocessing(
+                instance,
+                logger=self._logger,
+                n_jobs=n_jobs,
+                witness_fan_out_depth=witness_fan_out_depth,
+                cache=cache,
+                distance_engine=distance_engine,
+                low_memory=low_memory,
+            )
+        )
+        self._dists = self._preprocessing.guard_distances
+        self._kernel = self._preprocessing.get_kernel() if kernelize else None
         self._model = gp.Model()
         self._vars = _VarMap(instance, self._model)
         self.solution = None
         self.objective = 0
         self.upper_bound = math.inf
-        self._build_objective()
-        self._add_shadow_witnesses()
+        self._interrupted = threading.Event()
+        with span("build_model"):
+            self._build_objective()
+            witnesses = self._add_shadow_witnesses()
+        if warm_start:
+            with span("warm_start"):
+                self._set_start(witnesses)
         self._logger.info("Finished initializing GurobiOptimizer")
 
     def _add_shadow_witnesses(self):
-        for _witness, guards in self._witness_strategy.get_shadow_witnesses():
+        if self._kernel is not None:
+            witnesses = self._kernel.witnesses
+            for guard in self._kernel.forced_guards:
+                self._vars.x(guard).LB = 1
+        else:
+            witnesses = self._preprocessing.get_shadow_witnesses()
+        for _witness, guards in witnesses:
             self._model.addConstr(gp.quicksum(self._vars.x(g) for g in guards) >= 1)
+        return witnesses
+
+    def _set_start(self, witnesses):
+        objective, solution = compute_lower_bound(
+            [guards for _, guards in witnesses], self._dists
+        )
+        self._logger.info("Greedy warm start with objective %f.", objective)
+        selected = set(solution)
+        for g in range(self.instance.num_positions()):
+            self._vars.x(g).Start = 1 if g in selected else 0
+        if objective < math.inf:
+            self._vars.l().Start = objective
+        # returned if Gurobi does not find a solution itself
+        self.solution = solution
+        self.objective = objective
 
     def _build_objective(self):
         self._model.setObjective(self._vars.l(), GRB.MAXIMIZE)
@@ -70,7 +136,13 @@ class GurobiOptimizer:
             return self._dists.distance(g, g_)
 
         big_M = self._dists.max()
-        for g, g_ in itertools.combinations(range(self.instance.num_positions()), 2):
+        if self._kernel is not None:
+            self._vars.l().UB = self._kernel.upper_bound()
+            guards_a, guards_b, _ = self._kernel.get_pairs()
+            pairs = zip(guards_a.tolist(), guards_b.tolist())
+        else:
+            pairs = itertools.combinations(range(self.instance.num_positions()), 2)
+        for g, g_ in pairs:
             self._model.addConstr(
                 self._vars.l()
                 <= dist(g, g_) + big_M * (2 - self._vars.x(g) - self._vars.x(g_))
@@ -82,7 +154,7 @@ class GurobiOptimizer:
         return (self.upper_bound - self.objective) / self.upper_bound
 
     def get_stats(self) -> typing.Dict[str, typing.Any]:
-        return {
+        return self._preprocessing.get_stats() | {
             "objective": self.objective,
             "upper_bound": self.upper_bound,
             "opt_gap": self.get_opt_gap(),
@@ -97,16 +169,67 @@ class GurobiOptimizer:
             },
         }
 
+    def interrupt(self) -> None:
+        """
+        Stop the optimization as on a timeout. Can be called from any thread.
+        """
+        self._interrupted.set()
+        self._model.terminate()
+
+    def _progress_callback(
+        self, progress_callback: ProgressCallback
+    ) -> typing.Callable[[gp.Model, int], None]:
+        """
+        A Gurobi callback that passes every new incumbent to the progress
+        callback.
+        """
+
+        def callback(model: gp.Model, where: int) -> None:
+            if where != GRB.Callback.MIPSOL:
+                return
+            solution = self._vars.get_guards_in_callback(model)
+            objective = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            upper_bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+            if upper_bound >= GRB.INFINITY:
+                upper_bound = math.inf
+            if len(solution) == 1:
+                objective = upper_bound = math.inf
+            progress = Progress(
+                solution,
+                objective,
+                upper_bound,
+                model.cbGet(GRB.Callback.RUNTIME),
+            )
+            if progress_callback(progress):
+                model.terminate()
+
+        return callback
+
     def solve(
-        self, time_limit: float, opt_tol: float = 0.0001
+        self,
+        time_limit: float,
+        opt_tol: float = 0.0001,
+        progress_callback: typing.Optional[ProgressCallback] = None,
     ) -> "GurobiOptimizer.Status":
+        """
+        The `progress_callback` gets a `Progress` for every new incumbent. If it
+        returns True, the search stops as on a timeout.
+        """
         self._model.Params.MIPGap = (
             opt_tol  # Waring: This may differ from the definition of CP-SAT
         )
         self._model.Params.LogToConsole = 0
         self._model.Params.TimeLimit = time_limit
         self._model.Params.LazyConstraints = 1
-        self._model.optimize()
+        with span("gurobi_optimize") as current:
+            if self._interrupted.is_set():
+                # terminate has no effect before the optimization started
+                self._logger.info("Optimization was interrupted.")
+            elif progress_callback is not None:
+                self._model.optimize(self._progress_callback(progress_callback))
+            else:
+                self._model.optimize()
+            current.set(status=self._model.Status)
         if self._model.SolCount > 0:
             self.objective = self._model.ObjVal
             self.solution = self._vars.get_guards(lambda x: x.X)
@@ -119,6 +242,8 @@ class GurobiOptimizer:
                 return self.Status.OPTIMAL
             return self.Status.FEASIBLE
         # No solution found
+        if self.solution is not None:
+            # the warm start
+            return self.Status.FEASIBLE
         self.objective = math.inf
-        self.solution = None
         return self.Status.UNKNOWN
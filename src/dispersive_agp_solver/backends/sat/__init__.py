@@ -3,8 +3,10 @@ import typing
 
 from dispersive_agp_solver.instance import Instance
 
+from .._common import PreprocessingCache, ProgressCallback
 from .optimizer import SatBasedOptimizer
 from .params import OptimizerParams, SearchStrategy
+from .prepared_instance import PreparedInstance
 
 
 def solve(
@@ -12,13 +14,36 @@ def solve(
     time_limit: float = 900.0,
     opt_tol: float = 0.0001,
     logger: typing.Optional[logging.Logger] = None,
+    n_jobs: typing.Optional[int] = 1,
+    witness_fan_out_depth: typing.Optional[int] = None,
+    cache: typing.Optional[PreprocessingCache] = None,
+    distance_engine: str = "visibility",
+    low_memory: bool = False,
+    kernelize: bool = True,
+    warm_start: bool = True,
+    progress_callback: typing.Optional[ProgressCallback] = None,
     **params,
 ) -> typing.Tuple[typing.List[int], float, float]:
     solver = SatBasedOptimizer(
-        instance, logger=logger, params=OptimizerParams(**params)
+        instance,
+        logger=logger,
+        params=OptimizerParams(**params),
+        n_jobs=n_jobs,
+        witness_fan_out_depth=witness_fan_out_depth,
+        cache=cache,
+        distance_engine=distance_engine,
+        low_memory=low_memory,
+        kernelize=kernelize,
+        warm_start=warm_start,
     )
-    solver.solve(time_limit, opt_tol)
+    solver.solve(time_limit, opt_tol, progress_callback=progress_callback)
     return solver.solution, solver.objective, solver.upper_bound
 
 
-__all__ = ["SatBasedOptimizer", "OptimizerParams", "SearchStrategy", "solve"]
+__all__ = [
+    "SatBasedOptimizer",
+    "OptimizerParams",
+    "PreparedInstance",
+    "SearchStrategy",
+    "solve",
+]
@@ -1,12 +1,16 @@
 import logging
+import threading
 import typing
 from threading import Timer
 
 from pysat.solvers import Solver
 
 from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver._utils.tracing import span
 from dispersive_agp_solver.instance import Instance
 
+from .sat_worker import is_interruptible
+
 
 class BasicSatModel:
     def __init__(
@@ -14,50 +18,96 @@ class BasicSatModel:
         instance: Instance,
         solver: str = "Glucose4",
         logger: typing.Optional[logging.Logger] = None,
+        incremental: bool = False,
     ) -> None:
+        """
+        The variables 1..n represent the guards. In incremental mode, further
+        selector variables can be created to switch clauses on and off via
+        assumptions, such that the solver never has to be rebuilt.
+        """
         if logger is None:
             self._logger = logging.getLogger("DispAgpSatModel")
         else:
             self._logger = logger
         self._solver_name = solver
         self._instance = instance
-        self._sat_solver = Solver(name=solver, incr=False)
+        self._incremental = incremental
+        self._sat_solver = self._create_solver()
+        # CaDiCaL and Lingeling can neither time out nor be interrupted
+        self._interruptible = is_interruptible(self._sat_solver)
+        self._interrupted = threading.Event()
         self._sat_solver.add_clause(i + 1 for i in range(instance.num_positions()))
         self._model = None
+        self._num_vars = instance.num_positions()
         self._num_coverage_constraints = 0
         self._num_prohibited_guards = 0
+        # all clauses added so far, also counting those removed by resets
+        self.num_clauses_added = 1
         self._stats = {
             "solve_calls": 0,
             "num_resets": 0,
             "solve_statistics": [],
         }
 
+    def _create_solver(self):
+        return Solver(name=self._solver_name, incr=False)
+
+    def _renew_solver(self):
+        """
+        Replace the solver by an empty one.
+        """
+        self._sat_solver.delete()
+        return self._create_solver()
+
     def reset_constraints(self):
         self._stats["num_resets"] += 1
-        self._sat_solver.delete()
-        self._sat_solver = Solver(name=self._solver_name, incr=False)
+        self._sat_solver = self._renew_solver()
         self._sat_solver.add_clause(
             i + 1 for i in range(self._instance.num_positions())
         )
+        self.num_clauses_added += 1
         self._num_coverage_constraints = 0
         self._num_prohibited_guards = 0
+        self._num_vars = self._instance.num_positions()
         self._model = None
 
+    def new_selector(self) -> int:
+        """
+        Create a fresh variable that can be used to guard clauses.
+        """
+        self._num_vars += 1
+        return self._num_vars
+
+    def add_selector_implication(self, selector: int, implied_selector: int):
+        """
+        Activating `selector` also activates `implied_selector`.
+        """
+        self._sat_solver.add_clause([-selector, implied_selector])
+        self.num_clauses_added += 1
+
     def add_coverage_constraint(self, vertices: typing.List[int]):
         assert all(0 <= i < self._instance.num_positions() for i in vertices)
         assert len(vertices) > 0
         self._sat_solver.add_clause([i + 1 for i in vertices])
+        self.num_clauses_added += 1
         self._num_coverage_constraints += 1
         self._logger.debug("Added coverage constraint for %d vertices.", len(vertices))
 
-    def prohibit_guard_pair(self, guard_a: int, guard_b: int):
+    def prohibit_guard_pair(
+        self, guard_a: int, guard_b: int, selector: typing.Optional[int] = None
+    ):
         """
-        Prevent that these two guards are selected together.
+        Prevent that these two guards are selected together. With a selector,
+        this only holds if the selector is assumed to be true.
         """
         assert 0 <= guard_a < self._instance.num_positions()
         assert 0 <= guard_b < self._instance.num_positions()
         assert guard_a != guard_b
-        self._sat_solver.add_clause([-(guard_a + 1), -(guard_b + 1)])
+        clause = [-(guard_a + 1), -(guard_b + 1)]
+        if selector is not None:
+            clause.append(-selector)
+        self._sat_solver.add_clause(clause)
+        self.num_clauses_added += 1
         self._num_prohibited_guards += 1
         self._logger.debug("Prohibited guard pair (%d, %d).", guard_a, guard_b)
 
@@ -73,7 +123,38 @@ class BasicSatModel:
         )
         self._stats["solve_statistics"][-1].update(self._sat_solver.accum_stats())
 
-    def solve(self, timelimit: float = 900) -> bool:
+    def _run_solver(self, assumptions: typing.Sequence[int]) -> typing.Optional[bool]:
+        """
+        A solve call that can be interrupted. The interrupt flag of the solver
+        is cleared before `interrupt` is checked, so an interrupt that arrives
+        in between still stops the call.
+        """
+        if not self._interruptible:
+            if self._interrupted.is_set():
+                return None
+            return self._sat_solver.solve(assumptions=list(assumptions))
+        self._sat_solver.clear_interrupt()
+        if self._interrupted.is_set():
+            return None
+        return self._sat_solver.solve_limited(
+            assumptions=list(assumptions), expect_interrupt=True
+        )
+
+    def _interrupt_solver(self) -> None:
+        if self._interruptible:
+            self._sat_solver.interrupt()
+
+    def interrupt(self) -> None:
+        """
+        Stop the running solve call and all further ones, which raise a
+        TimeoutError. Can be called from any thread.
+        """
+        self._interrupted.set()
+        self._interrupt_solver()
+
+    def solve(
+        self, timelimit: float = 900, assumptions: typing.Sequence[int] = ()
+    ) -> bool:
         """
         Return a list of indices of guards that should be selected.
         """
@@ -85,16 +166,22 @@ class BasicSatModel:
             msg = "timelimit must be positive"
             raise ValueError(msg)
 
-        def interrupt(solver):
-            solver.interrupt()
-
-        timer = Timer(timelimit, interrupt, [self._sat_solver])
-        stop_watch = StopWatch()
-        timer.start()
-        status = self._sat_solver.solve()
-        self._log_solver_stats(status, stop_watch.time())
+        timer = Timer(timelimit, self._interrupt_solver)
+        with span("sat_solve", solver=self._solver_name) as current:
+            stop_watch = StopWatch()
+            timer.start()
+            status = self._run_solver(assumptions)
+            self._log_solver_stats(status, stop_watch.time())
+            current.set(
+                status=status,
+                conflicts=self._stats["solve_statistics"][-1].get("conflicts"),
+            )
         self._logger.info("SAT solver terminated (%fs).", self._sat_solver.time())
         timer.cancel()
+        if self._interrupted.is_set():
+            self._logger.info("SAT solver was interrupted.")
+            msg = "SAT solver interrupted"
+            raise TimeoutError(msg)
         if status is None:
             self._logger.info("SAT solver timed out.")
             msg = "SAT solver timed out"
@@ -112,7 +199,8 @@ class BasicSatModel:
         if self._model is None:
             msg = "No solution available"
             raise RuntimeError(msg)
-        return [i - 1 for i in self._model if i > 0]
+        n = self._instance.num_positions()
+        return [i - 1 for i in self._model if 0 < i <= n]
 
     def get_stats(self):
         return self._stats.copy()
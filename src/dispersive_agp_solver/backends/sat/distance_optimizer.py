@@ -1,20 +1,27 @@
 import itertools
 import logging
 import math
+import threading
 import typing
 from enum import Enum
 
-from dispersive_agp_solver._utils.timer import Timer
+import numpy as np
+
+from dispersive_agp_solver._utils import Timer, effective_n_jobs, span
 from dispersive_agp_solver.instance import Instance
 
-from .._common import GuardDistances
+from .._common import GuardDistances, Kernel, LocalSearch
+from .._common.progress import Progress, ProgressCallback
 from .basic_sat_model import BasicSatModel
+from .parallel_search import ParallelProber
+from .portfolio_sat_model import DEFAULT_PORTFOLIO, PortfolioSatModel
 
 
 class SearchStrategy(Enum):
     UP = 0
     DOWN = 1
     BINARY = 2
+    PARALLEL = 3  # several thresholds at once on worker processes
 
 
 class DistanceOptimizer:
@@ -28,31 +35,200 @@ class DistanceOptimizer:
         guard_distances: GuardDistances,
         logger: logging.Logger,
         solver: str = "Glucose4",
+        incremental: bool = False,
+        portfolio_solvers: typing.Sequence[str] = DEFAULT_PORTFOLIO,
+        parallel_probes: typing.Optional[int] = -1,
+        kernel: typing.Optional[Kernel] = None,
+        local_search_time: float = 0.0,
     ) -> None:
+        """
+        The solver "portfolio" races the `portfolio_solvers` in parallel.
+        The search strategy PARALLEL runs `parallel_probes` probes at the same
+        time (-1 for one per core).
+        With a `kernel`, the guard pairs implied by its forced guards are not
+        prohibited explicitly (its witnesses must be added as coverage
+        constraints).
+        Every new solution is improved by up to `local_search_time` seconds of
+        local search (0 disables it).
+        In incremental mode, the prohibited guard pairs are guarded by selector
+        literals, one per distance level, and every probe is a solve call with
+        assumptions on the same solver. Lowering k then does not require to
+        rebuild the formula, and the learned clauses are kept for all probes.
+        """
         self._logger = logger
         self.instance = instance
         self.objective = 0.0
         self.upper_bound = math.inf
-        self._sat_model = BasicSatModel(
-            instance, logger=logger.getChild("BasicSatModel"), solver=solver
-        )
+        self._incremental = incremental
+        self._solver_name = solver
+        self._portfolio_solvers = tuple(portfolio_solvers)
+        self._parallel_probes = parallel_probes
+        if solver == "portfolio":
+            self._sat_model: BasicSatModel = PortfolioSatModel(
+                instance,
+                solvers=portfolio_solvers,
+                logger=logger.getChild("PortfolioSatModel"),
+                incremental=incremental,
+            )
+        else:
+            self._sat_model = BasicSatModel(
+                instance,
+                logger=logger.getChild("BasicSatModel"),
+                solver=solver,
+                incremental=incremental,
+            )
         self._guard_distances = guard_distances
+        self._kernel = kernel
+        # the source of the guard pairs to prohibit
+        self._pairs: typing.Union[GuardDistances, Kernel] = (
+            kernel if kernel is not None else guard_distances
+        )
         self._coverage_constraints = []
+        self._local_search_time = local_search_time
+        self._local_search = (
+            LocalSearch(guard_distances) if local_search_time > 0 else None
+        )
         self.solution = list(range(instance.num_positions()))  # trivial solution
         self._k = 0.0
+        # incremental mode: selector literal of each encoded distance level
+        self._level_selectors: typing.List[int] = []
+        self._assumptions: typing.List[int] = []
+        self._progress_callback: typing.Optional[ProgressCallback] = None
+        self._last_progress: typing.Optional[typing.Tuple[float, float]] = None
+        self._interrupted = threading.Event()
+        self._k_hint: typing.Optional[float] = None
+        # assumptions that exclude forbidden and select required guards
+        self._restrictions: typing.List[int] = []
+        self._forbidden: typing.List[int] = []
+        self._required: typing.List[int] = []
         self._stats = {
             "ks": [],
             "total_build_time": 0
         }
 
+    def set_initial_solution(self, solution: typing.List[int]) -> None:
+        """
+        Start the search from a known feasible solution, e.g., a heuristic one.
+        """
+        objective = self._guard_distances.min_distance_of_guards(solution)
+        if objective > self.objective:
+            self.solution = list(solution)
+            self.objective = objective
+
+    def set_guard_restrictions(
+        self,
+        forbidden: typing.Iterable[int] = (),
+        required: typing.Iterable[int] = (),
+    ) -> None:
+        """
+        Search only for solutions without the `forbidden` and with all
+        `required` guards, e.g., for one query of many on the same model. The
+        restrictions are passed as assumptions, such that the clauses (and in
+        incremental mode, the learned clauses) are kept for the next query.
+        This resets the solution and the bounds of the previous search.
+        """
+        self._forbidden = list(forbidden)
+        self._required = list(required)
+        self._restrictions = [-(g + 1) for g in self._forbidden] + [
+            g + 1 for g in self._required
+        ]
+        self.objective = 0.0
+        self.upper_bound = math.inf
+        self.solution = list(range(self.instance.num_positions()))
+        self._k_hint = None
+        self._last_progress = None
+
+    def set_first_probe(self, k: float) -> None:
+        """
+        Probe the smallest distance >= k first, e.g., the optimum of the
+        instance before an edit, which is likely close to the new one. Only
+        the first probe of the sequential strategies is affected.
+        """
+        self._k_hint = k
+
+    def interrupt(self) -> None:
+        """
+        Stop the search as on a timeout. The running SAT call is interrupted,
+        parallel probes within a second. Can be called from any thread.
+        """
+        self._interrupted.set()
+        self._sat_model.interrupt()
+
+    def _check_interrupted(self) -> None:
+        if self._interrupted.is_set():
+            self._logger.info("Search was interrupted.")
+            msg = "Search interrupted"
+            raise TimeoutError(msg)
+
     def add_upper_bound(self, upper_bound: float) -> None:
         self.upper_bound = min(self.upper_bound, upper_bound)
         assert (
             self.objective <= self.upper_bound
         ), f"{self.objective} <= {self.upper_bound}"
 
+    def _prohibit_guard_pairs(
+        self,
+        min_dist: float,
+        max_dist: float,
+        level_selectors: typing.Optional[typing.List[int]] = None,
+    ) -> int:
+        """
+        Prohibit all guard pairs with min_dist <= distance < max_dist. The pairs
+        are presorted by distance, so this only touches the pairs in the range.
+        If the selectors of the distance levels are given, the clauses are
+        guarded by them.
+        """
+        guards_a, guards_b, dists = self._pairs.get_pairs_in_range(min_dist, max_dist)
+        if level_selectors is None:
+            for guard_a, guard_b in zip(guards_a.tolist(), guards_b.tolist()):
+                self._sat_model.prohibit_guard_pair(guard_a, guard_b)
+        else:
+            levels = np.searchsorted(
+                self._guard_distances.get_distinct_distances(), dists, side="left"
+            )
+            for guard_a, guard_b, level in zip(
+                guards_a.tolist(), guards_b.tolist(), levels.tolist()
+            ):
+                self._sat_model.prohibit_guard_pair(
+                    guard_a, guard_b, level_selectors[level]
+                )
+        return len(dists)
+
+    def _activate_levels_below(self, k: float) -> None:
+        """
+        Incremental mode: make sure that all pairs with distance < k are encoded
+        and assume the selector of the highest distance level below k. The
+        selectors form a chain, such that all lower levels are activated, too.
+        """
+        distances = self._guard_distances.get_distinct_distances()
+        num_levels = int(np.searchsorted(distances, k, side="left"))
+        num_encoded = len(self._level_selectors)
+        if num_levels > num_encoded:
+            self._logger.info("Prohibiting guard pairs for k=%f...", k)
+            for _ in range(num_encoded, num_levels):
+                selector = self._sat_model.new_selector()
+                if self._level_selectors:
+                    self._sat_model.add_selector_implication(
+                        selector, self._level_selectors[-1]
+                    )
+                self._level_selectors.append(selector)
+            num_prohibited_pairs = self._prohibit_guard_pairs(
+                distances[num_encoded], k, self._level_selectors
+            )
+            self._logger.info("Prohibited %d guard pairs.", num_prohibited_pairs)
+        self._assumptions = (
+            [self._level_selectors[num_levels - 1]] if num_levels > 0 else []
+        ) + self._restrictions
+        self._k = k
+
     def _solve_for_k(self, k: float, timer: Timer) -> bool:
         stop_watch = Timer()
+        if self._incremental:
+            self._activate_levels_below(k)
+            self._stats["total_build_time"] = (
+                self._stats["total_build_time"] + stop_watch.time()
+            )
+            return self._sat_model.solve(timer.remaining(), self._assumptions)
         if self._k > k:
             # reset model
             self._logger.info("Resetting model because k got lowered...")
@@ -62,19 +238,23 @@ class DistanceOptimizer:
             self._k = 0.0
         assert self._k <= k
         self._logger.info("Prohibiting guard pairs for k=%f...", k)
-        guards = list(range(self.instance.num_positions()))
-        num_prohibited_pairs = 0
-        for guard_a, guard_b in itertools.combinations(guards, 2):
-            if self._k <= self._guard_distances.distance(guard_a, guard_b) < k:
-                self._sat_model.prohibit_guard_pair(guard_a, guard_b)
-                num_prohibited_pairs += 1
+        num_prohibited_pairs = self._prohibit_guard_pairs(self._k, k)
         self._k = k
+        self._assumptions = list(self._restrictions)
         self._logger.info("Prohibited %d guard pairs.", num_prohibited_pairs)
         self._stats["total_build_time"] = self._stats["total_build_time"] + stop_watch.time()
-        return self._sat_model.solve(timer.remaining())
+        return self._sat_model.solve(timer.remaining(), self._assumptions)
 
     def _select_next_k(self, search_strategy: SearchStrategy) -> float:
-        if search_strategy == SearchStrategy.UP:
+        if self._k_hint is not None:
+            # the smallest distance >= the hint
+            k = self._guard_distances.get_next_higher_distance(
+                self._guard_distances.get_next_lower_distance(self._k_hint)
+            )
+            k = min(k, self._guard_distances.max())
+            k = max(k, self._guard_distances.get_next_higher_distance(self.objective))
+            self._k_hint = None
+        elif search_strategy == SearchStrategy.UP:
             k = self._guard_distances.get_next_higher_distance(self.objective)
         elif search_strategy == SearchStrategy.DOWN:
             k = self._guard_distances.get_next_lower_distance(self.upper_bound)
@@ -93,17 +273,22 @@ class DistanceOptimizer:
         timer: Timer,
         callback: typing.Callable[[typing.List[int]], typing.List[typing.List[int]]],
     ) -> bool:
-        # resolve model for k until the callback returns no further cuts
-        feasible = self._solve_for_k(k, timer)
-        # let the callback decide if it is really feasible
-        cuts = callback(self._sat_model.get_solution()) if feasible else []
-        while feasible and cuts:
-            timer.check()
-            for cut in cuts:
-                self.add_coverage_constraint(cut)
-            self._coverage_constraints += cuts
-            feasible = self._sat_model.solve(timer.remaining())
+        with span("sat_probe", k=k) as current:
+            num_clauses = self._sat_model.num_clauses_added
+            # resolve model for k until the callback returns no further cuts
+            feasible = self._solve_for_k(k, timer)
+            # let the callback decide if it is really feasible
             cuts = callback(self._sat_model.get_solution()) if feasible else []
+            while feasible and cuts:
+                timer.check()
+                for cut in cuts:
+                    self.add_coverage_constraint(cut)
+                feasible = self._sat_model.solve(timer.remaining(), self._assumptions)
+                cuts = callback(self._sat_model.get_solution()) if feasible else []
+            current.set(
+                feasible=feasible,
+                clauses_added=self._sat_model.num_clauses_added - num_clauses,
+            )
         return feasible
 
     def add_coverage_constraint(self, vertices: typing.List[int]):
@@ -111,8 +296,68 @@ class DistanceOptimizer:
         assert len(vertices) > 0
         self._sat_model.add_coverage_constraint(vertices)
         self._coverage_constraints.append(vertices)
+        if self._local_search is not None:
+            self._local_search.add_witness(vertices)
         self._logger.debug("Added coverage constraint for %d vertices.", len(vertices))
 
+    def _improve_solution(
+        self,
+        timer: Timer,
+        callback: typing.Callable[[typing.List[int]], typing.List[typing.List[int]]],
+    ) -> None:
+        """
+        Apply the local search to the current solution. The callback has to
+        accept the improved solution, as it may violate coverage constraints
+        that are not known yet. Its cuts are added to the model.
+        """
+        if self._local_search is None or self.objective == 0.0:
+            return
+        with span("local_search") as current:
+            time_limit = min(self._local_search_time, timer.remaining(throwing=False))
+            solution = self._local_search.improve(
+                self.solution,
+                time_limit,
+                forbidden=self._forbidden,
+                required=self._required,
+            )
+            objective = self._guard_distances.min_distance_of_guards(solution)
+            improved = objective > self.objective
+            if improved:
+                cuts = callback(solution)
+                for cut in cuts:
+                    self.add_coverage_constraint(cut)
+                improved = not cuts
+            current.set(improved=improved, objective=objective)
+        if improved:
+            self._logger.info(
+                "Local search improved the objective from %f to %f.",
+                self.objective,
+                objective,
+            )
+            self._stats["local_search_improvements"] = (
+                self._stats.get("local_search_improvements", 0) + 1
+            )
+            self.solution = solution
+            self.objective = objective
+
+    def _report_progress(self, timer: Timer) -> None:
+        """
+        Pass the current solution and bound to the progress callback if one of
+        them changed. The callback can stop the search like a timeout.
+        """
+        if self._progress_callback is None:
+            return
+        state = (self.objective, self.upper_bound)
+        if state == self._last_progress:
+            return
+        self._last_progress = state
+        progress = Progress(
+            self.solution, self.objective, self.upper_bound, timer.time()
+        )
+        if self._progress_callback(progress):
+            self._logger.info("Search stopped by the progress callback.")
+            raise TimeoutError()
+
     def get_opt_gap(self) -> float:
         if self.objective == 0.0:
             return math.inf
@@ -123,6 +368,95 @@ class DistanceOptimizer:
         stats["solver"] = self._sat_model.get_stats()
         return stats
 
+    def _select_parallel_k(self, running: typing.List[float]) -> typing.Optional[float]:
+        """
+        The distinct distance in the middle of the largest gap between the
+        bounds and the thresholds that are already being probed. Infinity is a
+        candidate as well, it allows single-guard solutions.
+        """
+        distances = np.append(self._guard_distances.get_distinct_distances(), math.inf)
+        lo = int(np.searchsorted(distances, self.objective, side="right"))
+        hi = int(np.searchsorted(distances, self.upper_bound, side="right"))
+        if lo >= hi:
+            return None
+        taken = sorted(
+            int(np.searchsorted(distances, k, side="left")) for k in running
+        )
+        # candidate indices are lo..hi-1, the running probes split them into gaps
+        best = None
+        for start, end in zip([lo - 1, *taken], [*taken, hi]):
+            if end - start > 1 and (best is None or end - start > best[1] - best[0]):
+                best = (start, end)
+        if best is None:
+            return None
+        return float(distances[(best[0] + best[1] + 1) // 2])
+
+    def _solve_parallel(
+        self,
+        timer: Timer,
+        callback: typing.Callable[[typing.List[int]], typing.List[typing.List[int]]],
+        opt_tol: float,
+    ) -> None:
+        """
+        Keep all workers busy with different thresholds. Every result tightens
+        either the objective or the upper bound, and probes that became
+        pointless are interrupted.
+        """
+        if self._solver_name == "portfolio":
+            names = self._portfolio_solvers
+        else:
+            names = (self._solver_name,)
+        num_workers = effective_n_jobs(self._parallel_probes)
+        prober = ParallelProber(
+            self.instance,
+            self._guard_distances,
+            list(itertools.islice(itertools.cycle(names), num_workers)),
+            self._logger.getChild("ParallelProber"),
+            kernel=self._kernel,
+        )
+        self._stats["parallel_probes"] = num_workers
+        try:
+            for constraint in self._coverage_constraints:
+                prober.add_coverage_constraint(constraint)
+            while self.get_opt_gap() > opt_tol:
+                while prober.has_idle_worker():
+                    k = self._select_parallel_k(prober.running_ks())
+                    if k is None:
+                        break
+                    self._stats["ks"].append(k)
+                    prober.start(k)
+                if not prober.running_ks():
+                    break
+                for k, feasible, solution in prober.wait(
+                    min(timer.remaining(), 1.0)
+                ):
+                    if not feasible:
+                        self._logger.info("No solution found for k=%f.", k)
+                        self.add_upper_bound(
+                            self._guard_distances.get_next_lower_distance(k)
+                        )
+                        continue
+                    cuts = callback(solution)
+                    if cuts:
+                        for cut in cuts:
+                            self.add_coverage_constraint(cut)
+                            prober.add_coverage_constraint(cut)
+                        continue  # the threshold will be probed again
+                    objective = self._guard_distances.min_distance_of_guards(solution)
+                    self._logger.info("Solution found for k=%f.", k)
+                    if objective > self.objective:
+                        self.solution = solution
+                        self.objective = objective
+                        self._improve_solution(timer, callback)
+                prober.cancel(lambda k: k <= self.objective or k > self.upper_bound)
+                self._report_progress(timer)
+                self._check_interrupted()
+                self._logger.info(
+                    "Objective: %f/ Upper Bound: %f", self.objective, self.upper_bound
+                )
+        finally:
+            prober.close()
+
     def solve(
         self,
         timelimit: float = 900,
@@ -132,12 +466,41 @@ class DistanceOptimizer:
         ] = None,
         timer: typing.Optional[Timer] = None,
         opt_tol: float = 0.0001,
+        progress_callback: typing.Optional[ProgressCallback] = None,
     ) -> bool:
+        """
+        The `callback` may return coverage cuts for a solution, which is only
+        accepted if there are none. The `progress_callback` gets every improved
+        solution or bound.
+        Returns False if no solution satisfies the guard restrictions.
+        """
         if not callback:
             callback = lambda _: []  # noqa: E731
         timer = timer if timer is not None else Timer(timelimit)
+        self._progress_callback = progress_callback
+        # e.g., an initial solution
+        self._improve_solution(timer, callback)
+        self._report_progress(timer)
+        self._check_interrupted()
+        if self._restrictions and self.objective == 0.0:
+            # the restrictions may leave no solution at all
+            if not self._solve_for_k_with_callback(0.0, timer, callback):
+                self._logger.info("No solution satisfies the guard restrictions.")
+                self.upper_bound = 0.0
+                return False
+            self.solution = self._sat_model.get_solution()
+            self.objective = self._guard_distances.min_distance_of_guards(self.solution)
+            self._improve_solution(timer, callback)
+            self._report_progress(timer)
+        if search_strategy == SearchStrategy.PARALLEL:
+            if self._restrictions:
+                msg = "The PARALLEL search does not support guard restrictions."
+                raise ValueError(msg)
+            self._solve_parallel(timer, callback, opt_tol)
+            return True
         while self.get_opt_gap() > opt_tol:
             timer.check()
+            self._check_interrupted()
             k = self._select_next_k(search_strategy)  # next value to try
             assert (
                 self.objective < k <= self.upper_bound
@@ -151,11 +514,14 @@ class DistanceOptimizer:
                 )
                 self.add_upper_bound(next_lower_dist)
                 self._logger.info("Upper bound reduced to %f.", self.upper_bound)
+                self._report_progress(timer)
                 continue
             # if we got this far, we have a solution
             self._logger.info("Solution found for k=%f.", k)
             self.solution = self._sat_model.get_solution()
             self.objective = self._guard_distances.min_distance_of_guards(self.solution)
+            self._improve_solution(timer, callback)
+            self._report_progress(timer)
             self._logger.info(
                 "Objective: %f/ Upper Bound: %f", self.objective, self.upper_bound
             )
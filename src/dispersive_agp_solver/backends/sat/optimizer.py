@@ -1,17 +1,28 @@
+import copy
 import logging
 import math
+import threading
 import typing
 from enum import Enum
 
 from rvispoly import Point
 
-from dispersive_agp_solver._utils import Timer
+from dispersive_agp_solver._utils import Timer, span
 from dispersive_agp_solver.instance import Instance
 
-from .._common import GuardCoverage, GuardDistances, WitnessStrategy
+from .._common import (
+    Kernel,
+    ProgressCallback,
+    Preprocessing,
+    PreprocessingCache,
+    compute_lower_bound,
+    compute_upper_bound,
+)
 from .distance_optimizer import DistanceOptimizer, SearchStrategy
 from .params import OptimizerParams
 
+Callback = typing.Callable[[typing.List[int]], typing.List[typing.List[int]]]
+
 
 class SatBasedOptimizer:
     class Status(Enum):
@@ -25,16 +36,43 @@ class SatBasedOptimizer:
         logger: typing.Optional[logging.Logger],
         params: typing.Optional[OptimizerParams] = None,
         solver: str = "Glucose4",
+        n_jobs: typing.Optional[int] = 1,
+        witness_fan_out_depth: typing.Optional[int] = None,
+        cache: typing.Optional[PreprocessingCache] = None,
+        distance_engine: str = "visibility",
+        low_memory: bool = False,
+        kernelize: bool = True,
+        warm_start: bool = True,
+        preprocessing: typing.Optional[Preprocessing] = None,
     ) -> None:
+        """
+        With `kernelize`, the witnesses and guard pairs are reduced by the
+        rules in `_common.kernelization` before the search.
+        With `warm_start`, the search starts from a greedy solution instead of
+        the trivial one.
+        An existing `preprocessing` of the instance is used instead of a new
+        one (`n_jobs`, `witness_fan_out_depth`, `cache`, `distance_engine`, and
+        `low_memory` are then ignored).
+        """
         self._logger = logger if logger else logging.getLogger("DispAgpSolver")
         self.params = params if params else OptimizerParams()
         self.solver=solver
-        self._logger.info("Setting up coverage calculator...")
-        self._guard_coverage = GuardCoverage(instance, logger=self._logger)
-        self._logger.info("Setting up guard distances...")
-        self._guard_distances = GuardDistances(instance, self._guard_coverage)
-        self._logger.info("Setting up witness strategy...")
-        self._witness_strategy = WitnessStrategy(instance, self._guard_coverage)
+        self._preprocessing = (
+            preprocessing
+            if preprocessing is not None
+            else Preprocessing(
+                instance,
+                logger=self._logger,
+                n_jobs=n_jobs,
+                witness_fan_out_depth=witness_fan_out_depth,
+                cache=cache,
+                distance_engine=distance_engine,
+                low_memory=low_memory,
+            )
+        )
+        self._guard_distances = self._preprocessing.guard_distances
+        self._kernelize = kernelize
+        self._warm_start = warm_start
         self.instance = instance
         self.upper_bound = math.inf
         self.objective = 0
@@ -43,7 +81,50 @@ class SatBasedOptimizer:
         self._stats = {
             "iteration_statistics": [],
         }
-        self._stats = self._stats | self._guard_coverage.get_stats()
+        self._stats = self._stats | self._preprocessing.get_stats()
+        self._interrupted = threading.Event()
+        self._dist_optimizer: typing.Optional[DistanceOptimizer] = None
+        # set by `update`: the solution and bound from before an edit
+        self._previous_solution: typing.Optional[typing.List[int]] = None
+        self._first_probe: typing.Optional[float] = None
+
+    def interrupt(self) -> None:
+        """
+        Stop the search as on a timeout, interrupting the running SAT call.
+        Can be called from any thread, also before `solve`.
+        """
+        self._interrupted.set()
+        dist_optimizer = self._dist_optimizer
+        if dist_optimizer is not None:
+            dist_optimizer.interrupt()
+
+    def update(self, instance: Instance) -> "SatBasedOptimizer":
+        """
+        An optimizer for an edited version of the instance, e.g., with a moved
+        wall or a further hole. It reuses the unchanged parts of the
+        preprocessing (see `Preprocessing.update`) and hence uses the lazy
+        coverage. Its search starts from the current solution if it still
+        covers the edited polygon, and probes the current upper bound first.
+        """
+        params = copy.copy(self.params)
+        params.lazy_coverage = True
+        optimizer = SatBasedOptimizer(
+            instance,
+            self._logger,
+            params=params,
+            solver=self.solver,
+            kernelize=self._kernelize,
+            warm_start=self._warm_start,
+            preprocessing=self._preprocessing.update(instance),
+        )
+        old_to_new = self.instance.diff(instance).old_to_new
+        if self.objective > 0 and all(g in old_to_new for g in self.solution):
+            optimizer._previous_solution = [old_to_new[g] for g in self.solution]
+        if self.upper_bound < math.inf:
+            optimizer._first_probe = self.upper_bound
+        elif self.objective > 0:
+            optimizer._first_probe = self.objective
+        return optimizer
 
     def add_upper_bound(self, upper_bound: float) -> None:
         self.upper_bound = min(self.upper_bound, upper_bound)
@@ -55,22 +136,54 @@ class SatBasedOptimizer:
         timer: Timer,
         search_strategy: SearchStrategy,
         opt_tol: float,
+        kernel: typing.Optional[Kernel] = None,
+        callback: typing.Optional[Callback] = None,
+        progress_callback: typing.Optional[ProgressCallback] = None,
     ) -> typing.Tuple[typing.List[int], float, float]:
+        """
+        The `callback` may return coverage cuts for a solution, see
+        `DistanceOptimizer.solve`.
+        """
+        if callback is None:
+            callback = lambda _: []  # noqa: E731
         self._logger.info(
             "Computing optimal solution for %d witnesses...", len(witnesses)
         )
         dist_optimizer = DistanceOptimizer(
-            self.instance, logger=self._logger, guard_distances=self._guard_distances, solver=self.solver
+            self.instance,
+            logger=self._logger,
+            guard_distances=self._guard_distances,
+            solver=self.solver,
+            incremental=self.params.incremental,
+            portfolio_solvers=self.params.portfolio_solvers,
+            parallel_probes=self.params.parallel_probes,
+            kernel=kernel,
+            local_search_time=self.params.local_search_time,
         )
+        self._dist_optimizer = dist_optimizer
+        # `interrupt` may have missed the new optimizer
+        if self._interrupted.is_set():
+            dist_optimizer.interrupt()
         try:
             dist_optimizer.add_upper_bound(self.upper_bound)
+            if kernel is not None:
+                dist_optimizer.add_upper_bound(kernel.upper_bound())
             for _, guards in witnesses:
                 dist_optimizer.add_coverage_constraint(guards)
+            if self.params.compute_bounds:
+                self._apply_upper_bound(dist_optimizer, witnesses)
+            if self._warm_start:
+                self._apply_warm_start(dist_optimizer, witnesses, callback, timer)
+            if self._previous_solution is not None:
+                self._apply_previous_solution(dist_optimizer, witnesses, callback)
+            if self._first_probe is not None:
+                dist_optimizer.set_first_probe(self._first_probe)
             dist_optimizer.solve(
                 timer=timer,
-                callback=[],
+                callback=callback,
                 search_strategy=search_strategy,
                 opt_tol=opt_tol,
+                progress_callback=progress_callback,
             )
             self._logger.info(
                 "Found optimal solution with objective %f for witness set",
@@ -79,7 +192,13 @@ class SatBasedOptimizer:
             self.add_upper_bound(dist_optimizer.upper_bound)
         except TimeoutError as _:
             self.add_upper_bound(dist_optimizer.upper_bound)
+            # the best solution so far
+            if dist_optimizer.objective > self.objective:
+                self.solution = dist_optimizer.solution
+                self.objective = dist_optimizer.objective
             raise
+        finally:
+            self._dist_optimizer = None
         self._stats["iteration_statistics"].append(
             {
                 "objective": dist_optimizer.objective,
@@ -96,6 +215,81 @@ class SatBasedOptimizer:
             dist_optimizer.upper_bound,
         )
 
+    def _apply_upper_bound(
+        self,
+        dist_optimizer: DistanceOptimizer,
+        witnesses: typing.List[typing.Tuple[Point, typing.List[int]]],
+    ) -> None:
+        with span("compute_upper_bound") as current:
+            stop_watch = Timer()
+            upper_bound = compute_upper_bound(
+                [guards for _, guards in witnesses], self._guard_distances
+            )
+            dist_optimizer.add_upper_bound(upper_bound)
+            self._stats["time_compute_upper_bound"] = stop_watch.time()
+            self._stats["initial_upper_bound"] = upper_bound
+            current.set(upper_bound=upper_bound)
+        self._logger.info("Combinatorial upper bound: %f.", upper_bound)
+
+    def _apply_warm_start(
+        self,
+        dist_optimizer: DistanceOptimizer,
+        witnesses: typing.List[typing.Tuple[Point, typing.List[int]]],
+        callback: Callback,
+        timer: Timer,
+    ) -> None:
+        with span("warm_start") as current:
+            stop_watch = Timer()
+            guard_lists = [guards for _, guards in witnesses]
+            while True:
+                lower_bound, solution = compute_lower_bound(
+                    guard_lists, self._guard_distances, dist_optimizer.upper_bound
+                )
+                # the greedy solution is only a lower bound if it passes the callback
+                cuts = callback(solution)
+                if not cuts:
+                    break
+                for cut in cuts:
+                    guard_lists.append(cut)
+                    dist_optimizer.add_coverage_constraint(cut)
+                # many rounds of coverage cuts must not exceed the time limit
+                timer.check()
+            dist_optimizer.set_initial_solution(solution)
+            self._stats["time_warm_start"] = stop_watch.time()
+            self._stats["initial_lower_bound"] = lower_bound
+            current.set(lower_bound=lower_bound)
+        self._logger.info("Greedy warm start with objective %f.", lower_bound)
+        # usable even if the search times out right away
+        if dist_optimizer.objective > self.objective:
+            self.solution = dist_optimizer.solution
+            self.objective = dist_optimizer.objective
+
+    def _apply_previous_solution(
+        self,
+        dist_optimizer: DistanceOptimizer,
+        witnesses: typing.List[typing.Tuple[Point, typing.List[int]]],
+        callback: Callback,
+    ) -> None:
+        assert self._previous_solution is not None
+        solution = self._previous_solution
+        selected = set(solution)
+        cuts = callback(solution)
+        for cut in cuts:
+            dist_optimizer.add_coverage_constraint(cut)
+        feasible = not cuts and all(selected.intersection(g) for _, g in witnesses)
+        self._stats["previous_solution_feasible"] = feasible
+        if not feasible:
+            self._logger.info("The previous solution does not cover the instance.")
+            return
+        dist_optimizer.set_initial_solution(solution)
+        self._logger.info(
+            "Starting from the previous solution with objective %f.",
+            self._guard_distances.min_distance_of_guards(solution),
+        )
+        if dist_optimizer.objective > self.objective:
+            self.solution = dist_optimizer.solution
+            self.objective = dist_optimizer.objective
+
     def get_opt_gap(self) -> float:
         """
         Return the optimality gap, similar to the one defined by CP-SAT
@@ -109,17 +303,47 @@ class SatBasedOptimizer:
         return stats
 
     def solve(
-        self, time_limit: float = 900, opt_tol: float = 0.0001
+        self,
+        time_limit: float = 900,
+        opt_tol: float = 0.0001,
+        progress_callback: typing.Optional[ProgressCallback] = None,
     ) -> "SatBasedOptimizer.Status":
+        """
+        The `progress_callback` gets a `Progress` for every improved solution
+        or upper bound. If it returns True, the search stops as on a timeout.
+        """
         try:
             timer = Timer(time_limit)
-            solution, obj, ub = self._compute_optimal_for_witness_set(
-                self._witness_strategy.get_shadow_witnesses(),
-                timer,
-                search_strategy=self.params.search_strategy_start,
-                opt_tol=opt_tol,
-            )
-            self._stats = self._stats | self._witness_strategy.get_stats()
+            if self._interrupted.is_set():
+                raise TimeoutError()
+            callback: typing.Optional[Callback] = None
+            if self.params.lazy_coverage:
+                lazy_coverage = self._preprocessing.get_lazy_coverage()
+                witnesses = lazy_coverage.get_seed_witnesses()
+                callback = lazy_coverage
+                # the kernel of a subset of the witnesses is valid for all
+                kernel = (
+                    Kernel(witnesses, self._guard_distances)
+                    if self._kernelize
+                    else None
+                )
+            elif self._kernelize:
+                kernel = self._preprocessing.get_kernel()
+                witnesses = kernel.witnesses
+            else:
+                kernel = None
+                witnesses = self._preprocessing.get_shadow_witnesses()
+            with span("sat_search", solver=self.solver):
+                solution, obj, ub = self._compute_optimal_for_witness_set(
+                    witnesses,
+                    timer,
+                    search_strategy=self.params.search_strategy_start,
+                    opt_tol=opt_tol,
+                    kernel=kernel,
+                    callback=callback,
+                    progress_callback=progress_callback,
+                )
+            self._stats = self._stats | self._preprocessing.get_stats()
             # Found a solution
             self.solution = solution
             self.objective = obj
@@ -0,0 +1,189 @@
+"""
+Probing several distance thresholds at the same time.
+
+Every worker process holds the same formula: the coverage constraints and all
+prohibited guard pairs, guarded by one selector literal per distance level. The
+selectors form a chain (each level implies the lower ones), so a probe for a
+threshold k is a single assumption and every worker can probe a different k.
+"""
+
+import logging
+import time
+import typing
+
+import numpy as np
+
+from dispersive_agp_solver._utils.tracing import current_tracer
+from dispersive_agp_solver.instance import Instance
+
+from .._common import GuardDistances, Kernel
+from .sat_worker import SatWorker, wait_for_results
+
+ProbeResult = typing.Tuple[float, bool, typing.List[int]]
+
+
+class ParallelProber:
+    """
+    Runs decision probes "is there a solution with all guard pairs at distance
+    >= k?" on a pool of solver processes.
+    """
+
+    def __init__(
+        self,
+        instance: Instance,
+        guard_distances: GuardDistances,
+        solver_names: typing.Sequence[str],
+        logger: logging.Logger,
+        kernel: typing.Optional[Kernel] = None,
+    ) -> None:
+        self._instance = instance
+        self._guard_distances = guard_distances
+        self._pairs: typing.Union[GuardDistances, Kernel] = (
+            kernel if kernel is not None else guard_distances
+        )
+        self._logger = logger
+        self._workers = [SatWorker(name) for name in solver_names]
+        if not all(w.interruptible for w in self._workers):
+            self.close()
+            msg = "Parallel probing requires solvers that can be interrupted."
+            raise ValueError(msg)
+        n = instance.num_positions()
+        self._num_vars = n
+        self._level_selectors: typing.List[int] = []
+        self._next_probe_id = 0
+        # worker -> (probe id, k, start time, clauses added) of the running probe
+        self._running: typing.Dict[
+            SatWorker, typing.Tuple[int, float, float, int]
+        ] = {}
+        self._num_clauses = 0
+        # results of cancelled probes that still have to be received
+        self._stale: typing.Dict[SatWorker, int] = {}
+        self._add_clause(list(range(1, n + 1)))
+
+    def _add_clause(self, clause: typing.List[int]) -> None:
+        self._num_clauses += 1
+        for worker in self._workers:
+            worker.add_clause(clause)
+
+    def add_coverage_constraint(self, vertices: typing.List[int]) -> None:
+        self._add_clause([i + 1 for i in vertices])
+
+    def _encode_levels_below(self, k: float) -> typing.List[int]:
+        """
+        Encode all pairs with distance < k and return the assumptions for k.
+        """
+        distances = self._guard_distances.get_distinct_distances()
+        num_levels = int(np.searchsorted(distances, k, side="left"))
+        num_encoded = len(self._level_selectors)
+        if num_levels > num_encoded:
+            for _ in range(num_encoded, num_levels):
+                self._num_vars += 1
+                if self._level_selectors:
+                    self._add_clause([-self._num_vars, self._level_selectors[-1]])
+                self._level_selectors.append(self._num_vars)
+            guards_a, guards_b, dists = self._pairs.get_pairs_in_range(
+                distances[num_encoded], k
+            )
+            levels = np.searchsorted(distances, dists, side="left")
+            for guard_a, guard_b, level in zip(
+                guards_a.tolist(), guards_b.tolist(), levels.tolist()
+            ):
+                self._add_clause(
+                    [-(guard_a + 1), -(guard_b + 1), -self._level_selectors[level]]
+                )
+            self._logger.info(
+                "Encoded %d further guard pairs for k=%f.", len(dists), k
+            )
+        return [self._level_selectors[num_levels - 1]] if num_levels > 0 else []
+
+    def num_workers(self) -> int:
+        return len(self._workers)
+
+    def running_ks(self) -> typing.List[float]:
+        return [running[1] for running in self._running.values()]
+
+    def has_idle_worker(self) -> bool:
+        return len(self._running) < len(self._workers)
+
+    def _receive_stale(self, worker: SatWorker) -> None:
+        while worker in self._stale:
+            probe_id, *_ = worker.receive()
+            if probe_id == self._stale[worker]:
+                del self._stale[worker]
+
+    def start(self, k: float) -> None:
+        """
+        Start a probe for k on an idle worker.
+        """
+        num_clauses = self._num_clauses
+        assumptions = self._encode_levels_below(k)
+        idle = [w for w in self._workers if w not in self._running]
+        # prefer workers without pending results of cancelled probes
+        idle.sort(key=lambda w: w in self._stale)
+        worker = idle[0]
+        self._receive_stale(worker)
+        self._next_probe_id += 1
+        worker.start_solve(self._next_probe_id, assumptions)
+        self._running[worker] = (
+            self._next_probe_id,
+            k,
+            time.perf_counter(),
+            self._num_clauses - num_clauses,
+        )
+
+    def cancel(self, should_cancel: typing.Callable[[float], bool]) -> None:
+        """
+        Interrupt all running probes whose k is no longer of interest.
+        """
+        for worker, (probe_id, k, start, _) in list(self._running.items()):
+            if should_cancel(k):
+                self._trace(worker, start, k=k, feasible="cancelled")
+                worker.interrupt(probe_id)
+                self._stale[worker] = probe_id
+                del self._running[worker]
+
+    def wait(self, timeout: float) -> typing.List[ProbeResult]:
+        """
+        Wait for finished probes and return (k, feasible, solution) for each.
+        Probes that were interrupted are not reported.
+        """
+        workers = list(self._running) + list(self._stale)
+        results = []
+        for worker in wait_for_results(workers, timeout=timeout):
+            probe_id, status, model, _ = worker.receive()
+            if self._stale.get(worker) == probe_id:
+                del self._stale[worker]
+                continue
+            running = self._running.get(worker)
+            if running is None or running[0] != probe_id:
+                continue
+            del self._running[worker]
+            self._trace(
+                worker,
+                running[2],
+                k=running[1],
+                feasible=status,
+                clauses_added=running[3],
+            )
+            if status is None:
+                continue
+            n = self._instance.num_positions()
+            solution = [i - 1 for i in model if 0 < i <= n] if status else []
+            results.append((running[1], status, solution))
+        return results
+
+    def _trace(self, worker: SatWorker, start: float, **args: typing.Any) -> None:
+        tracer = current_tracer()
+        if tracer is not None:
+            track = f"probe worker {self._workers.index(worker)}"
+            tracer.record("sat_probe", start, time.perf_counter(), track, **args)
+
+    def close(self) -> None:
+        # running probes would delay the shutdown of their workers
+        for worker, (probe_id, *_) in self._running.items():
+            worker.interrupt(probe_id)
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+        self._running = {}
+        self._stale = {}
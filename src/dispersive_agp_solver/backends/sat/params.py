@@ -1,6 +1,7 @@
 import typing
 
 from .distance_optimizer import SearchStrategy
+from .portfolio_sat_model import DEFAULT_PORTFOLIO
 
 
 class OptimizerParams:
@@ -12,10 +13,36 @@ class OptimizerParams:
         search_strategy_iteration: typing.Union[
             SearchStrategy, str
         ] = SearchStrategy.BINARY,
+        incremental: bool = False,
+        portfolio_solvers: typing.Sequence[str] = DEFAULT_PORTFOLIO,
+        parallel_probes: typing.Optional[int] = -1,
+        compute_bounds: bool = True,
+        lazy_coverage: bool = False,
+        local_search_time: float = 0.0,
     ) -> None:
+        """
+        With `incremental`, all probes of the search share one SAT solver and
+        select the prohibited guard pairs via assumptions.
+        `portfolio_solvers` are the PySAT backends raced by the solver "portfolio".
+        The search strategy PARALLEL probes `parallel_probes` thresholds at the
+        same time (-1 for one per core).
+        With `compute_bounds`, the search starts below a combinatorial upper
+        bound instead of the whole distance range.
+        With `lazy_coverage`, the shadow witnesses are not computed. The search
+        starts with the vertices as witnesses and adds a witness for every
+        region a solution leaves uncovered.
+        Every solution of the search is improved by up to `local_search_time`
+        seconds of local search (0 disables it).
+        """
         if isinstance(search_strategy_start, str):
             search_strategy_start = SearchStrategy[search_strategy_start]
         if isinstance(search_strategy_iteration, str):
             search_strategy_iteration = SearchStrategy[search_strategy_iteration]
         self.search_strategy_start = search_strategy_start
         self.search_strategy_iteration = search_strategy_iteration
+        self.incremental = incremental
+        self.portfolio_solvers = tuple(portfolio_solvers)
+        self.parallel_probes = parallel_probes
+        self.compute_bounds = compute_bounds
+        self.lazy_coverage = lazy_coverage
+        self.local_search_time = local_search_time
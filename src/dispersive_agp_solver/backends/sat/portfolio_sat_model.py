@@ -0,0 +1,196 @@
+"""
+A SAT model that races several PySAT backends on every solve call.
+
+Which backend is fastest differs between instances (see `compare_backends.csv`),
+so the portfolio runs a configurable set of them in separate processes on the
+same formula, takes the first definitive answer, and interrupts the others.
+"""
+
+import logging
+import threading
+import typing
+
+from dispersive_agp_solver._utils.timer import Timer as StopWatch
+from dispersive_agp_solver.instance import Instance
+
+from .basic_sat_model import BasicSatModel
+from .sat_worker import SatWorker, wait_for_results
+
+DEFAULT_PORTFOLIO = ("Minicard", "MapleChrono", "Minisat22", "Glucose4")
+# how often the solve loop checks for a timeout (in seconds)
+_POLL_INTERVAL = 0.1
+
+
+class _PortfolioSolver:
+    """
+    Provides the parts of the PySAT solver interface that `BasicSatModel` uses.
+    """
+
+    def __init__(
+        self,
+        solver_names: typing.Sequence[str],
+        logger: typing.Optional[logging.Logger] = None,
+    ) -> None:
+        if not solver_names:
+            msg = "The portfolio needs at least one solver."
+            raise ValueError(msg)
+        self._logger = logger if logger else logging.getLogger("PortfolioSolver")
+        self._workers = [SatWorker(name) for name in solver_names]
+        # `interrupt` and `delete` may be called from other threads (timeout,
+        # service, async) while the solve loop restarts a worker
+        self._workers_lock = threading.Lock()
+        # Workers that cannot be interrupted are restarted instead, for which
+        # the formula has to be replayed.
+        self._clauses: typing.Optional[typing.List[typing.List[int]]] = (
+            None if all(w.interruptible for w in self._workers) else []
+        )
+        self._probe_id = 0
+        # probe id of the last solve call whose result has not been received yet
+        self._outstanding: typing.Dict[SatWorker, int] = {}
+        self._interrupted = threading.Event()
+        self._model: typing.Optional[typing.List[int]] = None
+        self._stats: typing.Dict[str, typing.Any] = {}
+        self._time = 0.0
+        self.wins: typing.Dict[str, int] = {name: 0 for name in solver_names}
+
+    def add_clause(self, clause: typing.Iterable[int]) -> None:
+        clause = list(clause)
+        if self._clauses is not None:
+            self._clauses.append(clause)
+        for worker in self._workers:
+            worker.add_clause(clause)
+
+    def _drain(self, worker: SatWorker) -> None:
+        # results of interrupted probes are still in the pipe
+        while worker in self._outstanding:
+            probe_id, *_ = worker.receive()
+            if probe_id == self._outstanding[worker]:
+                del self._outstanding[worker]
+
+    def _restart(self, worker: SatWorker) -> None:
+        assert self._clauses is not None
+        self._logger.debug("Restarting %s.", worker.solver_name)
+        fresh = SatWorker(worker.solver_name)
+        for clause in self._clauses:
+            fresh.add_clause(clause)
+        with self._workers_lock:
+            self._workers[self._workers.index(worker)] = fresh
+            worker.kill()
+        self._outstanding.pop(worker, None)
+
+    def _cancel(self, workers: typing.List[SatWorker], probe_id: int) -> None:
+        for worker in workers:
+            if worker.interruptible:
+                worker.interrupt(probe_id)
+            else:
+                self._restart(worker)
+
+    def solve(self, assumptions: typing.Sequence[int] = ()) -> typing.Optional[bool]:
+        stop_watch = StopWatch()
+        self._probe_id += 1
+        probe_id = self._probe_id
+        for worker in self._workers:
+            self._drain(worker)
+            worker.start_solve(probe_id, assumptions)
+            self._outstanding[worker] = probe_id
+        self._model = None
+        running = list(self._workers)
+        status = None
+        while status is None and running:
+            if self._interrupted.is_set():
+                # the workers may have missed an interrupt that came before
+                # the probe started, they are cancelled below
+                break
+            for worker in wait_for_results(running, timeout=_POLL_INTERVAL):
+                result_id, result, model, stats = worker.receive()
+                if result_id != probe_id:
+                    continue
+                del self._outstanding[worker]
+                running.remove(worker)
+                if result is not None and status is None:
+                    status, self._model = result, model
+                    self._stats = dict(stats, winner=worker.solver_name)
+                    self.wins[worker.solver_name] += 1
+                    self._logger.info(
+                        "%s answered first (%s).", worker.solver_name, result
+                    )
+        self._cancel(running, probe_id)
+        self._time = stop_watch.time()
+        return status
+
+    def solve_limited(
+        self, assumptions: typing.Sequence[int] = (), expect_interrupt: bool = False
+    ) -> typing.Optional[bool]:
+        return self.solve(assumptions)
+
+    def clear_interrupt(self) -> None:
+        self._interrupted.clear()
+
+    def interrupt(self) -> None:
+        self._interrupted.set()
+        with self._workers_lock:
+            for worker in self._workers:
+                if not worker.interruptible:
+                    continue
+                try:
+                    worker.interrupt(self._probe_id)
+                except (BrokenPipeError, OSError):
+                    # a dead worker has nothing to interrupt
+                    pass
+
+    def get_model(self) -> typing.Optional[typing.List[int]]:
+        return self._model
+
+    def accum_stats(self) -> typing.Dict[str, typing.Any]:
+        return self._stats.copy()
+
+    def time(self) -> float:
+        return self._time
+
+    def reset(self) -> None:
+        for worker in self._workers:
+            self._drain(worker)
+            worker.reset()
+        if self._clauses is not None:
+            self._clauses = []
+        self._model = None
+
+    def delete(self) -> None:
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+            for worker in workers:
+                worker.close()
+        self._outstanding = {}
+
+
+class PortfolioSatModel(BasicSatModel):
+    """
+    Same model as `BasicSatModel`, but every solve call is raced by the
+    `solvers` in separate processes. The processes are kept alive for the
+    lifetime of the model, such that the formula is only transferred once.
+    """
+
+    def __init__(
+        self,
+        instance: Instance,
+        solvers: typing.Sequence[str] = DEFAULT_PORTFOLIO,
+        logger: typing.Optional[logging.Logger] = None,
+        incremental: bool = False,
+    ) -> None:
+        self._portfolio = tuple(solvers)
+        super().__init__(
+            instance, solver="portfolio", logger=logger, incremental=incremental
+        )
+
+    def _create_solver(self):
+        return _PortfolioSolver(self._portfolio, self._logger)
+
+    def _renew_solver(self):
+        # restarting the processes would be more expensive than clearing them
+        self._sat_solver.reset()
+        return self._sat_solver
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["portfolio_wins"] = self._sat_solver.wins.copy()
+        return stats
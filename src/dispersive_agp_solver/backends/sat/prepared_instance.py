@@ -0,0 +1,273 @@
+"""
+Many queries on the same instance, e.g., with some guards forbidden (no power)
+or required (existing sensors), only differ in the guards they allow. The
+preprocessing, the witnesses, and the SAT model are shared by all queries, and
+the restrictions of a query are passed to the solver as assumptions.
+"""
+
+import logging
+import math
+import threading
+import typing
+from enum import Enum
+
+from dispersive_agp_solver._utils import Timer, span
+from dispersive_agp_solver.instance import Instance
+
+from .._common import (
+    Kernel,
+    Preprocessing,
+    PreprocessingCache,
+    ProgressCallback,
+    compute_lower_bound,
+    compute_upper_bound,
+)
+from .distance_optimizer import DistanceOptimizer, SearchStrategy
+from .params import OptimizerParams
+
+
+class PreparedInstance:
+    """
+    Holds the preprocessing and an incremental SAT model of an instance, such
+    that every `solve` only costs the search. The clauses learned by a query
+    are kept for the following ones. Queries are answered one at a time.
+    """
+
+    class Status(Enum):
+        OPTIMAL = 0
+        FEASIBLE = 1
+        UNKNOWN = 2
+        INFEASIBLE = 3
+
+    def __init__(
+        self,
+        instance: Instance,
+        logger: typing.Optional[logging.Logger] = None,
+        params: typing.Optional[OptimizerParams] = None,
+        solver: str = "Glucose4",
+        n_jobs: typing.Optional[int] = 1,
+        witness_fan_out_depth: typing.Optional[int] = None,
+        cache: typing.Optional[PreprocessingCache] = None,
+        distance_engine: str = "visibility",
+        low_memory: bool = False,
+        kernelize: bool = True,
+        warm_start: bool = True,
+        preprocessing: typing.Optional[Preprocessing] = None,
+    ) -> None:
+        """
+        The arguments are the same as for `SatBasedOptimizer`. The SAT model is
+        always incremental, and the search strategy PARALLEL is not supported.
+        """
+        self._logger = logger if logger else logging.getLogger("PreparedInstance")
+        self.params = params if params else OptimizerParams()
+        if self.params.search_strategy_start == SearchStrategy.PARALLEL:
+            msg = "The PARALLEL search does not support guard restrictions."
+            raise ValueError(msg)
+        self.solver = solver
+        self.instance = instance
+        self._warm_start = warm_start
+        self._preprocessing = (
+            preprocessing
+            if preprocessing is not None
+            else Preprocessing(
+                instance,
+                logger=self._logger,
+                n_jobs=n_jobs,
+                witness_fan_out_depth=witness_fan_out_depth,
+                cache=cache,
+                distance_engine=distance_engine,
+                low_memory=low_memory,
+            )
+        )
+        self._guard_distances = self._preprocessing.guard_distances
+        stop_watch = Timer()
+        with span("prepare_instance", solver=solver):
+            self._lazy_coverage = None
+            if self.params.lazy_coverage:
+                self._lazy_coverage = self._preprocessing.get_lazy_coverage()
+                witnesses = self._lazy_coverage.get_seed_witnesses()
+                self._kernel = (
+                    Kernel(witnesses, self._guard_distances) if kernelize else None
+                )
+            elif kernelize:
+                self._kernel = self._preprocessing.get_kernel()
+                witnesses = self._kernel.witnesses
+            else:
+                self._kernel = None
+                witnesses = self._preprocessing.get_shadow_witnesses()
+            # all witnesses of the model, including the coverage cuts
+            self._witness_guards = [list(guards) for _, guards in witnesses]
+            self._dist_optimizer = DistanceOptimizer(
+                instance,
+                logger=self._logger,
+                guard_distances=self._guard_distances,
+                solver=solver,
+                incremental=True,
+                portfolio_solvers=self.params.portfolio_solvers,
+                kernel=self._kernel,
+                local_search_time=self.params.local_search_time,
+            )
+            for guards in self._witness_guards:
+                self._dist_optimizer.add_coverage_constraint(guards)
+        self._lock = threading.Lock()
+        self.solution: typing.List[int] = []
+        self.objective = 0.0
+        self.upper_bound = math.inf
+        self._stats = self._preprocessing.get_stats()
+        self._stats["time_prepare_instance"] = stop_watch.time()
+        self._stats["queries"] = []
+        self._logger.info("Prepared instance for queries.")
+
+    def _check_coverage(
+        self, guards: typing.List[int]
+    ) -> typing.List[typing.List[int]]:
+        assert self._lazy_coverage is not None
+        cuts = self._lazy_coverage(guards)
+        self._witness_guards.extend(cuts)
+        return cuts
+
+    def _restrict_witnesses(
+        self, forbidden: typing.Set[int], required: typing.Set[int]
+    ) -> typing.Optional[typing.List[typing.List[int]]]:
+        """
+        The guard sets without the forbidden guards and a witness for every
+        required guard, or None if a witness is left without guards.
+        """
+        restricted = [
+            [g for g in guards if g not in forbidden] for guards in self._witness_guards
+        ]
+        restricted.extend([g] for g in sorted(required))
+        if not all(restricted):
+            return None
+        return restricted
+
+    def _apply_warm_start(
+        self,
+        restricted: typing.List[typing.List[int]],
+        forbidden: typing.Set[int],
+    ) -> bool:
+        """
+        Start from a greedy solution of the restricted witnesses. Returns False
+        if a coverage cut shows that the restrictions leave no solution.
+        """
+        while True:
+            _, solution = compute_lower_bound(
+                restricted, self._guard_distances, self._dist_optimizer.upper_bound
+            )
+            cuts = self._check_coverage(solution) if self._lazy_coverage else []
+            if not cuts:
+                break
+            for cut in cuts:
+                self._dist_optimizer.add_coverage_constraint(cut)
+                allowed = [g for g in cut if g not in forbidden]
+                if not allowed:
+                    return False
+                restricted.append(allowed)
+        self._dist_optimizer.set_initial_solution(solution)
+        return True
+
+    def solve(
+        self,
+        forbidden: typing.Iterable[int] = (),
+        required: typing.Iterable[int] = (),
+        allowed: typing.Optional[typing.Iterable[int]] = None,
+        time_limit: float = 900,
+        opt_tol: float = 0.0001,
+        progress_callback: typing.Optional[ProgressCallback] = None,
+    ) -> "PreparedInstance.Status":
+        """
+        Solve the instance without the `forbidden` guards and with all the
+        `required` guards. If `allowed` is given (e.g., the vertices of a
+        zone), all other guards are forbidden, too. The result is in
+        `solution`, `objective`, and `upper_bound`.
+        """
+        n = self.instance.num_positions()
+        forbidden = set(forbidden)
+        if allowed is not None:
+            forbidden |= set(range(n)) - set(allowed)
+        required = set(required)
+        if not all(0 <= g < n for g in forbidden | required):
+            msg = "Guard restrictions contain invalid vertices."
+            raise ValueError(msg)
+        if forbidden & required:
+            msg = "A guard cannot be both forbidden and required."
+            raise ValueError(msg)
+        with self._lock, span(
+            "prepared_query", num_forbidden=len(forbidden), num_required=len(required)
+        ) as current:
+            status = self._solve(
+                forbidden, required, time_limit, opt_tol, progress_callback
+            )
+            current.set(status=status.name, objective=self.objective)
+        return status
+
+    def _solve(
+        self,
+        forbidden: typing.Set[int],
+        required: typing.Set[int],
+        time_limit: float,
+        opt_tol: float,
+        progress_callback: typing.Optional[ProgressCallback],
+    ) -> "PreparedInstance.Status":
+        timer = Timer(time_limit)
+        dist_optimizer = self._dist_optimizer
+        dist_optimizer.set_guard_restrictions(sorted(forbidden), sorted(required))
+        self.solution, self.objective, self.upper_bound = [], 0.0, math.inf
+        status = PreparedInstance.Status.UNKNOWN
+        try:
+            restricted = self._restrict_witnesses(forbidden, required)
+            feasible = restricted is not None
+            if feasible:
+                if self._kernel is not None:
+                    dist_optimizer.add_upper_bound(self._kernel.upper_bound())
+                if self.params.compute_bounds:
+                    dist_optimizer.add_upper_bound(
+                        compute_upper_bound(restricted, self._guard_distances)
+                    )
+                if self._warm_start:
+                    feasible = self._apply_warm_start(restricted, forbidden)
+            if feasible:
+                feasible = dist_optimizer.solve(
+                    timer=timer,
+                    callback=self._check_coverage if self._lazy_coverage else None,
+                    search_strategy=self.params.search_strategy_start,
+                    opt_tol=opt_tol,
+                    progress_callback=progress_callback,
+                )
+            if feasible:
+                status = PreparedInstance.Status.OPTIMAL
+            else:
+                self._logger.info("No solution satisfies the guard restrictions.")
+                dist_optimizer.upper_bound = 0.0
+                status = PreparedInstance.Status.INFEASIBLE
+        except TimeoutError:
+            self._logger.info("Timelimit reached.")
+            if dist_optimizer.objective > 0:
+                status = (
+                    PreparedInstance.Status.OPTIMAL
+                    if dist_optimizer.objective == dist_optimizer.upper_bound
+                    else PreparedInstance.Status.FEASIBLE
+                )
+        if status in (
+            PreparedInstance.Status.OPTIMAL,
+            PreparedInstance.Status.FEASIBLE,
+        ):
+            self.solution = dist_optimizer.solution
+            self.objective = dist_optimizer.objective
+        self.upper_bound = dist_optimizer.upper_bound
+        self._stats["queries"].append(
+            {
+                "num_forbidden": len(forbidden),
+                "num_required": len(required),
+                "status": status.name,
+                "objective": self.objective,
+                "upper_bound": self.upper_bound,
+                "time": timer.time(),
+            }
+        )
+        return status
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        stats: dict = self._stats.copy()
+        stats["solver"] = self._dist_optimizer.get_stats()
+        return stats
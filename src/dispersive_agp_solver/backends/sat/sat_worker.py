@@ -0,0 +1,181 @@
+"""
+A PySAT solver running in a separate process.
+
+The worker keeps its formula between solve calls, so clauses only have to be sent
+once, and a running solve call can be interrupted from the controlling process.
+This is the building block for racing several solvers on the same probe or
+probing several thresholds at once.
+"""
+
+import multiprocessing
+import queue
+import threading
+import typing
+from multiprocessing.connection import Connection, wait
+
+from pysat.solvers import Solver
+
+# Clauses are buffered and sent in batches of this size.
+_CLAUSE_BATCH_SIZE = 10_000
+
+
+def is_interruptible(solver: Solver) -> bool:
+    try:
+        solver.clear_interrupt()
+    except NotImplementedError:  # e.g., CaDiCaL and Lingeling
+        return False
+    return True
+
+
+def _run_worker(conn: Connection, solver_name: str) -> None:
+    solver = Solver(name=solver_name, incr=False)
+    interruptible = is_interruptible(solver)
+    conn.send(("ready", interruptible))
+    commands: "queue.Queue[tuple]" = queue.Queue()
+    lock = threading.Lock()
+    running_probe: typing.List[typing.Optional[int]] = [None]
+    # Probe ids only increase, so an interrupt that arrives before its solve
+    # call has started can be remembered as a single number.
+    cancelled_up_to = [-1]
+
+    def listen() -> None:
+        # Interrupts have to be handled while the main thread is solving.
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                commands.put(("stop",))
+                return
+            if message[0] == "interrupt":
+                with lock:
+                    cancelled_up_to[0] = max(cancelled_up_to[0], message[1])
+                    if interruptible and running_probe[0] == message[1]:
+                        solver.interrupt()
+                continue
+            commands.put(message)
+            if message[0] == "stop":
+                return
+
+    threading.Thread(target=listen, daemon=True).start()
+    while True:
+        message = commands.get()
+        if message[0] == "clauses":
+            for clause in message[1]:
+                solver.add_clause(clause)
+        elif message[0] == "reset":
+            with lock:
+                solver.delete()
+                solver = Solver(name=solver_name, incr=False)
+        elif message[0] == "solve":
+            probe_id, assumptions = message[1], message[2]
+            with lock:
+                cancelled = probe_id <= cancelled_up_to[0]
+                if not cancelled:
+                    if interruptible:
+                        solver.clear_interrupt()
+                    running_probe[0] = probe_id
+            if cancelled:
+                conn.send(("result", probe_id, None, None, solver.accum_stats()))
+                continue
+            if interruptible:
+                status = solver.solve_limited(
+                    assumptions=assumptions, expect_interrupt=True
+                )
+            else:
+                status = solver.solve(assumptions=assumptions)
+            with lock:
+                running_probe[0] = None
+            model = solver.get_model() if status else None
+            conn.send(("result", probe_id, status, model, solver.accum_stats()))
+        else:
+            assert message[0] == "stop"
+            solver.delete()
+            conn.close()
+            return
+
+
+class SatWorker:
+    """
+    Handle to a solver process. All clauses are buffered and sent right before
+    the next solve call. Some PySAT backends cannot be interrupted
+    (`interruptible` is False); such a worker can only be stopped via `kill`.
+    """
+
+    def __init__(self, solver_name: str) -> None:
+        self.solver_name = solver_name
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_run_worker,
+            args=(child_conn, solver_name),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        _, self.interruptible = self._conn.recv()
+        # the solve loop and the timeout thread may send concurrently
+        self._send_lock = threading.Lock()
+        self._pending_clauses: typing.List[typing.List[int]] = []
+
+    @property
+    def connection(self) -> Connection:
+        return self._conn
+
+    def _send(self, message: tuple) -> None:
+        with self._send_lock:
+            self._conn.send(message)
+
+    def add_clause(self, clause: typing.Iterable[int]) -> None:
+        self._pending_clauses.append(list(clause))
+        if len(self._pending_clauses) >= _CLAUSE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending_clauses:
+            self._send(("clauses", self._pending_clauses))
+            self._pending_clauses = []
+
+    def reset(self) -> None:
+        self._pending_clauses = []
+        self._send(("reset",))
+
+    def start_solve(self, probe_id: int, assumptions: typing.Sequence[int]) -> None:
+        self.flush()
+        self._send(("solve", probe_id, list(assumptions)))
+
+    def interrupt(self, probe_id: int) -> None:
+        self._send(("interrupt", probe_id))
+
+    def receive(
+        self,
+    ) -> typing.Tuple[int, typing.Optional[bool], typing.Optional[typing.List[int]], dict]:
+        """
+        (probe id, status, model, statistics) of a finished solve call.
+        """
+        _, probe_id, status, model, stats = self._conn.recv()
+        return probe_id, status, model, stats
+
+    def kill(self) -> None:
+        self._process.terminate()
+        self._process.join()
+        self._conn.close()
+
+    def close(self) -> None:
+        try:
+            self._send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._conn.close()
+
+
+def wait_for_results(
+    workers: typing.Iterable[SatWorker], timeout: typing.Optional[float] = None
+) -> typing.List[SatWorker]:
+    """
+    The workers that have a result ready to be received.
+    """
+    by_connection = {worker.connection: worker for worker in workers}
+    return [by_connection[c] for c in wait(list(by_connection), timeout=timeout)]
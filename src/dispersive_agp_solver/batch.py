@@ -0,0 +1,206 @@
+"""
+Solve whole collections of instances, e.g., the office-like instances in
+`evaluation/office_like_instances/instance_collection`.
+
+All `.graphml.xz` files below a directory are solved on a process pool, and one
+row per instance and backend is appended to a CSV or JSONL file (depending on
+its suffix) as soon as it is available, using the schema of
+`evaluation/benchmark/compare_backends.csv`. Instances that are already in the
+output are skipped, so an interrupted batch can simply be restarted.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from ._utils import Timer, effective_n_jobs
+from .backends import PreprocessingCache, create_optimizer
+from .instance import get_instance_from_graphml_xz
+
+FIELDS = ("instance", "size", "backend", "runtime", "optimal")
+_SUFFIX = ".graphml.xz"
+
+
+def instance_name(path: typing.Union[str, Path]) -> str:
+    name = Path(path).name
+    return name[: -len(_SUFFIX)] if name.endswith(_SUFFIX) else name
+
+
+def find_instances(root: typing.Union[str, Path]) -> typing.List[Path]:
+    """
+    All instance files below the directory, in a deterministic order.
+    """
+    return sorted(Path(root).rglob(f"*{_SUFFIX}"))
+
+
+def _is_jsonl(output: Path) -> bool:
+    return output.suffix in (".jsonl", ".json")
+
+
+def read_solved(output: typing.Union[str, Path]) -> typing.Set[typing.Tuple[str, str]]:
+    """
+    The (instance, backend) pairs that are already in the output.
+    """
+    output = Path(output)
+    if not output.exists():
+        return set()
+    with output.open(newline="") as f:
+        if _is_jsonl(output):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return {(row["instance"], row["backend"]) for row in rows}
+
+
+class _RowWriter:
+    def __init__(self, output: Path) -> None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not output.exists() or output.stat().st_size == 0
+        self._file = output.open("a", newline="")
+        self._jsonl = _is_jsonl(output)
+        if not self._jsonl:
+            self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+            if is_new:
+                self._writer.writeheader()
+
+    def write(self, row: typing.Dict[str, typing.Any]) -> None:
+        if self._jsonl:
+            self._file.write(json.dumps(row) + "\n")
+        else:
+            self._writer.writerow(row)
+        # make every row durable for resuming
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _solve_task(
+    task: typing.Tuple[str, str, float, float, typing.Optional[str], dict]
+) -> typing.Dict[str, typing.Any]:
+    path, backend, time_limit, opt_tol, cache_dir, params = task
+    stop_watch = Timer()
+    instance = get_instance_from_graphml_xz(path)
+    optimizer = create_optimizer(
+        instance,
+        backend=backend,
+        cache=PreprocessingCache(cache_dir) if cache_dir else None,
+        **params,
+    )
+    status = optimizer.solve(time_limit, opt_tol)
+    return {
+        "instance": instance_name(path),
+        "size": instance.num_positions(),
+        "backend": backend,
+        "runtime": stop_watch.time(),
+        "optimal": status.name == "OPTIMAL",
+    }
+
+
+def solve_batch(
+    root: typing.Union[str, Path],
+    output: typing.Union[str, Path],
+    backends: typing.Sequence[str] = ("SAT[Glucose4]",),
+    time_limit: float = 900.0,
+    opt_tol: float = 0.0001,
+    n_jobs: typing.Optional[int] = -1,
+    cache_dir: typing.Optional[typing.Union[str, Path]] = None,
+    logger: typing.Optional[logging.Logger] = None,
+    **params,
+) -> int:
+    """
+    Solve every instance below `root` with every backend, using `n_jobs`
+    processes (-1 for all cores) and `time_limit` seconds per instance.
+    Further keyword arguments are passed to the backends. Returns the number
+    of rows written. Failed instances are logged and left out of the output,
+    such that they are retried when the batch is resumed.
+    """
+    logger = logger if logger else logging.getLogger("BatchSolver")
+    output = Path(output)
+    solved = read_solved(output)
+    tasks = [
+        (
+            str(path),
+            backend,
+            time_limit,
+            opt_tol,
+            str(cache_dir) if cache_dir else None,
+            params,
+        )
+        for path in find_instances(root)
+        for backend in backends
+        if (instance_name(path), backend) not in solved
+    ]
+    logger.info(
+        "Solving %d instances (%d already in %s).", len(tasks), len(solved), output
+    )
+    writer = _RowWriter(output)
+    num_written = 0
+    try:
+        with ProcessPoolExecutor(max_workers=effective_n_jobs(n_jobs)) as pool:
+            futures = {pool.submit(_solve_task, task): task for task in tasks}
+            for future in as_completed(futures):
+                path, backend = futures[future][:2]
+                try:
+                    row = future.result()
+                except Exception:
+                    logger.exception("Failed to solve %s with %s.", path, backend)
+                    continue
+                writer.write(row)
+                num_written += 1
+                logger.info(
+                    "[%d/%d] %s (%s): %.2fs",
+                    num_written,
+                    len(tasks),
+                    row["instance"],
+                    backend,
+                    row["runtime"],
+                )
+    finally:
+        writer.close()
+    return num_written
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Solve all .graphml.xz instances below a directory."
+    )
+    parser.add_argument("root", help="directory with the instances")
+    parser.add_argument("output", help="result file (.csv or .jsonl)")
+    parser.add_argument(
+        "--backend",
+        action="append",
+        dest="backends",
+        help="backend to use, can be given multiple times (default: SAT[Glucose4])",
+    )
+    parser.add_argument("--time-limit", type=float, default=900.0)
+    parser.add_argument("--opt-tol", type=float, default=0.0001)
+    parser.add_argument(
+        "--n-jobs", type=int, default=-1, help="number of processes (-1: all cores)"
+    )
+    parser.add_argument("--cache-dir", help="directory of a preprocessing cache")
+    parser.add_argument(
+        "--distance-engine",
+        choices=("visibility", "rectilinear"),
+        default="visibility",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    solve_batch(
+        args.root,
+        args.output,
+        backends=args.backends or ["SAT[Glucose4]"],
+        time_limit=args.time_limit,
+        opt_tol=args.opt_tol,
+        n_jobs=args.n_jobs,
+        cache_dir=args.cache_dir,
+        distance_engine=args.distance_engine,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 import typing
 import networkx as nx
 import lzma
@@ -32,6 +33,32 @@ class Instance:
     def num_positions(self) -> int:
         return len(self.positions)
 
+    def fingerprint(self) -> str:
+        """
+        A content hash of positions, boundary, and holes. It does not depend on the
+        orientation or the starting vertex of the boundary and the holes, such that
+        it stays the same after `as_cgal_polygon` normalized the orientation.
+        """
+        h = hashlib.sha256()
+        h.update(repr([tuple(p) for p in self.positions]).encode())
+        h.update(repr(_canonical_cycle(self.boundary)).encode())
+        h.update(repr(sorted(_canonical_cycle(hole) for hole in self.holes)).encode())
+        return h.hexdigest()
+
+    def diff(self, edited: "Instance") -> "InstanceDiff":
+        """
+        The changes from this instance to an edited version of it, e.g., with a
+        moved wall or a further hole. See `InstanceDiff`.
+        """
+        return InstanceDiff(self, edited)
+
+    def _edges(self) -> typing.Set[typing.FrozenSet[Position]]:
+        return {
+            frozenset((tuple(self.positions[a]), tuple(self.positions[b])))
+            for cycle in (self.boundary, *self.holes)
+            for a, b in zip(cycle, cycle[1:] + cycle[:1])
+        }
+
     def as_cgal_position(self, i: int) -> Point:
         return Point(self.positions[i][0], self.positions[i][1])
 
@@ -56,6 +83,60 @@ class Instance:
             raise ValueError(msg)
         return PolygonWithHoles(boundary, holes)
 
+
+class InstanceDiff:
+    """
+    Matches the vertices of two versions of an instance by their coordinates.
+    Both polygons agree outside of the `changed_region`, the bounding box of
+    all boundary edges that are only in one of them (None if there are none).
+    """
+
+    def __init__(self, old: Instance, new: Instance) -> None:
+        self.old = old
+        self.new = new
+        new_indices = {tuple(p): i for i, p in enumerate(new.positions)}
+        # old index -> new index of the vertices in both versions
+        self.old_to_new: typing.Dict[int, int] = {
+            i: new_indices[tuple(p)]
+            for i, p in enumerate(old.positions)
+            if tuple(p) in new_indices
+        }
+        self.removed = sorted(set(range(old.num_positions())) - set(self.old_to_new))
+        self.added = sorted(
+            set(range(new.num_positions())) - set(self.old_to_new.values())
+        )
+        changed_edges = old._edges() ^ new._edges()
+        self.changed_region: typing.Optional[
+            typing.Tuple[float, float, float, float]
+        ] = None
+        if changed_edges:
+            xs = [p[0] for edge in changed_edges for p in edge]
+            ys = [p[1] for edge in changed_edges for p in edge]
+            self.changed_region = (min(xs), min(ys), max(xs), max(ys))
+
+    def is_empty(self) -> bool:
+        return self.changed_region is None
+
+    def __repr__(self) -> str:
+        return (
+            f"InstanceDiff(changed_region={self.changed_region}, "
+            f"removed={len(self.removed)}, added={len(self.added)})"
+        )
+
+
+def _canonical_cycle(cycle: typing.List[int]) -> typing.Tuple[int, ...]:
+    """
+    Rotate the cycle to start at its smallest index and choose the direction
+    with the smaller successor.
+    """
+    if not cycle:
+        return ()
+    start = cycle.index(min(cycle))
+    forward = cycle[start:] + cycle[:start]
+    backward = [forward[0]] + forward[:0:-1]
+    return tuple(min(forward, backward))
+
+
 def get_instance_from_graphml_xz(filepath):
     assert Path(filepath).is_file()
     with open(filepath, "rb") as fp:
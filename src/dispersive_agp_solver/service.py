@@ -0,0 +1,475 @@
+"""
+A long-running solver service for many queries on the same floor plans.
+
+The process keeps the backends imported and the preprocessing (distances,
+witnesses, and their kernel) of the recently used instances in memory, such
+that a repeated query only pays for the search. Jobs are queued to a bounded
+pool of worker threads (the SAT solvers, CP-SAT, and Gurobi release the GIL),
+and their progress and results are available by job id.
+
+`SolverService` can be used directly from Python. `create_server` exposes it
+as HTTP/JSON API on localhost:
+
+    POST   /jobs       {"instance": {...}, "backend": ..., "time_limit": ...}
+    GET    /jobs/<id>  status, latest progress, and result of the job
+    DELETE /jobs/<id>  cancel the job
+    GET    /stats      queue and preprocessing cache statistics
+
+Instances are given as `{"positions": [[x, y], ...], "boundary": [...],
+"holes": [[...], ...]}` (see `Instance`). Infinite objectives and bounds are
+encoded as null.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import math
+import threading
+import typing
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ._utils import Timer
+from .backends import Progress, create_optimizer
+from .backends._common import Preprocessing, PreprocessingCache
+from .instance import Instance
+
+# keyword arguments of the backends that are fixed by the service
+_SERVICE_PARAMS = (
+    "logger",
+    "n_jobs",
+    "witness_fan_out_depth",
+    "cache",
+    "low_memory",
+    "preprocessing",
+)
+
+
+class QueueFullError(RuntimeError):
+    """
+    The service does not accept further jobs until some are finished.
+    """
+
+
+def instance_from_json(data: typing.Dict[str, typing.Any]) -> Instance:
+    try:
+        positions = [(p[0], p[1]) for p in data["positions"]]
+        boundary = [int(i) for i in data["boundary"]]
+        holes = [[int(i) for i in hole] for hole in data.get("holes", [])]
+    except (KeyError, IndexError, TypeError) as e:
+        msg = f"Invalid instance: {e}"
+        raise ValueError(msg) from e
+    return Instance(positions, boundary, holes)
+
+
+def instance_to_json(instance: Instance) -> typing.Dict[str, typing.Any]:
+    return {
+        "positions": [list(p) for p in instance.positions],
+        "boundary": list(instance.boundary),
+        "holes": [list(hole) for hole in instance.holes],
+    }
+
+
+def _finite(value: float) -> typing.Optional[float]:
+    return float(value) if math.isfinite(value) else None
+
+
+class _Job:
+    def __init__(
+        self,
+        job_id: str,
+        instance: Instance,
+        backend: str,
+        time_limit: float,
+        opt_tol: float,
+        params: typing.Dict[str, typing.Any],
+    ) -> None:
+        self.job_id = job_id
+        self.instance = instance
+        self.backend = backend
+        self.time_limit = time_limit
+        self.opt_tol = opt_tol
+        self.params = params
+        # queued -> running -> done/failed/cancelled
+        self.status = "queued"
+        self.progress: typing.Optional[Progress] = None
+        self.result: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self.error: typing.Optional[str] = None
+        self.optimizer: typing.Any = None
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+
+    def to_json(self) -> typing.Dict[str, typing.Any]:
+        progress = None
+        if self.progress is not None:
+            progress = {
+                "objective": _finite(self.progress.objective),
+                "upper_bound": _finite(self.progress.upper_bound),
+                "gap": _finite(self.progress.gap),
+                "time": self.progress.time,
+            }
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "backend": self.backend,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class SolverService:
+    """
+    Runs jobs on `max_workers` threads and keeps the preprocessing of the
+    `max_instances` most recently used instances. At most `max_queued_jobs`
+    jobs wait for a worker, and the `max_finished_jobs` latest finished jobs
+    can be queried.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_instances: int = 16,
+        max_queued_jobs: int = 100,
+        max_finished_jobs: int = 1000,
+        n_jobs: typing.Optional[int] = 1,
+        witness_fan_out_depth: typing.Optional[int] = None,
+        cache: typing.Optional[PreprocessingCache] = None,
+        low_memory: bool = False,
+        logger: typing.Optional[logging.Logger] = None,
+    ) -> None:
+        """
+        `n_jobs`, `witness_fan_out_depth`, `cache`, and `low_memory` are used
+        for the preprocessing of new instances, see `solve`.
+        """
+        self._logger = logger if logger else logging.getLogger("SolverService")
+        self._max_instances = max_instances
+        self._max_queued_jobs = max_queued_jobs
+        self._max_finished_jobs = max_finished_jobs
+        self._n_jobs = n_jobs
+        self._witness_fan_out_depth = witness_fan_out_depth
+        self._cache = cache
+        self._low_memory = low_memory
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="solver"
+        )
+        self._lock = threading.Lock()
+        self._jobs: typing.Dict[str, _Job] = {}
+        self._finished: typing.Deque[str] = collections.deque()
+        # (fingerprint, distance engine) -> preprocessing, least recently used first
+        self._preprocessings: "collections.OrderedDict[tuple, Future]" = (
+            collections.OrderedDict()
+        )
+        self._stats = {
+            "num_jobs": 0,
+            "preprocessing_hits": 0,
+            "preprocessing_misses": 0,
+        }
+
+    def submit(
+        self,
+        instance: Instance,
+        backend: str = "SAT[Glucose4]",
+        time_limit: float = 900.0,
+        opt_tol: float = 0.0001,
+        **params,
+    ) -> str:
+        """
+        Queue a solve of the instance and return the id of the job. Further
+        keyword arguments are passed to the backend, see `solve`.
+        """
+        fixed = [p for p in _SERVICE_PARAMS if p in params]
+        if fixed:
+            msg = f"Parameters {fixed} are set by the service."
+            raise ValueError(msg)
+        if time_limit <= 0:
+            msg = "time_limit must be positive"
+            raise ValueError(msg)
+        with self._lock:
+            num_queued = sum(job.status == "queued" for job in self._jobs.values())
+            if num_queued >= self._max_queued_jobs:
+                msg = "Too many queued jobs."
+                raise QueueFullError(msg)
+            job = _Job(uuid.uuid4().hex, instance, backend, time_limit, opt_tol, params)
+            self._jobs[job.job_id] = job
+            self._stats["num_jobs"] += 1
+        self._pool.submit(self._run, job)
+        self._logger.info("Queued job %s (%s).", job.job_id, backend)
+        return job.job_id
+
+    def _get_job(self, job_id: str) -> _Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            msg = f"Unknown job {job_id}"
+            raise KeyError(msg)
+        return job
+
+    def status(self, job_id: str) -> typing.Dict[str, typing.Any]:
+        return self._get_job(job_id).to_json()
+
+    def wait(
+        self, job_id: str, timeout: typing.Optional[float] = None
+    ) -> typing.Dict[str, typing.Any]:
+        """
+        The status of the job once it is finished (or the timeout is over).
+        """
+        job = self._get_job(job_id)
+        job.finished.wait(timeout)
+        return job.to_json()
+
+    def cancel(self, job_id: str) -> typing.Dict[str, typing.Any]:
+        """
+        Stop the job. A running search is interrupted and keeps the best
+        solution found so far as result.
+        """
+        job = self._get_job(job_id)
+        with self._lock:
+            job.cancelled.set()
+            if job.optimizer is not None:
+                job.optimizer.interrupt()
+        return job.to_json()
+
+    def get_preprocessing(
+        self, instance: Instance, distance_engine: str = "visibility"
+    ) -> Preprocessing:
+        """
+        The preprocessing of the instance, from memory if it was used recently.
+        Only the first of concurrent requests for a new instance computes it.
+        """
+        key = (instance.fingerprint(), distance_engine)
+        with self._lock:
+            future = self._preprocessings.get(key)
+            is_new = future is None
+            if is_new:
+                future = Future()
+                self._preprocessings[key] = future
+                while len(self._preprocessings) > self._max_instances:
+                    self._preprocessings.popitem(last=False)
+                self._stats["preprocessing_misses"] += 1
+            else:
+                self._preprocessings.move_to_end(key)
+                self._stats["preprocessing_hits"] += 1
+        if is_new:
+            try:
+                future.set_result(
+                    Preprocessing(
+                        instance,
+                        logger=self._logger.getChild("Preprocessing"),
+                        n_jobs=self._n_jobs,
+                        witness_fan_out_depth=self._witness_fan_out_depth,
+                        cache=self._cache,
+                        distance_engine=distance_engine,
+                        low_memory=self._low_memory,
+                    )
+                )
+            except BaseException as e:
+                with self._lock:
+                    if self._preprocessings.get(key) is future:
+                        del self._preprocessings[key]
+                future.set_exception(e)
+        return future.result()
+
+    def _run(self, job: _Job) -> None:
+        stop_watch = Timer()
+        try:
+            if job.cancelled.is_set():
+                job.status = "cancelled"
+                return
+            job.status = "running"
+            preprocessing = self.get_preprocessing(
+                job.instance, job.params.get("distance_engine", "visibility")
+            )
+            optimizer = create_optimizer(
+                preprocessing.instance,
+                backend=job.backend,
+                logger=self._logger.getChild(job.job_id[:8]),
+                preprocessing=preprocessing,
+                **job.params,
+            )
+            with self._lock:
+                job.optimizer = optimizer
+                if job.cancelled.is_set():
+                    optimizer.interrupt()
+
+            def report(progress: Progress) -> bool:
+                job.progress = progress
+                return job.cancelled.is_set()
+
+            status = optimizer.solve(
+                job.time_limit, job.opt_tol, progress_callback=report
+            )
+            solution = optimizer.solution if optimizer.solution is not None else []
+            job.result = {
+                "solution": [int(g) for g in solution],
+                "objective": _finite(optimizer.objective),
+                "upper_bound": _finite(optimizer.upper_bound),
+                "optimal": status.name == "OPTIMAL",
+                "runtime": stop_watch.time(),
+            }
+            job.status = "cancelled" if job.cancelled.is_set() else "done"
+        except Exception as e:
+            self._logger.exception("Job %s failed.", job.job_id)
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.optimizer = None
+            job.finished.set()
+            self._forget_finished(job)
+            self._logger.info("Job %s is %s.", job.job_id, job.status)
+
+    def _forget_finished(self, job: _Job) -> None:
+        with self._lock:
+            self._finished.append(job.job_id)
+            while len(self._finished) > self._max_finished_jobs:
+                self._jobs.pop(self._finished.popleft(), None)
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        with self._lock:
+            statuses = collections.Counter(job.status for job in self._jobs.values())
+            return self._stats | {
+                "num_instances": len(self._preprocessings),
+                "num_queued": statuses["queued"],
+                "num_running": statuses["running"],
+            }
+
+    def handle(
+        self, method: str, path: str, body: typing.Optional[typing.Dict] = None
+    ) -> typing.Tuple[int, typing.Dict[str, typing.Any]]:
+        """
+        Answer an API request with (HTTP status, JSON response), without the
+        HTTP layer.
+        """
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        try:
+            if method == "POST" and parts == ["jobs"]:
+                body = dict(body or {})
+                instance = instance_from_json(body.pop("instance", None) or {})
+                params = body.pop("params", {})
+                job_id = self.submit(instance, **body, **params)
+                return 202, {"job_id": job_id}
+            if method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+                return 200, self.status(parts[1])
+            if method == "DELETE" and len(parts) == 2 and parts[0] == "jobs":
+                return 200, self.cancel(parts[1])
+            if method == "GET" and parts == ["stats"]:
+                return 200, self.get_stats()
+        except KeyError as e:
+            return 404, {"error": str(e.args[0])}
+        except QueueFullError as e:
+            return 503, {"error": str(e)}
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}
+        return 404, {"error": f"No such endpoint: {method} {path}"}
+
+    def shutdown(self) -> None:
+        """
+        Cancel all jobs and wait for the workers.
+        """
+        with self._lock:
+            jobs = list(self._jobs)
+        for job_id in jobs:
+            self.cancel(job_id)
+        self._pool.shutdown(wait=True)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def _respond(self, method: str) -> None:
+        body = None
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except json.JSONDecodeError as e:
+                self._send(400, {"error": f"Invalid JSON: {e}"})
+                return
+        self._send(*self.server.service.handle(method, self.path, body))
+
+    def _send(self, status: int, response: typing.Dict[str, typing.Any]) -> None:
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._respond("GET")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._respond("POST")
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._respond("DELETE")
+
+    def log_message(self, format: str, *args: typing.Any) -> None:  # noqa: A002
+        logging.getLogger("SolverService").debug(format, *args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: typing.Tuple[str, int], service: SolverService):
+        super().__init__(address, _RequestHandler)
+        self.service = service
+
+
+def create_server(
+    service: SolverService, host: str = "127.0.0.1", port: int = 8000
+) -> ThreadingHTTPServer:
+    """
+    An HTTP server for the service, started with `serve_forever()`. With port
+    0, a free port is chosen (see `server_address`).
+    """
+    return _Server((host, port), service)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve the solver as HTTP/JSON API on localhost."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of jobs solved at once"
+    )
+    parser.add_argument(
+        "--max-instances",
+        type=int,
+        default=16,
+        help="number of preprocessed instances kept in memory",
+    )
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=1,
+        help="number of processes for the preprocessing (-1: all cores)",
+    )
+    parser.add_argument("--cache-dir", help="directory of a preprocessing cache")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    service = SolverService(
+        max_workers=args.workers,
+        max_instances=args.max_instances,
+        n_jobs=args.n_jobs,
+        cache=PreprocessingCache(args.cache_dir) if args.cache_dir else None,
+    )
+    server = create_server(service, args.host, args.port)
+    logging.getLogger("SolverService").info(
+        "Listening on http://%s:%d", *server.server_address[:2]
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
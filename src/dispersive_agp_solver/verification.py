@@ -0,0 +1,137 @@
+"""
+Independent verification of solutions, e.g., to re-validate stored guard sets
+after upgrading dependencies.
+
+Only the visibility polygons of the given guards are computed, and the
+uncovered area is the polygon minus these visibility polygons (see
+`subtract_polygons`). The dispersion distance is recomputed from the distance
+matrix in the preprocessing cache, if available, and otherwise with one
+shortest path search per guard on the rectilinear path graph.
+"""
+
+import logging
+import math
+import typing
+
+import numpy as np
+from rvispoly import PolygonWithHoles, VisibilityPolygonCalculator
+
+from ._utils.timer import Timer as StopWatch
+from ._utils.tracing import span
+from .backends._common import GuardDistances, PreprocessingCache
+from .backends._common.guard_coverage import subtract_polygons
+from .instance import Instance
+
+
+class VerificationResult:
+    """
+    The outcome of `verify`. It is truthy iff the solution is valid.
+    """
+
+    def __init__(
+        self,
+        uncovered_regions: typing.List[PolygonWithHoles],
+        objective: float,
+        expected_objective: typing.Optional[float],
+        tolerance: float,
+        stats: typing.Dict[str, typing.Any],
+    ) -> None:
+        self.uncovered_regions = uncovered_regions
+        self.uncovered_area = sum(float(r.area()) for r in uncovered_regions)
+        self.is_covered = not uncovered_regions
+        self.objective = objective
+        self.objective_matches: typing.Optional[bool] = None
+        if expected_objective is not None:
+            self.objective_matches = objective == expected_objective or (
+                abs(objective - expected_objective) <= tolerance
+            )
+        self.is_valid = self.is_covered and self.objective_matches is not False
+        self.stats = stats
+
+    def __bool__(self) -> bool:
+        return self.is_valid
+
+    def __repr__(self) -> str:
+        return (
+            f"VerificationResult(is_valid={self.is_valid}, "
+            f"uncovered_area={self.uncovered_area}, objective={self.objective})"
+        )
+
+
+def _load_distances(
+    instance: Instance, fingerprint: str, cache: typing.Optional[PreprocessingCache]
+) -> GuardDistances:
+    entry = (
+        cache.load(fingerprint, instance.num_positions())
+        if cache is not None
+        else None
+    )
+    guard_distances = GuardDistances(instance, None, engine="rectilinear")
+    if entry is not None:
+        guard_distances.load_distance_matrix(entry["distances"])
+    return guard_distances
+
+
+def verify(
+    instance: Instance,
+    guards: typing.Sequence[int],
+    objective: typing.Optional[float] = None,
+    cache: typing.Optional[PreprocessingCache] = None,
+    tolerance: float = 1e-6,
+    logger: typing.Optional[logging.Logger] = None,
+) -> VerificationResult:
+    """
+    Check that the guards cover the whole polygon and recompute their minimal
+    pairwise geodesic distance. If the claimed `objective` is given, it has to
+    match the recomputed one (up to `tolerance`) as well.
+    """
+    logger = logger if logger else logging.getLogger("verify")
+    guards = sorted({int(g) for g in guards})
+    if any(not 0 <= g < instance.num_positions() for g in guards):
+        msg = "Guard index out of range."
+        raise ValueError(msg)
+    stats: typing.Dict[str, typing.Any] = {"num_guards": len(guards)}
+    # before the geometry is touched, see `Preprocessing`
+    fingerprint = instance.fingerprint()
+
+    stop_watch = StopWatch()
+    with span("verify_coverage", num_guards=len(guards)) as current:
+        polygon = instance.as_cgal_polygon()
+        calculator = VisibilityPolygonCalculator(polygon)
+        visibility_polygons = [
+            PolygonWithHoles(
+                calculator.compute_visibility_polygon(instance.as_cgal_position(g))
+            )
+            for g in guards
+        ]
+        uncovered_regions = subtract_polygons([polygon], visibility_polygons)
+        current.set(num_uncovered_regions=len(uncovered_regions))
+    stats["time_verify_coverage"] = stop_watch.time()
+
+    stop_watch = StopWatch()
+    with span("verify_distances"):
+        if len(guards) < 2:
+            dispersion = math.inf if guards else 0.0
+        else:
+            matrix = _load_distances(instance, fingerprint, cache).distances_between(
+                guards
+            )
+            dispersion = float(matrix[np.triu_indices(len(guards), 1)].min())
+    stats["time_verify_distances"] = stop_watch.time()
+
+    result = VerificationResult(
+        uncovered_regions, dispersion, objective, tolerance, stats
+    )
+    if not result.is_covered:
+        logger.warning(
+            "Guards leave %d regions uncovered (area %f).",
+            len(uncovered_regions),
+            result.uncovered_area,
+        )
+    if result.objective_matches is False:
+        logger.warning(
+            "Claimed objective %f does not match the recomputed %f.",
+            objective,
+            dispersion,
+        )
+    return result
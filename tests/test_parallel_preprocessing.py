@@ -0,0 +1,82 @@
+"""
+The preprocessing with several processes must give the same results as the
+serial one.
+"""
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("rvispoly")
+
+from dispersive_agp_solver.backends import create_optimizer  # noqa: E402
+from dispersive_agp_solver.backends._common.guard_coverage import (  # noqa: E402
+    GuardCoverage,
+    polygon_to_coordinates,
+)
+from dispersive_agp_solver.backends._common.witness_strategy import (  # noqa: E402
+    WitnessStrategy,
+)
+from dispersive_agp_solver.instance import (  # noqa: E402
+    Instance,
+    get_instance_from_graphml_xz,
+)
+
+_INSTANCES = Path(__file__).parent.parent / "evaluation/office_like_instances"
+_INSTANCE_FILES = [
+    _INSTANCES / "instance_collection/with_holes/size_40/general_40_1.graphml.xz",
+    _INSTANCES / "instance_collection/with_holes/size_40/general_40_6.graphml.xz",
+    _INSTANCES / "instance_collection/without_holes/size_40/simple_40_1.graphml.xz",
+]
+
+
+def _u_shape() -> Instance:
+    # the ray from (0, 0) past the inner corner (4, 3) hits the top at x = 16/3
+    positions = [(0, 0), (6, 0), (6, 4), (4, 4), (4, 3), (2, 3), (2, 4), (0, 4)]
+    return Instance(positions, list(range(len(positions))))
+
+
+def _minimal(guard_sets):
+    # the guard sets that do not contain another one, which decide the coverage
+    sets = {frozenset(guards) for _, guards in guard_sets}
+    return {s for s in sets if not any(t < s for t in sets)}
+
+
+def _instances():
+    return [pytest.param(_u_shape(), id="u_shape")] + [
+        pytest.param(get_instance_from_graphml_xz(path), id=path.stem)
+        for path in _INSTANCE_FILES
+    ]
+
+
+@pytest.mark.parametrize("instance", _instances())
+def test_parallel_visibility_polygons_match_serial(instance):
+    serial = GuardCoverage(instance, n_jobs=1)
+    parallel = GuardCoverage(instance, n_jobs=2)
+    for i in range(instance.num_positions()):
+        assert polygon_to_coordinates(
+            parallel.get_visibility_of_guard(i)
+        ) == polygon_to_coordinates(serial.get_visibility_of_guard(i))
+        assert (
+            parallel.guards_visible_from(i).tolist()
+            == serial.guards_visible_from(i).tolist()
+        )
+
+
+@pytest.mark.parametrize("instance", _instances())
+def test_parallel_shadow_witnesses_match_serial(instance):
+    # the slabs can add witnesses, but only with guard sets implied by others
+    coverage = GuardCoverage(instance)
+    serial = WitnessStrategy(instance, coverage).get_shadow_witnesses()
+    parallel = WitnessStrategy(
+        instance, coverage, n_jobs=2, fan_out_depth=2
+    ).get_shadow_witnesses()
+    assert _minimal(parallel) == _minimal(serial)
+
+
+def test_witness_fan_out_depth_is_passed_to_the_preprocessing():
+    optimizer = create_optimizer(
+        _u_shape(), n_jobs=2, witness_fan_out_depth=1, kernelize=False
+    )
+    optimizer.solve(60, 0.0001)
+    assert optimizer.get_stats()["num_witness_slabs"] == 2
@@ -0,0 +1,188 @@
+"""
+The distances of the rectilinear engine must be the geodesic L1 distances. For
+unions of unit squares, these are the shortest paths on the integer lattice
+along unit segments within the (closed) polygon, computed here by BFS.
+"""
+
+import collections
+import random
+import typing
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("rvispoly")
+
+from dispersive_agp_solver.backends._common.guard_coverage import (  # noqa: E402
+    GuardCoverage,
+)
+from dispersive_agp_solver.backends._common.guard_distances import (  # noqa: E402
+    GuardDistances,
+)
+from dispersive_agp_solver.instance import (  # noqa: E402
+    Instance,
+    get_instance_from_graphml_xz,
+)
+
+Cell = typing.Tuple[int, int]
+
+_INSTANCES = Path(__file__).parent.parent / "evaluation/office_like_instances"
+_INSTANCE_FILES = [
+    _INSTANCES / "instance_collection/with_holes/size_40/general_40_1.graphml.xz",
+    _INSTANCES / "instance_collection/with_holes/size_80/general_80_1.graphml.xz",
+    _INSTANCES / "instance_collection/without_holes/size_40/simple_40_1.graphml.xz",
+    _INSTANCES / "instance_collection/without_holes/size_80/simple_80_1.graphml.xz",
+]
+
+
+def _has_pinch(cells: typing.Set[Cell], x: int, y: int) -> bool:
+    a, b = (x, y) in cells, (x + 1, y) in cells
+    c, d = (x, y + 1) in cells, (x + 1, y + 1) in cells
+    return (a and d and not b and not c) or (b and c and not a and not d)
+
+
+def _random_cells(seed: int) -> typing.Set[Cell]:
+    """
+    A random polyomino, possibly with holes, whose boundary is a set of simple
+    cycles (no two cells touch at a corner only).
+    """
+    rnd = random.Random(seed)
+    width, height = rnd.randint(3, 8), rnd.randint(3, 8)
+    while True:
+        cells = {
+            (x, y) for x in range(width) for y in range(height) if rnd.random() < 0.7
+        }
+        # the largest 4-connected component
+        components, rest = [], set(cells)
+        while rest:
+            stack = [rest.pop()]
+            component = set(stack)
+            while stack:
+                x, y = stack.pop()
+                for neighbor in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                    if neighbor in rest:
+                        rest.remove(neighbor)
+                        component.add(neighbor)
+                        stack.append(neighbor)
+            components.append(component)
+        cells = max(components, key=len, default=set())
+        if len(cells) >= 3 and not any(
+            _has_pinch(cells, x, y)
+            for x in range(-1, width)
+            for y in range(-1, height)
+        ):
+            return cells
+
+
+def _instance_from_cells(cells: typing.Set[Cell]) -> Instance:
+    # boundary edges with the interior on the left, chained to cycles
+    successor = {}
+    for x, y in cells:
+        if (x, y - 1) not in cells:
+            successor[(x, y)] = (x + 1, y)
+        if (x + 1, y) not in cells:
+            successor[(x + 1, y)] = (x + 1, y + 1)
+        if (x, y + 1) not in cells:
+            successor[(x + 1, y + 1)] = (x, y + 1)
+        if (x - 1, y) not in cells:
+            successor[(x, y + 1)] = (x, y)
+    cycles, seen = [], set()
+    for start in sorted(successor):
+        if start in seen:
+            continue
+        cycle, p = [], start
+        while p not in seen:
+            seen.add(p)
+            cycle.append(p)
+            p = successor[p]
+        # keep only the corners
+        cycles.append(
+            [
+                p
+                for i, p in enumerate(cycle)
+                if not (
+                    cycle[i - 1][0] == p[0] == cycle[(i + 1) % len(cycle)][0]
+                    or cycle[i - 1][1] == p[1] == cycle[(i + 1) % len(cycle)][1]
+                )
+            ]
+        )
+    positions = [p for cycle in cycles for p in cycle]
+    index = {p: i for i, p in enumerate(positions)}
+    # the outer boundary contains the lowest-leftmost corner
+    outer = min(cycles, key=min)
+    return Instance(
+        positions,
+        [index[p] for p in outer],
+        [[index[p] for p in cycle] for cycle in cycles if cycle is not outer],
+    )
+
+
+def _lattice_distances(cells: typing.Set[Cell], instance: Instance) -> np.ndarray:
+    """
+    BFS on the lattice points with unit steps along segments that border a cell
+    of the polygon.
+    """
+
+    def steps(x: int, y: int):
+        if (x, y) in cells or (x, y - 1) in cells:
+            yield x + 1, y
+        if (x - 1, y) in cells or (x - 1, y - 1) in cells:
+            yield x - 1, y
+        if (x, y) in cells or (x - 1, y) in cells:
+            yield x, y + 1
+        if (x, y - 1) in cells or (x - 1, y - 1) in cells:
+            yield x, y - 1
+
+    n = instance.num_positions()
+    matrix = np.zeros((n, n), dtype=np.int64)
+    for i, source in enumerate(instance.positions):
+        dist = {source: 0}
+        queue = collections.deque([source])
+        while queue:
+            p = queue.popleft()
+            for q in steps(*p):
+                if q not in dist:
+                    dist[q] = dist[p] + 1
+                    queue.append(q)
+        matrix[i] = [dist[p] for p in instance.positions]
+    return matrix
+
+
+def test_lattice_distances_go_around_a_notch():
+    # a 3x3 square with a notch from the top: the inner corners of the notch
+    # are 1 apart in L1, but 5 along the polygon
+    cells = {(x, y) for x in range(3) for y in range(3)} - {(1, 1), (1, 2)}
+    instance = _instance_from_cells(cells)
+    a = instance.positions.index((1, 3))
+    b = instance.positions.index((2, 3))
+    assert _lattice_distances(cells, instance)[a, b] == 5
+    distances = GuardDistances(instance, None, engine="rectilinear")
+    assert distances.distance(a, b) == 5
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_rectilinear_distances_match_lattice_distances(seed):
+    cells = _random_cells(seed)
+    instance = _instance_from_cells(cells)
+    distances = GuardDistances(instance, None, engine="rectilinear")
+    expected = _lattice_distances(cells, instance)
+    np.testing.assert_array_equal(distances.get_distance_matrix(), expected)
+
+
+def _assert_engines_agree(instance: Instance) -> None:
+    visibility = GuardDistances(instance, GuardCoverage(instance), engine="visibility")
+    rectilinear = GuardDistances(instance, None, engine="rectilinear")
+    np.testing.assert_array_equal(
+        rectilinear.get_distance_matrix(), visibility.get_distance_matrix()
+    )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_rectilinear_distances_match_visibility_distances(seed):
+    _assert_engines_agree(_instance_from_cells(_random_cells(seed)))
+
+
+@pytest.mark.parametrize("path", _INSTANCE_FILES, ids=lambda path: path.stem)
+def test_rectilinear_distances_match_visibility_distances_on_office_instances(path):
+    _assert_engines_agree(get_instance_from_graphml_xz(path))
@@ -0,0 +1,68 @@
+"""
+The service API without the HTTP layer, via `SolverService.handle`.
+"""
+
+import time
+
+import pytest
+
+pytest.importorskip("rvispoly")
+pytest.importorskip("pysat")
+
+from dispersive_agp_solver import SolverService, solve  # noqa: E402
+from dispersive_agp_solver.instance import Instance  # noqa: E402
+from dispersive_agp_solver.service import instance_to_json  # noqa: E402
+
+
+@pytest.fixture()
+def service():
+    service = SolverService(max_workers=1)
+    yield service
+    service.shutdown()
+
+
+def _u_shape() -> Instance:
+    # two arms that no single guard can see both of
+    positions = [(0, 0), (6, 0), (6, 4), (4, 4), (4, 2), (2, 2), (2, 4), (0, 4)]
+    return Instance(positions, list(range(len(positions))))
+
+
+def _poll(service: SolverService, job_id: str, timeout: float = 60.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        code, response = service.handle("GET", f"/jobs/{job_id}")
+        assert code == 200
+        if response["status"] not in ("queued", "running"):
+            return response
+        time.sleep(0.05)
+    pytest.fail(f"Job {job_id} did not finish within {timeout}s.")
+
+
+def test_submit_and_poll_job(service):
+    instance = _u_shape()
+    body = {"instance": instance_to_json(instance), "time_limit": 30}
+    code, response = service.handle("POST", "/jobs", body)
+    assert code == 202
+    job = _poll(service, response["job_id"])
+    assert job["status"] == "done"
+    assert job["error"] is None
+    assert job["result"]["optimal"]
+    _, expected = solve(_u_shape(), time_limit=30)
+    assert job["result"]["objective"] == pytest.approx(expected)
+
+    # the second job on the same instance reuses the preprocessing in memory
+    code, response = service.handle("POST", "/jobs", body)
+    assert code == 202
+    assert _poll(service, response["job_id"])["status"] == "done"
+    code, stats = service.handle("GET", "/stats")
+    assert code == 200
+    assert stats["preprocessing_misses"] == 1
+    assert stats["preprocessing_hits"] == 1
+    assert stats["num_instances"] == 1
+
+
+def test_invalid_requests(service):
+    assert service.handle("GET", "/jobs/unknown")[0] == 404
+    assert service.handle("POST", "/jobs", {"instance": {}})[0] == 400
+    body = {"instance": instance_to_json(_u_shape()), "time_limit": -1}
+    assert service.handle("POST", "/jobs", body)[0] == 400